@@ -1,9 +1,12 @@
 from django.contrib import admin
-from .models import Item, Category, Auction, Opinion, Bid
+from .models import Item, Category, Auction, Opinion, Bid, Notification, Counter, MediaBlob
 
 
 admin.site.register(Item)
 admin.site.register(Category)
 admin.site.register(Auction)
 admin.site.register(Opinion)
-admin.site.register(Bid)
\ No newline at end of file
+admin.site.register(Bid)
+admin.site.register(Notification)
+admin.site.register(Counter)
+admin.site.register(MediaBlob)
@@ -1,18 +1,64 @@
+import codecs
+import csv
+import itertools
+import json
+
 from rest_framework import generics, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
 
 from .models import Auction, Opinion, Category, Item
 from .serializers import AuctionSerializer, OpinionSerializer, CategorySerializer, ItemSerializer, UserSerializer
+from .pagination import KeysetAPIPagination
+from .autocomplete import autocomplete
+from .bulk_import import format_of, import_rows, read_rows
+from .bid_series import DEFAULT_POINTS, MAX_POINTS, cached_bid_series, final_bid_series
+from .async_views import AsyncAPIViewMixin, AsyncListModelMixin
 
 
 User = get_user_model()
 
 
-class AuctionView(generics.ListAPIView):
-    """Use generics for better readability"""
-    queryset = Auction.objects.all()
+class QueryFilterMixin:
+    """Filters queryset with URL parameters, 'filter_lookups' maps parameter name to ORM lookup,
+    e.g. {'status': 'status'} turns ?status=sold into .filter(status='sold')"""
+    filter_lookups = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        for param, lookup in self.filter_lookups.items():
+            value = self.request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                queryset = queryset.filter(**{lookup: value})
+            except (ValueError, DjangoValidationError):
+                raise ValidationError({param: 'Invalid value.'})
+        return queryset
+
+
+class AuctionView(AsyncAPIViewMixin, AsyncListModelMixin, QueryFilterMixin, generics.ListAPIView):
+    """Use generics for better readability (add ?cursor= to the URL to use cursor pagination). Async list.
+    Filter with ?status=, ?seller= (user id), ?category= (category name), ?end_date_after= and ?end_date_before="""
+    queryset = Auction.objects.order_by('-end_date', '-id')
     serializer_class = AuctionSerializer
+    pagination_class = KeysetAPIPagination
+    keyset_ordering = ('-end_date', '-id')
+    filter_lookups = {
+        'status': 'status',
+        'seller': 'seller',
+        'category': 'item__category__name',
+        'end_date_after': 'end_date__gte',
+        'end_date_before': 'end_date__lte',
+    }
 
 
 class AuctionDetailView(generics.RetrieveAPIView):
@@ -20,22 +66,97 @@ class AuctionDetailView(generics.RetrieveAPIView):
     serializer_class = AuctionSerializer
 
 
-class UserView(viewsets.ModelViewSet):
-    """Use viewsets to stop reapeating code"""
-    queryset = User.objects.all()
+class UserView(AsyncAPIViewMixin, AsyncListModelMixin, viewsets.ModelViewSet):
+    """Use viewsets to stop reapeating code (list is async, other actions run in worker threads).
+    Emails and phone numbers are private, so every action (export too) is for staff only"""
+    permission_classes = [IsAdminUser]
+    queryset = User.objects.select_related('account').order_by('id')    # phone_number comes from Account
     serializer_class = UserSerializer
+    export_chunk_size = 2000
 
+    @action(detail=False, permission_classes=[IsAdminUser])
+    def export(self, request):
+        """All users as newline delimited JSON, read and serialized in chunks so memory use doesn't grow with the table"""
+        users = self.filter_queryset(self.get_queryset()).iterator(chunk_size=self.export_chunk_size)
 
-class OpinionView(viewsets.ModelViewSet):
-    queryset = Opinion.objects.all()
-    serializer_class = OpinionSerializer
+        def lines():
+            while True:
+                chunk = list(itertools.islice(users, self.export_chunk_size))
+                if not chunk:
+                    return
+                for row in self.get_serializer(chunk, many=True).data:
+                    yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
 
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
 
-class ItemView(viewsets.ModelViewSet):
-    queryset = Item.objects.all()
-    serializer_class = ItemSerializer
+
+class OpinionView(AsyncAPIViewMixin, AsyncListModelMixin, QueryFilterMixin, viewsets.ModelViewSet):
+    queryset = Opinion.objects.order_by('-date_created', 'id')
+    serializer_class = OpinionSerializer
+    filter_lookups = {'auction': 'auction', 'reviewer': 'reviewer'}
 
 
-class CategoryView(viewsets.ModelViewSet):
-    queryset = Category.objects.all()
-    serializer_class = CategorySerializer
\ No newline at end of file
+class ItemView(AsyncAPIViewMixin, AsyncListModelMixin, QueryFilterMixin, viewsets.ModelViewSet):
+    queryset = Item.objects.order_by('name', 'id')
+    serializer_class = ItemSerializer
+    pagination_class = KeysetAPIPagination
+    keyset_ordering = ('name', 'id')
+    filter_lookups = {'category': 'category__name'}
+
+
+class CategoryView(AsyncAPIViewMixin, AsyncListModelMixin, viewsets.ModelViewSet):
+    queryset = Category.objects.order_by('name', 'id')
+    serializer_class = CategorySerializer
+
+
+class BidSeriesView(APIView):
+    """Bids of the auction for price charts, grouped into at most ?points= time buckets (default 100, max 1000)
+    with open, high, last and count of each. Bucket width follows the time span of the bids (auctions/bid_series.py)"""
+
+    def get(self, request, pk):
+        try:
+            points = int(request.query_params.get('points', DEFAULT_POINTS))
+        except ValueError:
+            raise ValidationError({'points': 'Invalid value.'})
+        if not 1 <= points <= MAX_POINTS:
+            raise ValidationError({'points': f'Has to be between 1 and {MAX_POINTS}.'})
+        series = final_bid_series(pk, points)   # Finished auction doesn't need even the status query
+        if series is None:
+            status = Auction.objects.filter(pk=pk).values_list('status', flat=True).first()
+            if status is None:
+                raise NotFound('Auction not found.')
+            series = cached_bid_series(pk, status, points)
+        return Response({'auction': str(pk), **series})
+
+
+class BulkImportView(APIView):
+    """POST CSV (Content-Type: text/csv) or NDJSON (application/x-ndjson) to create items with their auctions,
+    see auctions/bulk_import.py for the columns. Body is read line by line, response lists rejected rows"""
+    permission_classes = [IsAuthenticated]
+    max_errors = 1000
+
+    def post(self, request):
+        format = format_of('', request.content_type)
+        stream = request.stream or []   # None for empty body, request.data is never read (it would load everything)
+        lines = codecs.iterdecode(stream, 'utf-8-sig')
+        try:
+            result = import_rows(read_rows(lines, format), request.user, max_errors=self.max_errors)
+        except (UnicodeDecodeError, csv.Error) as error:
+            raise ValidationError({'detail': f'Unreadable {format.upper()}: {error}'})
+        return Response(result.as_dict())
+
+
+class AutocompleteView(APIView):
+    """Names of items, auctions and categories with a word starting with ?q= (served from memory, no database queries).
+    Use ?limit= to change number of names of each kind (max 20)"""
+    max_limit = 20
+
+    def get(self, request):
+        prefix = request.query_params.get('q', '').strip()
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), self.max_limit)
+        except ValueError:
+            limit = 10
+        if not prefix or limit < 1:
+            return Response({'items': [], 'auctions': [], 'categories': []})
+        return Response(autocomplete.lookup(prefix, limit))
@@ -0,0 +1,190 @@
+"""Async class-based views for the read paths, so a slow query doesn't hold a worker thread under ASGI.
+Django 4.0 has neither async ORM nor async class-based views, so queries run in worker threads (run_query)
+and AsyncViewMixin does what Django 4.1 does for views with 'async def' handlers"""
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers import asgi
+from django.core.paginator import EmptyPage, PageNotAnInteger
+from django.db import connections
+from django.http import Http404
+from rest_framework.response import Response
+
+
+def run_query(function, *args, **kwargs):
+    """Runs function using the database in a worker thread and returns awaitable of its result.
+    With ASYNC_PARALLEL_QUERIES every call can get its own thread (and connection), so queries awaited together
+    run at the same time. Without it they all go to the thread of the request, one by one, like Django's async ORM"""
+    if not settings.ASYNC_PARALLEL_QUERIES:
+        return sync_to_async(function, thread_sensitive=True)(*args, **kwargs)
+
+    def in_thread():
+        try:
+            return function(*args, **kwargs)
+        finally:
+            release_connections()
+    return sync_to_async(in_thread, thread_sensitive=False)()
+
+
+def release_connections():
+    """Connections of worker threads stay open for the next query in the same thread (there are at most as many
+    as threads), unless they are broken, older than CONN_MAX_AGE (if it is set) or taken from a pool"""
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        if getattr(connection, 'pool_size', 0):
+            connection.close()  # Back to the pool
+        elif connection.settings_dict['CONN_MAX_AGE']:
+            connection.close_if_unusable_or_obsolete()
+        elif connection.errors_occurred and not connection.is_usable():
+            connection.close()
+
+
+async def maybe_await(result):
+    if asyncio.iscoroutine(result):
+        return await result
+    return result
+
+
+async def load_page(paginator, number):
+    """Paginator.page() which counts objects and reads rows of the page at the same time
+    (the page is read with 'orphans' extra rows, so it doesn't depend on the count). Raises InvalidPage as page() does"""
+    try:
+        if isinstance(number, float) and not number.is_integer():
+            raise ValueError
+        number = int(number)
+    except (TypeError, ValueError):
+        raise PageNotAnInteger('That page number is not an integer')
+    if number < 1:
+        raise EmptyPage('That page number is less than 1')
+    bottom = (number - 1) * paginator.per_page
+    rows_to_read = paginator.per_page + paginator.orphans
+    queryset = paginator.object_list
+    count, rows = await asyncio.gather(
+        run_query(queryset.count),
+        run_query(lambda: list(queryset[bottom:bottom + rows_to_read])))
+    paginator.count = count     # cached_property, so num_pages and validate_number() don't count again
+    paginator.validate_number(number)
+    if bottom + rows_to_read < count:   # Orphans belong to the next page
+        rows = rows[:paginator.per_page]
+    return paginator._get_page(rows, number, paginator)
+
+
+async def load_page_or_last(paginator, number):
+    """Paginator.get_page() version of load_page(): invalid number shows the first page, too big the last one"""
+    try:
+        return await load_page(paginator, number)
+    except PageNotAnInteger:
+        return await load_page(paginator, 1)
+    except EmptyPage:
+        return await run_query(lambda: paginator.page(paginator.num_pages))
+
+
+class AsyncViewMixin:
+    """Makes as_view() return a coroutine function, so Django runs the view in the event loop
+    instead of the thread shared by synchronous views"""
+    view_is_async = True
+
+    @classmethod
+    def as_view(cls, *args, **initkwargs):
+        view = super().as_view(*args, **initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            # Handlers not defined with 'async def' (e.g. options()) return response right away
+            return await maybe_await(view(request, *args, **kwargs))
+        functools.update_wrapper(async_view, view)  # Keeps view_class, csrf_exempt etc.
+        return async_view
+
+
+class AsyncListMixin(AsyncViewMixin):
+    """Async get() of ListView, one page of objects is loaded before rendering with load_page()"""
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = self.get_queryset()
+        page_size = self.get_paginate_by(self.object_list)
+        self.pagination = await self.paginate_queryset_async(self.object_list, page_size) if page_size else None
+        return self.render_to_response(self.get_context_data())
+
+    async def paginate_queryset_async(self, queryset, page_size):
+        """Async MultipleObjectMixin.paginate_queryset(), returns (paginator, page, object_list, is_paginated)"""
+        if 'cursor' in self.request.GET:    # KeysetPaginationMixin reads its page with one query anyway
+            return await run_query(super().paginate_queryset, queryset, page_size)
+        paginator = self.get_paginator(
+            queryset, page_size, orphans=self.get_paginate_orphans(),
+            allow_empty_first_page=self.get_allow_empty())
+        page_number = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+        try:
+            if page_number == 'last':
+                page = await run_query(lambda: paginator.page(paginator.num_pages))
+            else:
+                page = await load_page(paginator, page_number)
+        except (EmptyPage, PageNotAnInteger) as error:
+            raise Http404(f'Invalid page ({page_number}): {error}')
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.pagination  # Loaded by get()
+
+
+class AsyncAPIViewMixin(AsyncViewMixin):
+    """DRF views with 'async def' handlers (DRF 3.14 calls handlers synchronously). Authentication, permissions
+    and throttling, as well as handlers which are not async, run in worker threads"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Async copy of APIView.dispatch()"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await run_query(self.initial, request, *args, **kwargs)
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+            if asyncio.iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:   # e.g. get() of ListAPIView may return coroutine of async list()
+                response = await maybe_await(await run_query(handler, request, *args, **kwargs))
+        except Exception as error:
+            response = self.handle_exception(error)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncListModelMixin:
+    """Async ListModelMixin.list(), page is loaded with paginate_queryset_async() of the pagination class"""
+
+    async def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = None
+        if self.paginator is not None:
+            page = await self.paginator.paginate_queryset_async(queryset, request, view=self)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(await run_query(lambda: serializer.data))
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(await run_query(lambda: serializer.data))
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """Django 4.0 iterates streaming responses in the event loop, where generators reading the database
+    (auctions.exports) raise SynchronousOnlyOperation. This handler reads every part in the thread of sync views"""
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [(header.encode('ascii'), value.encode('latin1')) for header, value in response.items()]
+        headers += [(b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+                    for cookie in response.cookies.values()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        while (part := await next_part(parts, None)) is not None:
+            for chunk, _ in self.chunk_bytes(part):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
@@ -0,0 +1,152 @@
+import bisect
+import re
+import threading
+import time
+
+from django.db import connection, transaction
+
+from .search import KIND_MODELS, kind_of
+
+
+RESULT_NAMES = {'item': 'items', 'auction': 'auctions', 'category': 'categories'}
+
+
+class PrefixIndex:
+    """Sorted list of (lowercase name from the start of every word, name, id), so names containing
+    a word starting with the prefix are one binary search away"""
+    def __init__(self, rows=()):
+        self.names = dict(rows)    # id -> name
+        self.entries = sorted(
+            (key, name, pk) for pk, name in self.names.items() for key in self.keys(name))
+
+    @staticmethod
+    def keys(name):
+        lowered = name.lower()
+        return {lowered[match.start():] for match in re.finditer(r'\w+', lowered)}
+
+    def add(self, pk, name):
+        self.remove(pk)
+        self.names[pk] = name
+        for key in self.keys(name):
+            bisect.insort(self.entries, (key, name, pk))
+
+    def remove(self, pk):
+        name = self.names.pop(pk, None)
+        if name is None:
+            return
+        for key in self.keys(name):
+            position = bisect.bisect_left(self.entries, (key, name, pk))
+            if position < len(self.entries) and self.entries[position] == (key, name, pk):
+                del self.entries[position]
+
+    def lookup(self, prefix, limit):
+        """Returns up to 'limit' (id, name) pairs ordered by the matching word"""
+        prefix = prefix.lower()
+        position = bisect.bisect_left(self.entries, (prefix,))
+        results = []
+        seen = set()
+        while position < len(self.entries) and len(results) < limit:
+            key, name, pk = self.entries[position]
+            if not key.startswith(prefix):
+                break
+            if pk not in seen:
+                seen.add(pk)
+                results.append((pk, name))
+            position += 1
+        return results
+
+
+class Autocomplete:
+    """In-process prefix indexes of item, auction and category names. Loaded from the database on first use,
+    then updated by signals once their transaction commits. Changes made by other processes are picked up by
+    reloading every 'max_age' seconds in a background thread, requests meanwhile use the old indexes"""
+    max_age = 300
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = None
+        self.loaded_at = 0
+        self.refresher = None   # Thread reloading the indexes
+        self.pending = None     # Changes made while it reads the database, [(kind, pk, name or None)]
+
+    def clear(self):
+        with self.lock:
+            self.indexes = None
+
+    def expire(self):
+        """Reloads the indexes in the background on next use (e.g. after bulk changes without signals)"""
+        self.loaded_at = -self.max_age
+
+    def read(self):
+        return {
+            kind: PrefixIndex((str(pk), name) for pk, name in model.objects.values_list('pk', 'name').iterator())
+            for kind, model in KIND_MODELS.items()
+        }
+
+    def load(self):
+        indexes = self.read()
+        with self.lock:
+            self.indexes = indexes
+            self.loaded_at = time.monotonic()
+
+    def refresh(self):
+        """Reads the indexes again, changes signalled while reading are applied on top of them"""
+        try:
+            indexes = self.read()
+            with self.lock:
+                for kind, pk, name in self.pending:
+                    if name is None:
+                        indexes[kind].remove(pk)
+                    else:
+                        indexes[kind].add(pk, name)
+                self.indexes = indexes
+                self.loaded_at = time.monotonic()
+        finally:
+            with self.lock:
+                self.pending = None
+                self.refresher = None
+            connection.close()      # Connection of this thread
+
+    def get_indexes(self):
+        if self.indexes is None:
+            self.load()     # Nothing to serve yet
+        elif time.monotonic() - self.loaded_at > self.max_age:
+            with self.lock:
+                if self.refresher is None:
+                    self.pending = []
+                    self.refresher = threading.Thread(target=self.refresh, daemon=True)
+                    self.refresher.start()
+        return self.indexes
+
+    def change(self, kind, pk, name):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.append((kind, pk, name))
+            if self.indexes is None:    # Not loaded yet, load() will read the change from the database
+                return
+            if name is None:
+                self.indexes[kind].remove(pk)
+            else:
+                self.indexes[kind].add(pk, name)
+
+    def update(self, instance):
+        """Adds or renames the instance once the current transaction commits (right away outside of a transaction)"""
+        kind, pk, name = kind_of(instance), str(instance.pk), instance.name
+        transaction.on_commit(lambda: self.change(kind, pk, name))
+
+    def remove(self, instance):
+        """Removes the instance once the current transaction commits, call it before the instance loses its pk"""
+        kind, pk = kind_of(instance), str(instance.pk)
+        transaction.on_commit(lambda: self.change(kind, pk, None))
+
+    def lookup(self, prefix, limit=10):
+        """Returns {'items': [...], 'auctions': [...], 'categories': [...]} with up to 'limit' names of each kind"""
+        indexes = self.get_indexes()
+        with self.lock:
+            return {
+                RESULT_NAMES[kind]: [{'id': pk, 'name': name} for pk, name in index.lookup(prefix, limit)]
+                for kind, index in indexes.items()
+            }
+
+
+autocomplete = Autocomplete()
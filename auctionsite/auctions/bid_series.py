@@ -0,0 +1,107 @@
+"""Price chart data of an auction: bids grouped into time buckets (open, high, last and count of each bucket).
+Buckets are counted by the database with GROUP BY, so the response has at most 'points' buckets however many
+bids the auction has. Series of finished auctions never change and are cached without timeout"""
+from django.conf import settings
+from django.db.models import Count, FloatField, Func, IntegerField, Max, Min
+
+from .models import Bid
+from .page_cache import get_cache, get_versions
+
+DEFAULT_POINTS = 100
+MAX_POINTS = 1000
+# Bucket widths in seconds, the narrowest one giving at most 'points' buckets is used
+WIDTHS = (
+    1, 2, 5, 10, 15, 30,
+    60, 2 * 60, 5 * 60, 10 * 60, 15 * 60, 30 * 60,
+    3600, 2 * 3600, 3 * 3600, 6 * 3600, 12 * 3600,
+    86400, 2 * 86400, 7 * 86400, 14 * 86400, 30 * 86400, 90 * 86400, 365 * 86400,
+)
+FINISHED = ('sold', 'expired')
+
+
+class Epoch(Func):
+    """Seconds since 1970 of a datetime column"""
+    output_field = FloatField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='EXTRACT(EPOCH FROM %(expressions)s)', **extra_context)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # '%%%%s' ends up as '%s' after both the template and the backend's placeholder formatting
+        return super().as_sql(compiler, connection, template="CAST(strftime('%%%%s', %(expressions)s) AS REAL)",
+                              **extra_context)
+
+
+class Bucket(Func):
+    """Number of the 'width' seconds long bucket a datetime column falls into, buckets start at 1970"""
+    template = 'FLOOR(%(expressions)s / %(width)s)'
+    output_field = IntegerField()
+
+    def __init__(self, expression, width):
+        super().__init__(Epoch(expression), width=int(width))
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Epoch seconds are never negative here, so integer division is the floor (FLOOR is a Python function on SQLite)
+        return super().as_sql(compiler, connection, template='CAST(%(expressions)s AS INTEGER) / %(width)s',
+                              **extra_context)
+
+
+def bucket_width(first, last, points):
+    """Narrowest width from WIDTHS (or a multiple of the widest) with at most 'points' buckets between the
+    epoch seconds 'first' and 'last'"""
+    for width in WIDTHS:
+        if last // width - first // width + 1 <= points:
+            return width
+    width = WIDTHS[-1]
+    return width * -(-(last // width - first // width + 1) // points)
+
+
+def bid_series(auction_id, points=DEFAULT_POINTS):
+    """{'bucket_seconds': width, 'time': [bucket start], 'open': [...], 'high': [...], 'last': [...], 'count': [...]}
+    of buckets with bids, amounts as strings. Three queries whatever the number of bids"""
+    bids = Bid.objects.filter(auction=auction_id).order_by()
+    span = bids.aggregate(first=Min(Epoch('time')), last=Max(Epoch('time')))
+    series = {'bucket_seconds': None, 'time': [], 'open': [], 'high': [], 'last': [], 'count': []}
+    if span['first'] is None:
+        return series
+    width = bucket_width(int(span['first']), int(span['last']), points)
+    buckets = list(bids.annotate(bucket=Bucket('time', width)).values('bucket').annotate(
+        first_id=Min('id'), last_id=Max('id'), high=Max('amount'), count=Count('id')).order_by('bucket'))
+    # Ids grow with bid time, so the first and the last bid of a bucket are found by id (at most 2 * points rows)
+    amounts = dict(Bid.objects.filter(
+        pk__in=[bucket[name] for bucket in buckets for name in ('first_id', 'last_id')]).values_list('pk', 'amount'))
+    series['bucket_seconds'] = width
+    for bucket in buckets:
+        series['time'].append(int(bucket['bucket']) * width)
+        series['open'].append(str(amounts[bucket['first_id']]))
+        series['high'].append(str(bucket['high']))
+        series['last'].append(str(amounts[bucket['last_id']]))
+        series['count'].append(bucket['count'])
+    return series
+
+
+def final_key(auction_id, points):
+    return f'bid-series:final:{auction_id}:{points}'
+
+
+def final_bid_series(auction_id, points=DEFAULT_POINTS):
+    """Cached series of a finished auction or None, without reading the auction"""
+    if not settings.PAGE_CACHE_ENABLED:
+        return None
+    return get_cache().get(final_key(auction_id, points))
+
+
+def cached_bid_series(auction_id, status, points=DEFAULT_POINTS):
+    """bid_series() cached forever for finished auctions, under the auction's version (changed by every bid) otherwise"""
+    if not settings.PAGE_CACHE_ENABLED:
+        return bid_series(auction_id, points)
+    if status in FINISHED:
+        key, timeout = final_key(auction_id, points), None
+    else:
+        version = '-'.join(get_versions([('auction', auction_id)]))
+        key, timeout = f'bid-series:{auction_id}:{points}:{version}', settings.PAGE_CACHE_TIMEOUT
+    series = get_cache().get(key)
+    if series is None:
+        series = bid_series(auction_id, points)
+        get_cache().set(key, series, timeout)
+    return series
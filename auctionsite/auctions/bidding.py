@@ -0,0 +1,201 @@
+from django.conf import settings
+from django.db.models import Case, When, F, Q, ExpressionWrapper, DateTimeField, OuterRef, Subquery, Count
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .db_backends import write_transaction
+from .models import Auction, Bid, ProxyBid
+from .notifications import notify_outbid
+from . import live, page_cache
+
+
+EXTENSION = timezone.timedelta(minutes=20)   # Bid placed less than 20 minutes before the end extends the auction
+
+
+class BidRejected(Exception):
+    """Raised when bid cannot be accepted, message is shown to the user"""
+
+
+def check_bid(auction, user, amount):
+    """Raises BidRejected if user cannot bid given amount on the auction"""
+    if auction.buyer_id == user.id:
+        raise BidRejected('You cannot bid because last person who bids is you!')
+    if auction.seller_id == user.id:
+        raise BidRejected('You cannot bid on your own auction!')
+    if auction.status == 'expired' or auction.status == 'sold' or auction.end_date <= timezone.now():
+        raise BidRejected('Bid on expired or sold auctions is not allowed!')
+    if auction.min_price >= amount:
+        raise BidRejected('New price cannot be equal or less than minimum price!')
+
+
+def proxy_bids(price, leader, challengers, increment):
+    """Bids proxies place against each other, returns [(bidder, amount)] with the new leader last.
+    'leader' is (bidder, max amount, created) of whoever holds 'price' (None before the first bid), the maximum is
+    the price itself without a proxy. 'challengers' are the same of other proxies which can beat the price,
+    strongest first. The earlier maximum wins a tie. Only the two strongest matter, so thousands of proxies end in
+    at most two bids, the runner-up's at its maximum and the winner's just above it. In a tie the winner bids the
+    maximum and the runner-up one increment less, the winning bid is always the highest one"""
+    if not challengers:
+        return []
+    ranked = sorted(([leader] if leader is not None else []) + challengers[:2], key=lambda party: (-party[1], party[2]))
+    best, best_max, _ = ranked[0]
+    runner, runner_max, _ = ranked[1] if len(ranked) > 1 else (None, price, None)
+    amount = min(best_max, runner_max + increment)
+    runner_amount = runner_max if runner_max < amount else amount - increment
+    bids = [(runner, runner_amount)] if runner is not None and runner_amount > price else []
+    return bids + [(best, amount)]
+
+
+def lock_auction(auction_id):
+    """Row lock serializing bids and proxy changes of the auction (SQLite write transactions lock the database)"""
+    list(Auction.objects.select_for_update().filter(pk=auction_id).values_list('pk'))
+
+
+def defender(auction_id, user, amount, since):
+    """(user, max amount, created) of the user holding 'amount', their proxy if its maximum is at least as high,
+    otherwise the amount itself bid at 'since'"""
+    proxy = ProxyBid.objects.filter(auction=auction_id, bidder=user.pk, max_amount__gte=amount).values_list(
+        'max_amount', 'created').first()
+    return (user, *proxy) if proxy else (user, amount, since)
+
+
+def challengers(auction_id, leader, price):
+    """Two strongest proxies of others which can beat the price, as (bidder, max amount, created). A maximum equal
+    to the price beats it when it is older than the leader's"""
+    proxies = ProxyBid.objects.filter(auction=auction_id, max_amount__gt=price)
+    if leader is not None:
+        bidder, _, since = leader
+        proxies = ProxyBid.objects.filter(Q(max_amount__gt=price) | Q(max_amount=price, created__lt=since),
+                                          auction=auction_id).exclude(bidder=bidder)
+    return [(proxy.bidder, proxy.max_amount, proxy.created)
+            for proxy in proxies.select_related('bidder').order_by('-max_amount', 'created')[:2]]
+
+
+def accept_bids(auction, bids, now):
+    """Writes [(bidder, amount)] bids (last one leads) with one conditional UPDATE of the auction, which succeeds only
+    if price, buyer and status are still the same as when they were checked and the auction hasn't ended
+    (the scheduler closes ended auctions up to a minute late). Returns Bid rows or None"""
+    leader, price = bids[-1]
+    updated = Auction.objects.filter(
+        pk=auction.pk,
+        status='available',
+        end_date__gt=now,
+        min_price=auction.min_price,
+        buyer=auction.buyer_id,
+    ).update(
+        min_price=price,
+        buyer=leader,
+        bid_count=F('bid_count') + len(bids),
+        end_date=Case(
+            When(end_date__lt=now + EXTENSION,
+                 then=ExpressionWrapper(F('end_date') + EXTENSION, output_field=DateTimeField())),
+            default=F('end_date'),
+        ),
+    )
+    if not updated:
+        return None
+    rows = [Bid.objects.create(amount=amount, auction_id=auction.pk, bidder=bidder) for bidder, amount in bids]
+    Auction.objects.filter(pk=auction.pk).update(highest_bid=rows[-1], last_bid_at=rows[-1].time)
+    end_date = auction.end_date + EXTENSION if auction.end_date < now + EXTENSION else auction.end_date
+    live.publish_bid(rows[-1], auction, end_date, new_bids=len(rows))
+    return rows
+
+
+def outcome(auction, rows, user, amount):
+    """(last bid of the user, previous buyer if they lost the lead), bid.leading tells if the user leads now.
+    The bid isn't saved (no pk) when an earlier equal maximum took 'amount' and the user has no row.
+    Outbid notifications go to the outbox in the transaction of the bids, to everyone who doesn't lead after them:
+    the previous buyer, a proxy which bid its maximum and the user when a stronger (or earlier equal) maximum
+    answered right away"""
+    leader = rows[-1].bidder
+    own = [row for row in rows if row.bidder == user]
+    bid = own[-1] if own else Bid(amount=amount, auction_id=auction.pk, bidder=user)
+    bid.leading = leader == user
+    previous_buyer = auction.buyer if auction.buyer is not None and auction.buyer != leader else None
+    outbid = {}
+    for bidder in [previous_buyer, user, *(row.bidder for row in rows)]:
+        if bidder is not None and bidder != leader:
+            outbid.setdefault(bidder.pk, bidder)
+    for bidder in outbid.values():
+        notify_outbid(auction, bidder, rows[-1].amount)
+    return bid, previous_buyer
+
+
+def place_bid(auction_id, user, amount, retries=10):
+    """Accepts the bid atomically and returns (bid, previous_buyer), outbid bidders are already notified.
+    Proxies of other bidders answer in the same transaction (see proxy_bids), so the bid can be outbid right away,
+    bid.leading tells. Auction is changed with a conditional UPDATE (accept_bids), if another bid won the race
+    the auction is read again and the bid is checked against the new price"""
+    for _ in range(retries):
+        auction = Auction.objects.select_related('buyer').get(pk=auction_id)
+        check_bid(auction, user, amount)
+        now = timezone.now()
+        with write_transaction():    # BEGIN IMMEDIATE on tuned SQLite
+            lock_auction(auction.pk)
+            leader = defender(auction.pk, user, amount, now)
+            answers = proxy_bids(amount, leader, challengers(auction.pk, leader, amount), settings.BID_INCREMENT)
+            # An earlier maximum equal to the bid takes the amount itself, two equal bids would leave the lead unclear
+            bids = answers if answers and answers[-1][1] <= amount else [(user, amount)] + answers
+            rows = accept_bids(auction, bids, now)
+            if rows:
+                return outcome(auction, rows, user, amount)
+    raise BidRejected('Auction is very busy right now, please try again!')
+
+
+def check_proxy_bid(auction, user, max_amount):
+    """Raises BidRejected if user cannot set given maximum on the auction"""
+    if auction.seller_id == user.id:
+        raise BidRejected('You cannot bid on your own auction!')
+    if auction.status == 'expired' or auction.status == 'sold' or auction.end_date <= timezone.now():
+        raise BidRejected('Bid on expired or sold auctions is not allowed!')
+    if auction.min_price >= max_amount:
+        raise BidRejected('Maximum cannot be equal or less than current price!')
+
+
+def place_proxy_bid(auction_id, user, max_amount, retries=10):
+    """Sets (or changes) user's hidden maximum and lets all proxies bid against each other in one transaction.
+    Returns (bid, previous_buyer) like place_bid, bid is None when the user already leads (only the maximum changes)"""
+    for _ in range(retries):
+        auction = Auction.objects.select_related('buyer').get(pk=auction_id)
+        check_proxy_bid(auction, user, max_amount)
+        now = timezone.now()
+        with write_transaction():
+            lock_auction(auction.pk)
+            if not Auction.objects.filter(pk=auction.pk, min_price=auction.min_price, buyer=auction.buyer_id).exists():
+                continue    # Outbid since it was checked
+            ProxyBid.objects.update_or_create(
+                auction_id=auction.pk, bidder=user, defaults={'max_amount': max_amount, 'created': now})
+            if auction.buyer_id == user.id:
+                return None, None
+            price = auction.min_price
+            leader = defender(auction.pk, auction.buyer, price, auction.last_bid_at or now) if auction.buyer else None
+            bids = proxy_bids(price, leader, challengers(auction.pk, leader, price), settings.BID_INCREMENT)
+            rows = accept_bids(auction, bids, now)
+            if rows:
+                return outcome(auction, rows, user, max_amount)
+    raise BidRejected('Auction is very busy right now, please try again!')
+
+
+def bid_stats(bid_model=Bid):
+    """Expressions counting bid_count, highest_bid and last_bid_at of an auction from its bids"""
+    bids = bid_model.objects.filter(auction=OuterRef('pk'))
+    return {
+        'bid_count': Coalesce(Subquery(bids.order_by().values('auction').annotate(count=Count('id')).values('count')), 0),
+        'highest_bid': Subquery(bids.order_by('-amount', '-id').values('id')[:1]),
+        'last_bid_at': Subquery(bids.order_by('-time', '-id').values('time')[:1]),
+    }
+
+
+def rebuild_bid_stats():
+    """Recounts bid columns of every auction with one UPDATE, returns number of auctions"""
+    updated = Auction.objects.update(**bid_stats())
+    page_cache.bump('auction')
+    return updated
+
+
+def inconsistent_bid_stats():
+    """Returns ids of auctions whose bid columns don't match their bids"""
+    stats = bid_stats()
+    rows = Auction.objects.annotate(**{f'real_{name}': value for name, value in stats.items()}).values_list(
+        'pk', 'bid_count', 'highest_bid', 'last_bid_at', 'real_bid_count', 'real_highest_bid', 'real_last_bid_at')
+    return [row[0] for row in rows.iterator() if row[1:4] != row[4:]]
@@ -0,0 +1,144 @@
+"""Bulk import of items with their auctions from CSV or newline delimited JSON.
+Every row creates one item and one auction of the seller, columns (keys) are:
+name, item_name, item_description, category (name of existing category), min_price, buy_now_price (optional)
+and end_date (ISO 8601, e.g. 2030-01-31T12:00:00+01:00).
+Rows are read one at a time and saved with bulk_create, one transaction per chunk, so memory use doesn't depend
+on the size of the input. Broken rows are reported and skipped, other rows are imported"""
+import csv
+import json
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import reset_queries, transaction
+from django.utils import timezone
+
+from .autocomplete import autocomplete
+from .forms import auction_errors
+from .models import Auction, Category, Item
+from . import counters, page_cache, search
+
+
+FORMATS = ('csv', 'ndjson')
+# Form fields are only used to convert and validate values, one instance serves all rows
+FIELDS = {
+    'name': forms.CharField(max_length=Auction._meta.get_field('name').max_length),
+    'item_name': forms.CharField(max_length=Item._meta.get_field('name').max_length),
+    'item_description': forms.CharField(),
+    'category': forms.CharField(),
+    'min_price': forms.DecimalField(max_digits=10, decimal_places=2, min_value=0),
+    'buy_now_price': forms.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False),
+    'end_date': forms.DateTimeField(),
+}
+
+
+def read_rows(lines, format):
+    """Yields (row number, dict) from lines of text, row number counts data rows from 1"""
+    if format == 'csv':
+        for number, row in enumerate(csv.DictReader(lines), start=1):
+            yield number, row
+        return
+    number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield number, row if isinstance(row, dict) else {'__all__': line}
+
+
+def format_of(filename, content_type=''):
+    """Guesses format from file extension or content type, CSV by default"""
+    if filename.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'jsonl' in content_type:
+        return 'ndjson'
+    return 'csv'
+
+
+def clean_row(row, categories, now):
+    """Returns (cleaned values, None) or (None, {field: [messages]})"""
+    if '__all__' in row:
+        return None, {'__all__': ['Row is not a JSON object']}
+    cleaned = {}
+    errors = {}
+    for name, field in FIELDS.items():
+        value = row.get(name)
+        try:
+            cleaned[name] = field.clean(value if value is None else str(value).strip())
+        except ValidationError as error:
+            errors[name] = error.messages
+    if 'category' in cleaned and cleaned['category'] not in categories:
+        errors['category'] = [f"Category '{cleaned['category']}' does not exist"]
+    if errors:
+        return None, errors
+    errors = auction_errors(cleaned['min_price'], cleaned['buy_now_price'], cleaned['end_date'], now)
+    if errors:
+        return None, {field: [message] for field, message in errors.items()}
+    return cleaned, None
+
+
+class ImportResult:
+    def __init__(self, max_errors):
+        self.imported = 0
+        self.failed = 0
+        self.errors = []    # Only first 'max_errors' are kept, the rest is counted
+        self.max_errors = max_errors
+
+    def add_error(self, number, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': number, 'errors': errors})
+
+    def as_dict(self):
+        return {'imported': self.imported, 'failed': self.failed, 'errors': self.errors}
+
+
+def save_chunk(chunk, seller, batch_size):
+    """Saves items and auctions of cleaned rows in one transaction, with the work their signals would do"""
+    items = []
+    auctions = []
+    for values, category_id in chunk:
+        item = Item(name=values['item_name'], description=values['item_description'],
+                    category_id=category_id, creator=seller)
+        items.append(item)
+        auctions.append(Auction(
+            name=values['name'], item=item, min_price=values['min_price'],
+            buy_now_price=values['buy_now_price'], end_date=values['end_date'], seller=seller))
+    with transaction.atomic():
+        Item.objects.bulk_create(items, batch_size=batch_size)
+        Auction.objects.bulk_create(auctions, batch_size=batch_size)
+        search.index_new_objects(items)
+        search.index_new_objects(auctions)
+        counters.increment({'auctions': len(auctions), 'auctions_available': len(auctions)})
+
+
+def import_rows(rows, seller, batch_size=1000, chunk_size=10000, max_errors=1000, on_error=None):
+    """Imports (row number, dict) pairs from read_rows() as items and auctions of the seller.
+    Rows are inserted with bulk_create in batches of 'batch_size', every 'chunk_size' rows are one transaction.
+    on_error(row number, {field: [messages]}) is called for every rejected row. Returns ImportResult"""
+    result = ImportResult(max_errors)
+    categories = dict(Category.objects.values_list('name', 'pk'))
+    now = timezone.now()
+    chunk = []
+    for number, row in rows:
+        values, errors = clean_row(row, categories, now)
+        if errors:
+            result.add_error(number, errors)
+            if on_error:
+                on_error(number, errors)
+            continue
+        chunk.append((values, categories[values['category']]))
+        if len(chunk) == chunk_size:
+            save_chunk(chunk, seller, batch_size)
+            result.imported += len(chunk)
+            chunk = []
+            reset_queries()     # With DEBUG every INSERT with all its values would stay in connection.queries
+    if chunk:
+        save_chunk(chunk, seller, batch_size)
+        result.imported += len(chunk)
+    if result.imported:    # bulk_create doesn't send signals
+        page_cache.bump('item')
+        page_cache.bump('auction')
+        autocomplete.expire()   # Reloaded in the background, cheaper than inserting every name
+    return result
@@ -0,0 +1,80 @@
+import threading
+import time
+
+from django.contrib.auth import get_user_model
+from django.db.models import F
+
+from .models import Auction, Bid, Counter
+
+
+User = get_user_model()
+
+# How to count every counter from scratch. Users and auctions are kept exact by signals (and by the scheduler
+# for bulk status changes), active bidders (users with a bid on an available auction) only by reconcile()
+COUNTERS = {
+    'users': lambda: User.objects.count(),
+    'auctions': lambda: Auction.objects.count(),
+    'auctions_available': lambda: Auction.objects.filter(status='available').count(),
+    'auctions_expired': lambda: Auction.objects.filter(status='expired').count(),
+    'auctions_sold': lambda: Auction.objects.filter(status='sold').count(),
+    'active_bidders': lambda: Bid.objects.filter(auction__status='available').values('bidder').distinct().count(),
+}
+
+
+class CounterCache:
+    """Values of all counters kept in process memory, read from the database at most once per 'ttl' seconds"""
+    ttl = 30
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = None
+        self.loaded_at = 0
+
+    def clear(self):
+        with self.lock:
+            self.values = None
+
+    def get(self):
+        with self.lock:
+            if self.values is not None and time.monotonic() - self.loaded_at < self.ttl:
+                return self.values
+        values = dict.fromkeys(COUNTERS, 0)
+        values.update(Counter.objects.values_list('name', 'value'))
+        with self.lock:
+            self.values = values
+            self.loaded_at = time.monotonic()
+        return values
+
+
+counter_cache = CounterCache()
+
+
+def get_counters():
+    """Returns {'users': ..., 'auctions': ..., 'auctions_available': ..., ...} without counting any table"""
+    return counter_cache.get()
+
+
+def increment(changes):
+    """Adds deltas to counters, e.g. {'users': 1, 'auctions': -1}"""
+    for name, delta in changes.items():
+        if delta and not Counter.objects.filter(name=name).update(value=F('value') + delta):
+            Counter.objects.get_or_create(name=name, defaults={'value': COUNTERS[name]()})   # Missing row, count it once
+    counter_cache.clear()
+
+
+def reconcile():
+    """Counts every counter from scratch and stores it (fixes drift after bulk changes which don't send signals)"""
+    values = {name: count() for name, count in COUNTERS.items()}
+    for name, value in values.items():
+        Counter.objects.update_or_create(name=name, defaults={'value': value})
+    counter_cache.clear()
+    return values
+
+
+def run_reconciler(interval=300, stdout=None):
+    """Long-running loop which reconciles counters every 'interval' seconds"""
+    while True:
+        values = reconcile()
+        if stdout:
+            stdout.write(', '.join(f'{name}: {value}' for name, value in values.items()))
+        time.sleep(interval)
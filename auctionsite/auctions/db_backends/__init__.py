@@ -0,0 +1,22 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def write_transaction(using=None):
+    """transaction.atomic() for code that is going to write. On tuned SQLite (auctions.db_backends.sqlite3)
+    the outermost block starts with BEGIN IMMEDIATE, so it takes the write lock up front and waits for it
+    instead of failing with "database is locked" when its read lock can't be upgraded. Plain atomic() elsewhere"""
+    connection = transaction.get_connection(using)
+    immediate = hasattr(connection, 'immediate_transaction') and not connection.in_atomic_block
+    if immediate:
+        connection.immediate_transaction = True
+    try:
+        with transaction.atomic(using):
+            if immediate:
+                connection.immediate_transaction = False    # Only the BEGIN of this block
+            yield
+    finally:
+        if immediate:
+            connection.immediate_transaction = False
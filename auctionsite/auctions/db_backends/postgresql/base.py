@@ -0,0 +1,111 @@
+"""PostgreSQL backend with two additions for production (ENGINE = 'auctions.db_backends.postgresql'):
+
+- CONN_HEALTH_CHECKS: persistent connection (CONN_MAX_AGE) is checked with a cheap query before it is reused
+  by a new request, so a connection killed by a database restart doesn't fail the request (backport of Django 4.1)
+- POOL_SIZE: connections are taken from a process-wide pool shared by all threads and returned to it when
+  Django closes them, so a worker opens at most POOL_SIZE connections and requests don't pay for connecting
+  (use it with CONN_MAX_AGE = 0, a request then holds a connection only while it runs).
+  POOL_TIMEOUT is the number of seconds to wait for a free connection
+"""
+import threading
+
+import psycopg2.extras
+from psycopg2.pool import ThreadedConnectionPool, PoolError
+from django.db.backends.postgresql import base
+
+
+class BlockingPool(ThreadedConnectionPool):
+    """ThreadedConnectionPool which waits for a free connection instead of raising PoolError right away"""
+
+    def __init__(self, size, timeout, **conn_params):
+        self.slots = threading.BoundedSemaphore(size)
+        self.timeout = timeout
+        super().__init__(0, size, **conn_params)
+
+    def getconn(self, key=None):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise PoolError(f'No free database connection in {self.timeout} seconds')
+        try:
+            return super().getconn(key)
+        except Exception:
+            self.slots.release()
+            raise
+
+    def putconn(self, conn, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)   # Rolls back unfinished transaction, closes broken connection
+        finally:
+            self.slots.release()
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def pool_size(self):
+        return self.settings_dict.get('POOL_SIZE') or 0
+
+    def get_pool(self, conn_params):
+        with pools_lock:
+            if self.alias not in pools:
+                pools[self.alias] = BlockingPool(self.pool_size, self.settings_dict.get('POOL_TIMEOUT', 30), **conn_params)
+            return pools[self.alias]
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_size:
+            return super().get_new_connection(conn_params)
+        pool = self.get_pool(conn_params)
+        connection = pool.getconn()
+        if self.settings_dict.get('CONN_HEALTH_CHECKS') and not self.connection_works(connection):
+            pool.putconn(connection, close=True)
+            connection = pool.getconn()
+        # Same as in Django's get_new_connection(), pooled connection can't go through psycopg2.connect()
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get('isolation_level', connection.isolation_level)
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    @staticmethod
+    def connection_works(connection):
+        if connection.closed:
+            return False
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close(self):
+        if self.connection is not None and self.pool_size:
+            with self.wrap_database_errors:
+                pools[self.alias].putconn(self.connection, close=bool(self.connection.closed))
+            return
+        super()._close()
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True   # New connection doesn't need a check
+
+    def close_if_unusable_or_obsolete(self):
+        """Called at the start and the end of every request, next request checks the connection again"""
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (self.connection is not None and self.settings_dict.get('CONN_HEALTH_CHECKS')
+                and not self.health_check_done and not self.in_atomic_block):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.close()    # super() opens a new one
+        super().ensure_connection()
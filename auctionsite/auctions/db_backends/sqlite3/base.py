@@ -0,0 +1,32 @@
+"""SQLite backend tuned for concurrent use (ENGINE = 'auctions.db_backends.sqlite3'):
+
+- every new connection switches the database to WAL journal (readers don't wait for writers), waits for locks
+  (busy_timeout) instead of failing with "database is locked" and uses bigger page cache and memory mapped IO.
+  PRAGMAS in database settings override the defaults
+- transactions opened by auctions.db_backends.write_transaction() start with BEGIN IMMEDIATE
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pragmas = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',    # Safe with WAL, fsync only at checkpoints
+        'busy_timeout': 10000,      # Milliseconds
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,   # Negative value is in KiB
+        'temp_store': 'MEMORY',
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.immediate_transaction = False
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        for name, value in {**self.pragmas, **self.settings_dict.get('PRAGMAS', {})}.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE' if self.immediate_transaction else 'BEGIN')
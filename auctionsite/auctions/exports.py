@@ -0,0 +1,98 @@
+"""Streaming CSV and newline delimited JSON exports of bids and sales.
+Rows are read with values_list() and iterator(), so neither model instances nor the whole result are ever in memory,
+and written in chunks of rows, so a big export isn't sent as millions of tiny writes"""
+import csv
+import itertools
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Case, F, When
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+
+from .models import Auction, Bid
+
+
+FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+CHUNK_SIZE = 2000
+
+# (column name, field or expression) of every export
+AUCTION_BID_COLUMNS = (
+    ('id', 'id'),
+    ('time', 'time'),
+    ('amount', 'amount'),
+    ('bidder', 'bidder__username'),
+)
+USER_BID_COLUMNS = (
+    ('id', 'id'),
+    ('time', 'time'),
+    ('amount', 'amount'),
+    ('auction', 'auction_id'),
+    ('auction_name', 'auction__name'),
+    ('auction_status', 'auction__status'),
+)
+SALE_COLUMNS = (
+    ('auction', 'id'),
+    ('name', 'name'),
+    ('item', 'item__name'),
+    ('category', 'item__category__name'),
+    ('seller', 'seller__username'),
+    ('buyer', 'buyer__username'),
+    # Auctions bought with buy now have no bids, the others are sold for the highest bid (min_price)
+    ('price', Case(When(bid_count=0, then=Coalesce('buy_now_price', 'min_price')), default=F('min_price'))),
+    ('bid_count', 'bid_count'),
+    ('end_date', 'end_date'),
+)
+
+
+def auction_bids(auction_id):
+    return Bid.objects.filter(auction=auction_id).order_by('time', 'id')
+
+
+def user_bids(user):
+    return Bid.objects.filter(bidder=user).order_by('time', 'id')
+
+
+def sales(start=None, end=None):
+    """Sold auctions ending in [start, end), either bound can be None"""
+    queryset = Auction.objects.filter(status='sold')
+    if start is not None:
+        queryset = queryset.filter(end_date__gte=start)
+    if end is not None:
+        queryset = queryset.filter(end_date__lt=end)
+    return queryset.order_by('end_date', 'id')
+
+
+class Echo:
+    """File-like object csv.writer writes to, writerow() returns the line instead of storing it"""
+    def write(self, value):
+        return value
+
+
+def csv_chunks(header, chunks):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for chunk in chunks:
+        yield ''.join(writer.writerow(row) for row in chunk)
+
+
+def ndjson_chunks(header, chunks):
+    for chunk in chunks:
+        yield ''.join(json.dumps(dict(zip(header, row)), cls=DjangoJSONEncoder) + '\n' for row in chunk)
+
+
+def export_rows(queryset, columns, format, chunk_size=CHUNK_SIZE):
+    """Yields the export of the queryset as text, 'chunk_size' rows at a time"""
+    rows = queryset.values_list(*(value for _, value in columns)).iterator(chunk_size=chunk_size)
+    chunks = iter(lambda: list(itertools.islice(rows, chunk_size)), [])
+    header = [name for name, _ in columns]
+    if format == 'csv':
+        return csv_chunks(header, chunks)
+    return ndjson_chunks(header, chunks)
+
+
+def export_response(queryset, columns, format, filename):
+    """StreamingHttpResponse downloaded as '<filename>.<format>', the query runs once the response is being sent"""
+    response = StreamingHttpResponse(export_rows(queryset, columns, format), content_type=FORMATS[format])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{format}"'
+    return response
@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.forms.models import modelform_factory
+from django.utils import timezone
 
 from .models import Bid, Opinion, Auction, Item
 
@@ -9,10 +10,45 @@ from .models import Bid, Opinion, Auction, Item
 User = get_user_model()
 
 
+def auction_errors(min_price, buy_now_price, end_date, now=None):
+    """Rules of a new auction which forms can't check field by field, returns {field: message} of broken ones"""
+    errors = {}
+    if buy_now_price and min_price > buy_now_price:
+        errors['buy_now_price'] = 'Price without bidding cannot be less than minimum price'
+    if end_date < (now or timezone.now()):     # Check if date is not past
+        errors['end_date'] = 'End date cannot be past'
+    return errors
+
+
 class SearchForm(forms.Form):
     search = forms.CharField(min_length=3, required=False)
 
 
+class ProxyBidForm(forms.Form):
+    max_amount = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0,
+                                    help_text='We bid for you, just enough to stay on top, up to this amount')
+
+
+class ExportForm(forms.Form):
+    format = forms.ChoiceField(choices=(('csv', 'CSV'), ('ndjson', 'NDJSON')), required=False)
+
+    def clean_format(self):
+        return self.cleaned_data['format'] or 'csv'
+
+
+class SalesExportForm(ExportForm):
+    """Dates are days in the current time zone, 'end' is included. Without them all sales are exported"""
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and start > end:
+            raise ValidationError('Start date cannot be after end date')
+        return cleaned_data
+
+
 class LoginForm(forms.Form):
     username = forms.CharField(max_length=64)
     password = forms.CharField(widget=forms.PasswordInput)
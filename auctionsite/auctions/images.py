@@ -0,0 +1,69 @@
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+
+# Smaller copies of Item.image, every size is saved as JPEG and WebP (the original file is never changed)
+SIZES = {
+    'thumbnail': (200, 200),    # Lists
+    'medium': (800, 800),       # Item page
+}
+FORMATS = {
+    'jpeg': ('jpg', {'quality': 80, 'optimize': True, 'progressive': True}),
+    'webp': ('webp', {'quality': 80, 'method': 4}),
+}
+VARIANTS_DIR = 'variants'
+
+
+def variant_name(name, size, image_format):
+    """Storage name of one variant, e.g. images/cover.jpg -> variants/images/cover/thumbnail.webp"""
+    extension = FORMATS[image_format][0]
+    return f'{VARIANTS_DIR}/{os.path.splitext(name)[0]}/{size}.{extension}'
+
+
+def generate_variants(image, storage=default_storage):
+    """Creates missing variants of ImageField file and returns their storage names {(size, format): name}"""
+    names = {(size, image_format): variant_name(image.name, size, image_format) for size in SIZES for image_format in FORMATS}
+    missing = {key: variant for key, variant in names.items() if not storage.exists(variant)}
+    if not missing:
+        return names
+    with image.storage.open(image.name) as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    for (size, image_format), variant in missing.items():
+        resized = image.copy()
+        resized.thumbnail(SIZES[size], Image.LANCZOS)    # Keeps aspect ratio, never enlarges
+        if image_format == 'jpeg' and resized.mode == 'RGBA':
+            resized = resized.convert('RGB')    # JPEG has no transparency
+        output = BytesIO()
+        resized.save(output, format=image_format.upper(), **FORMATS[image_format][1])
+        storage.save(variant, ContentFile(output.getvalue()))
+    return names
+
+
+def variant_urls(image, storage=default_storage):
+    """URLs of variants of ImageField file, e.g. {'thumbnail': ..., 'thumbnail_webp': ..., 'medium': ..., ...}.
+    Variants are usually created on upload, missing ones (e.g. of older uploads) are created here on first use
+    and kept on disk. Broken or missing original gives empty dict"""
+    if not image:
+        return {}
+    try:
+        names = generate_variants(image, storage)
+    except (OSError, ValueError):    # Missing file or not an image (PIL raises subclasses of OSError)
+        return {}
+    urls = {}
+    for (size, image_format), name in names.items():
+        key = size if image_format == 'jpeg' else f'{size}_{image_format}'
+        urls[key] = storage.url(name)
+    return urls
+
+
+def delete_variants(name, storage=default_storage):
+    for size in SIZES:
+        for image_format in FORMATS:
+            storage.delete(variant_name(name, size, image_format))
@@ -0,0 +1,249 @@
+"""Live auction pages: accepted bids, end date extensions and status changes are pushed to browsers
+with Server-Sent Events from /auction/<pk>/events, so bidders don't have to reload the page to see the price.
+The stream is a plain ASGI app mounted in front of Django by auctionsite/asgi.py (it needs ASGI server,
+under WSGI the page just doesn't update itself).
+
+Events go through the broker of the process, its backend (settings.LIVE_EVENTS_BACKEND) carries them between processes:
+LocalBackend delivers them only inside the process (one ASGI worker), PostgresBackend uses LISTEN/NOTIFY so every
+worker (and management commands like close_auctions) reaches subscribers of all of them"""
+import asyncio
+import json
+import re
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, close_old_connections, transaction
+from django.utils.module_loading import import_string
+
+from .models import Auction
+
+
+STREAM_PATH = re.compile(r'^/auction/(?P<pk>[0-9a-fA-F-]{32,36})/events$')
+
+
+class LocalBackend:
+    """Delivers events to subscribers of this process only"""
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    def publish(self, channel, event):
+        self.deliver(channel, event)
+
+    def listen(self):
+        pass
+
+
+class PostgresBackend:
+    """Sends events with NOTIFY, every process listening on its own connection delivers them to its subscribers"""
+    notify_channel = 'auction_events'
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def publish(self, channel, event):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.notify_channel, json.dumps([channel, event])])
+
+    def listen(self):
+        """Starts the listening thread on first subscription"""
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def run(self):
+        import select
+        import psycopg2
+
+        while True:
+            try:
+                listener = psycopg2.connect(**connection.get_connection_params())
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.notify_channel}')
+                while True:
+                    if select.select([listener], [], [], 60) == ([], [], []):
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        channel, event = json.loads(listener.notifies.pop(0).payload)
+                        self.deliver(channel, event)
+            except psycopg2.Error:
+                time.sleep(1)   # Server restarted or connection dropped, listen again
+
+
+class Subscription:
+    """Queue of events of one channel for one client, lives in the event loop of the client's connection"""
+    def __init__(self, channel, size):
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(size)
+
+    def put(self, event):
+        """Called from any thread"""
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        if self.queue.full():   # Slow client loses the oldest event, every event carries current values anyway
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class Broker:
+    """In-process pub/sub of live events, channels are named after auctions"""
+    queue_size = 100
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}     # channel -> set of Subscription
+        self.backend = None
+
+    def get_backend(self):
+        with self.lock:
+            if self.backend is None:
+                self.backend = import_string(settings.LIVE_EVENTS_BACKEND)(self.deliver)
+            return self.backend
+
+    def subscribe(self, channel):
+        """Has to be called in the event loop which is going to read the subscription"""
+        self.get_backend().listen()
+        subscription = Subscription(channel, self.queue_size)
+        with self.lock:
+            self.subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.channel, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.channel, None)
+
+    def subscribers(self, channel):
+        with self.lock:
+            return len(self.subscriptions.get(channel, ()))
+
+    def publish(self, channel, event):
+        self.get_backend().publish(channel, event)
+
+    def deliver(self, channel, event):
+        """Called by the backend with every event published by this or (depending on the backend) other process"""
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+
+broker = Broker()
+
+
+def auction_channel(auction_id):
+    return f'auction-{uuid.UUID(str(auction_id))}'
+
+
+def publish(auction_id, event_type, **data):
+    """Publishes event of the auction once the current transaction commits (right away outside of a transaction)"""
+    event = {'type': event_type, 'auction': str(auction_id), **data}
+    transaction.on_commit(lambda: broker.publish(auction_channel(auction_id), event))
+
+
+def publish_bid(bid, auction, end_date, new_bids=1):
+    """'auction' is the state before the bid, 'end_date' the one after it (extended or not).
+    Bids settled by proxies together are published once, with the last of 'new_bids' bids"""
+    publish(auction.pk, 'bid', price=str(bid.amount), buyer=bid.bidder.username, bid_count=auction.bid_count + new_bids,
+            end_date=end_date.isoformat(), extended=end_date != auction.end_date)
+
+
+def publish_status(auction_id, status):
+    publish(auction_id, 'status', status=status)
+
+
+def auction_state(auction_id):
+    """Current values of the auction sent when client connects (it could miss events while it was reconnecting)"""
+    close_old_connections()     # Runs outside of Django request cycle
+    try:
+        auction = Auction.objects.filter(pk=auction_id).values(
+            'min_price', 'bid_count', 'end_date', 'status', 'buyer__username').first()
+    finally:
+        close_old_connections()
+    if auction is None:
+        return None
+    return {
+        'type': 'state',
+        'auction': str(auction_id),
+        'price': str(auction['min_price']),
+        'buyer': auction['buyer__username'],
+        'bid_count': auction['bid_count'],
+        'end_date': auction['end_date'].isoformat(),
+        'status': auction['status'],
+    }
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def auction_events(scope, receive, send, auction_id):
+    """ASGI app streaming events of one auction until the client goes away"""
+    channel = auction_channel(auction_id)
+    subscription = broker.subscribe(channel)    # Before reading the state, so nothing falls in between
+    try:
+        state = await sync_to_async(auction_state)(auction_id)
+        if state is None:
+            await send({'type': 'http.response.start', 'status': 404, 'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Auction not found'})
+            return
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),    # Don't let nginx buffer the stream
+        ]})
+        await send({'type': 'http.response.body', 'body': format_event(state), 'more_body': True})
+        disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+        event = asyncio.ensure_future(subscription.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    {event, disconnected}, timeout=settings.LIVE_EVENTS_KEEPALIVE, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    break
+                if event in done:
+                    body = format_event(event.result())
+                    event = asyncio.ensure_future(subscription.get())
+                else:
+                    body = b': keepalive\n\n'     # Comment line keeps proxies from closing idle connection
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            event.cancel()
+            disconnected.cancel()
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def router(application):
+    """Wraps Django ASGI application, requests of live streams don't go through Django at all"""
+    async def app(scope, receive, send):
+        if scope['type'] == 'http':
+            match = STREAM_PATH.match(scope['path'])
+            if match:
+                try:
+                    auction_id = uuid.UUID(match['pk'])
+                except ValueError:
+                    pass
+                else:
+                    return await auction_events(scope, receive, send, auction_id)
+        return await application(scope, receive, send)
+    return app
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from auctions.scheduler import close_finished_auctions, run_scheduler
+
+
+class Command(BaseCommand):
+    help = 'Changes status of finished auctions to sold or expired (use --loop to keep it running as a worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Run forever and close auctions as their deadlines pass')
+        parser.add_argument('--interval', type=int, default=60, help='Maximum number of seconds between two sweeps')
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            run_scheduler(interval=options['interval'], stdout=self.stdout)
+        else:
+            result = close_finished_auctions()
+            self.stdout.write(f"Closed auctions: {result['sold']} sold, {result['expired']} expired")
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from auctions.storage import deduplicate_media
+
+
+class Command(BaseCommand):
+    help = 'Moves item images into content-addressed storage, so identical files are stored once (use --dry-run to only report)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default='images', help='Directory in MEDIA_ROOT with files saved by the old storage')
+        parser.add_argument('--dry-run', action='store_true', help='Only count duplicates, change nothing')
+
+    def handle(self, *args, **options):
+        result = deduplicate_media(directory=options['directory'], dry_run=options['dry_run'])
+        self.stdout.write(
+            f"Files: {result['files']}, duplicates: {result['duplicates']}, "
+            f"freed: {result['freed_bytes'] / 1024:.1f} KiB, missing files of items: {result['missing']}")
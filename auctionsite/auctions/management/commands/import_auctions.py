@@ -0,0 +1,39 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.bulk_import import FORMATS, format_of, import_rows, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Imports items with their auctions from CSV or NDJSON file (see auctions/bulk_import.py for the columns)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, '-' reads standard input")
+        parser.add_argument('--seller', required=True, help='Username of the seller of imported auctions')
+        parser.add_argument('--format', choices=FORMATS, help='Default is guessed from the file extension (CSV)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows inserted with one INSERT')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Rows saved in one transaction')
+
+    def handle(self, *args, **options):
+        try:
+            seller = get_user_model().objects.get(username=options['seller'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User '{options['seller']}' does not exist")
+        format = options['format'] or format_of(options['path'])
+
+        def report(number, errors):
+            messages = '; '.join(f'{field}: {" ".join(field_errors)}' for field, field_errors in errors.items())
+            self.stderr.write(f'Row {number}: {messages}')
+
+        if options['path'] == '-':
+            result = self.run(sys.stdin, format, seller, options, report)
+        else:
+            with open(options['path'], encoding='utf-8-sig', newline='') as lines:
+                result = self.run(lines, format, seller, options, report)
+        self.stdout.write(f'Imported {result.imported} auctions, rejected {result.failed} rows')
+
+    def run(self, lines, format, seller, options, report):
+        return import_rows(read_rows(lines, format), seller, batch_size=options['batch_size'],
+                           chunk_size=options['chunk_size'], max_errors=0, on_error=report)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.bidding import rebuild_bid_stats, inconsistent_bid_stats
+
+
+class Command(BaseCommand):
+    help = 'Recounts bid_count, highest_bid and last_bid_at of every auction (use --check to only report wrong ones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='List auctions with wrong bid columns without fixing them')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            wrong = inconsistent_bid_stats()
+            for pk in wrong:
+                self.stdout.write(f'Wrong bid columns: {pk}')
+            if wrong:
+                raise CommandError(f'{len(wrong)} auctions have wrong bid columns, run rebuild_bid_stats to fix them')
+            self.stdout.write('Bid columns are consistent')
+            return
+        self.stdout.write(f'Rebuilt bid columns of {rebuild_bid_stats()} auctions')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.ratings import rebuild_ratings, inconsistent_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recounts rating stats of every auction and seller from opinions (use --check to only report wrong ones)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='List wrong rating stats without fixing them')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            wrong = inconsistent_ratings()
+            for model, key in wrong:
+                self.stdout.write(f'Wrong rating stats: {model} {key}')
+            if wrong:
+                raise CommandError(f'{len(wrong)} rating stats are wrong, run rebuild_ratings to fix them')
+            self.stdout.write('Rating stats are consistent')
+            return
+        self.stdout.write(f'Rebuilt rating stats of {rebuild_ratings()} auctions and sellers')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from auctions.search import rebuild_index
+from auctions.models import SearchDocument
+
+
+class Command(BaseCommand):
+    help = 'Recreates full-text search documents of items, auctions and categories'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(f'Indexed documents: {SearchDocument.objects.count()}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from auctions.counters import reconcile, run_reconciler
+
+
+class Command(BaseCommand):
+    help = 'Counts site-wide counters (users, auctions by status, active bidders) from scratch (use --loop to keep it running as a worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Run forever and reconcile counters periodically')
+        parser.add_argument('--interval', type=int, default=300, help='Number of seconds between two reconciliations')
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            run_reconciler(interval=options['interval'], stdout=self.stdout)
+        else:
+            values = reconcile()
+            self.stdout.write(', '.join(f'{name}: {value}' for name, value in values.items()))
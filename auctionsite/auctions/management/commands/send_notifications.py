@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from auctions.notifications import send_notifications, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Sends queued notifications (emails and SMS) in batches (use --loop to keep it running as a worker)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Run forever and send notifications as they are queued')
+        parser.add_argument('--batch-size', type=int, default=100, help='Number of notifications sent using one connection')
+        parser.add_argument('--interval', type=int, default=5, help='Number of seconds to wait when the outbox is empty')
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            run_worker(batch_size=options['batch_size'], interval=options['interval'], stdout=self.stdout)
+        else:
+            sent = send_notifications(batch_size=options['batch_size'])
+            self.stdout.write(f'Sent notifications: {sent}')
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0035_alter_opinion_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auction',
+            index=models.Index(fields=['status', 'end_date'], name='auctions_au_status_07a65b_idx'),
+        ),
+    ]
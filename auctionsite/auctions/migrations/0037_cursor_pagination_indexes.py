@@ -0,0 +1,25 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0036_auction_status_end_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='auction',
+            index=models.Index(fields=['end_date', 'id'], name='auctions_au_end_dat_c74f73_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['bidder', 'time', 'id'], name='auctions_bi_bidder__5e6cf9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['name', 'id'], name='auctions_it_name_d5eb4e_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+from django.db import migrations
+
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE auctions_searchdocument_fts USING fts5("
+    "name, description, content='auctions_searchdocument', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER auctions_searchdocument_ai AFTER INSERT ON auctions_searchdocument BEGIN "
+    "INSERT INTO auctions_searchdocument_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+    "CREATE TRIGGER auctions_searchdocument_ad AFTER DELETE ON auctions_searchdocument BEGIN "
+    "INSERT INTO auctions_searchdocument_fts(auctions_searchdocument_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); END",
+    "CREATE TRIGGER auctions_searchdocument_au AFTER UPDATE ON auctions_searchdocument BEGIN "
+    "INSERT INTO auctions_searchdocument_fts(auctions_searchdocument_fts, rowid, name, description) "
+    "VALUES ('delete', old.id, old.name, old.description); "
+    "INSERT INTO auctions_searchdocument_fts(rowid, name, description) VALUES (new.id, new.name, new.description); END",
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS auctions_searchdocument_au',
+    'DROP TRIGGER IF EXISTS auctions_searchdocument_ad',
+    'DROP TRIGGER IF EXISTS auctions_searchdocument_ai',
+    'DROP TABLE IF EXISTS auctions_searchdocument_fts',
+]
+POSTGRESQL_CREATE = [
+    "ALTER TABLE auctions_searchdocument ADD COLUMN document tsvector GENERATED ALWAYS AS ("
+    "setweight(to_tsvector('simple', name), 'A') || setweight(to_tsvector('simple', description), 'B')) STORED",
+    'CREATE INDEX auctions_searchdocument_document ON auctions_searchdocument USING GIN (document)',
+]
+POSTGRESQL_DROP = [
+    'DROP INDEX IF EXISTS auctions_searchdocument_document',
+    'ALTER TABLE auctions_searchdocument DROP COLUMN IF EXISTS document',
+]
+
+
+def create_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_CREATE, 'postgresql': POSTGRESQL_CREATE}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def fill_index(apps, schema_editor):
+    """Creates search documents of existing items, auctions and categories"""
+    connection = schema_editor.connection
+    SearchDocument = apps.get_model('auctions', 'SearchDocument')
+    for kind, model_name in (('item', 'Item'), ('auction', 'Auction'), ('category', 'Category')):
+        model = apps.get_model('auctions', model_name)
+        documents = []
+        for instance in model.objects.iterator(chunk_size=10000):
+            documents.append(SearchDocument(
+                kind=kind,
+                object_id=str(model._meta.pk.get_db_prep_value(instance.pk, connection)),
+                name=instance.name,
+                description=getattr(instance, 'description', '')))
+        SearchDocument.objects.bulk_create(documents, batch_size=10000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0039_search_document'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(fill_index, migrations.RunPython.noop),
+    ]
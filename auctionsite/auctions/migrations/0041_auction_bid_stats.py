@@ -0,0 +1,44 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:39
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Count
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_bid_stats(apps, schema_editor):
+    """Counts bid columns of existing auctions (same as bidding.rebuild_bid_stats)"""
+    Auction = apps.get_model('auctions', 'Auction')
+    Bid = apps.get_model('auctions', 'Bid')
+    bids = Bid.objects.filter(auction=OuterRef('pk'))
+    Auction.objects.update(
+        bid_count=Coalesce(Subquery(bids.order_by().values('auction').annotate(count=Count('id')).values('count')), 0),
+        highest_bid=Subquery(bids.order_by('-amount', '-id').values('id')[:1]),
+        last_bid_at=Subquery(bids.order_by('-time', '-id').values('time')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0040_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auction',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='auction',
+            name='highest_bid',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='auctions.bid'),
+        ),
+        migrations.AddField(
+            model_name='auction',
+            name='last_bid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_bid_stats, migrations.RunPython.noop),
+    ]
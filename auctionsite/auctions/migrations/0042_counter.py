@@ -0,0 +1,39 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:41
+
+from django.db import migrations, models
+
+
+def fill_counters(apps, schema_editor):
+    """Counts existing rows (same as counters.reconcile)"""
+    Counter = apps.get_model('auctions', 'Counter')
+    Auction = apps.get_model('auctions', 'Auction')
+    Bid = apps.get_model('auctions', 'Bid')
+    User = apps.get_model('auth', 'User')
+    values = {
+        'users': User.objects.count(),
+        'auctions': Auction.objects.count(),
+        'auctions_available': Auction.objects.filter(status='available').count(),
+        'auctions_expired': Auction.objects.filter(status='expired').count(),
+        'auctions_sold': Auction.objects.filter(status='sold').count(),
+        'active_bidders': Bid.objects.filter(auction__status='available').values('bidder').distinct().count(),
+    }
+    Counter.objects.bulk_create(Counter(name=name, value=value) for name, value in values.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0041_auction_bid_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 4.0.2 on 2026-10-18 20:38
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def fill_rating_stats(apps, schema_editor):
+    """Counts stats of rated auctions and sellers (same as ratings.rebuild_ratings)"""
+    Opinion = apps.get_model('auctions', 'Opinion')
+    stats = {
+        'count': Count('id'),
+        'total': Coalesce(Sum('rating'), 0),
+        **{f'rating_{rating}': Count('id', filter=Q(rating=rating)) for rating in range(1, 11)},
+    }
+    for model_name, lookup in (('AuctionRating', 'auction'), ('SellerRating', 'auction__seller')):
+        model = apps.get_model('auctions', model_name)
+        rows = Opinion.objects.order_by().values(lookup).annotate(**stats)
+        model.objects.bulk_create((model(pk=row.pop(lookup), **row) for row in rows.iterator()), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('auctions', '0043_media_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuctionRating',
+            fields=[
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('rating_1', models.PositiveIntegerField(default=0)),
+                ('rating_2', models.PositiveIntegerField(default=0)),
+                ('rating_3', models.PositiveIntegerField(default=0)),
+                ('rating_4', models.PositiveIntegerField(default=0)),
+                ('rating_5', models.PositiveIntegerField(default=0)),
+                ('rating_6', models.PositiveIntegerField(default=0)),
+                ('rating_7', models.PositiveIntegerField(default=0)),
+                ('rating_8', models.PositiveIntegerField(default=0)),
+                ('rating_9', models.PositiveIntegerField(default=0)),
+                ('rating_10', models.PositiveIntegerField(default=0)),
+                ('auction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating', serialize=False, to='auctions.auction')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='SellerRating',
+            fields=[
+                ('count', models.PositiveIntegerField(default=0)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('rating_1', models.PositiveIntegerField(default=0)),
+                ('rating_2', models.PositiveIntegerField(default=0)),
+                ('rating_3', models.PositiveIntegerField(default=0)),
+                ('rating_4', models.PositiveIntegerField(default=0)),
+                ('rating_5', models.PositiveIntegerField(default=0)),
+                ('rating_6', models.PositiveIntegerField(default=0)),
+                ('rating_7', models.PositiveIntegerField(default=0)),
+                ('rating_8', models.PositiveIntegerField(default=0)),
+                ('rating_9', models.PositiveIntegerField(default=0)),
+                ('rating_10', models.PositiveIntegerField(default=0)),
+                ('seller', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='seller_rating', serialize=False, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.RunPython(fill_rating_stats, migrations.RunPython.noop),
+    ]
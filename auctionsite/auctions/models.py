@@ -2,6 +2,10 @@ from django.utils import timezone
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils.functional import cached_property
+
+from .images import variant_urls
+from .storage import get_image_storage
 
 import uuid
 
@@ -27,7 +31,8 @@ class Item(models.Model):
     description = models.TextField()
     image = models.ImageField(null=True,
                             blank=True,
-                            upload_to='images/')
+                            upload_to='images/',
+                            storage=get_image_storage)     # Identical uploads are stored once
     category = models.ForeignKey(Category, on_delete=models.CASCADE)
     creator = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     id = models.UUIDField(
@@ -37,9 +42,26 @@ class Item(models.Model):
         editable=False
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id']),   # Cursor pagination of items
+        ]
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remembers image read from the database, so signals can release the replaced one"""
+        instance = super().from_db(db, field_names, values)
+        instance.saved_image = instance.__dict__.get('image')
+        return instance
+
+    @cached_property
+    def image_variants(self):
+        """URLs of smaller JPEG and WebP copies of the image, e.g. {'thumbnail': ..., 'thumbnail_webp': ...}"""
+        return variant_urls(self.image)
+
 
 class Auction(models.Model):
     CHOICES = (
@@ -61,10 +83,27 @@ class Auction(models.Model):
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name='seller')
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, related_name='buyer', null=True)
     status = models.CharField(choices=CHOICES, default='available', max_length=64)
+    # Copies of Bid data kept up to date by bidding.place_bid (rebuild with 'manage.py rebuild_bid_stats')
+    bid_count = models.PositiveIntegerField(default=0)
+    highest_bid = models.ForeignKey('Bid', on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    last_bid_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'end_date']),   # Used by status filtered lists and by the scheduler
+            models.Index(fields=['end_date', 'id']),   # Cursor pagination of auctions
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remembers status read from the database, so signals can tell when save() changes it"""
+        instance = super().from_db(db, field_names, values)
+        instance.saved_status = instance.__dict__.get('status')
+        return instance
+
 
 class Bid(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -72,6 +111,27 @@ class Bid(models.Model):
     auction = models.ForeignKey(Auction, on_delete=models.CASCADE)
     bidder = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['bidder', 'time', 'id']),   # Cursor pagination of user bids
+        ]
+
+
+class ProxyBid(models.Model):
+    """Hidden maximum of a bidder, bidding.place_proxy_bid and place_bid bid for them up to it"""
+    auction = models.ForeignKey(Auction, on_delete=models.CASCADE)
+    bidder = models.ForeignKey(User, on_delete=models.CASCADE)
+    max_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created = models.DateTimeField()    # Of the current maximum, earlier one wins a tie
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['auction', 'bidder'], name='unique_proxy_bid'),
+        ]
+        indexes = [
+            models.Index(fields=['auction', '-max_amount', 'created']),   # Strongest proxies of the auction first
+        ]
+
 
 class Opinion(models.Model):
     id = models.UUIDField(
@@ -86,3 +146,110 @@ class Opinion(models.Model):
     comment = models.TextField()
     date_created = models.DateTimeField(auto_now_add=True)
     date_edited = models.DateTimeField(null=True)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remembers rating read from the database, so signals can move an edited opinion in rating stats"""
+        instance = super().from_db(db, field_names, values)
+        instance.saved_rating = instance.__dict__.get('rating')
+        return instance
+
+
+class RatingStats(models.Model):
+    """Count, sum and histogram of opinion ratings kept up to date by signals (rebuild with 'manage.py rebuild_ratings'),
+    so pages read average rating and reputation from one row instead of aggregating opinions"""
+    count = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+    rating_6 = models.PositiveIntegerField(default=0)
+    rating_7 = models.PositiveIntegerField(default=0)
+    rating_8 = models.PositiveIntegerField(default=0)
+    rating_9 = models.PositiveIntegerField(default=0)
+    rating_10 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def histogram(self):
+        """{rating: number of opinions} for ratings 1-10"""
+        return {rating: getattr(self, f'rating_{rating}') for rating in range(1, 11)}
+
+
+class AuctionRating(RatingStats):
+    auction = models.OneToOneField(Auction, on_delete=models.CASCADE, primary_key=True, related_name='rating')
+
+
+class SellerRating(RatingStats):
+    """Reputation of the seller, opinions about all of their auctions"""
+    seller = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='seller_rating')
+
+
+class Notification(models.Model):
+    """Outbox of messages to users (e.g. outbid notifications), sent in batches by 'manage.py send_notifications'"""
+    CHANNELS = (
+        ('email', 'email'),
+        ('sms', 'sms'),
+    )
+    channel = models.CharField(choices=CHANNELS, default='email', max_length=16)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=255, blank=True)
+    body = models.TextField()
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)    # Worker sending it, others skip it until then
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sent_at', 'channel', 'created']),   # Worker looks for unsent notifications
+        ]
+
+
+class SearchDocument(models.Model):
+    """Searchable copy of name and description of items, auctions and categories (kept in sync by signals).
+    Full-text index on it is created by migration: FTS5 table on SQLite, tsvector column with GIN index on PostgreSQL"""
+    KINDS = (
+        ('item', 'item'),
+        ('auction', 'auction'),
+        ('category', 'category'),
+    )
+    kind = models.CharField(choices=KINDS, max_length=16)
+    object_id = models.CharField(max_length=64)
+    name = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_document'),
+        ]
+
+
+class Counter(models.Model):
+    """Site-wide numbers (users, auctions by status...) kept up to date by signals and 'manage.py reconcile_counters',
+    so pages don't have to COUNT whole tables"""
+    name = models.CharField(max_length=64, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
+
+
+class MediaBlob(models.Model):
+    """File kept by ContentAddressedStorage, deleted when the last reference is removed"""
+    name = models.CharField(max_length=255, unique=True)
+    size = models.BigIntegerField()
+    references = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return f'{self.name} ({self.references} references)'
+
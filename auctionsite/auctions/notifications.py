@@ -0,0 +1,126 @@
+import time
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Q
+from django.utils import timezone
+
+from .db_backends import write_transaction
+from .models import Notification, Account
+
+
+MAX_ATTEMPTS = 5    # Notification which failed that many times is not sent again
+CLAIM_TIMEOUT = timezone.timedelta(minutes=10)    # Longer than sending of one batch can take
+RETRY_DELAY = timezone.timedelta(minutes=1)     # Wait after the first failed attempt, doubles with every next one
+
+
+def notify_outbid(auction, previous_buyer, new_price):
+    """Puts outbid notifications into the outbox (they are sent later by the worker, not during the request)"""
+    notifications = []
+    if previous_buyer.email:
+        notifications.append(Notification(
+            channel='email',
+            recipient=previous_buyer.email,
+            subject=f'{auction.name}',
+            body=f'You have been outbid. New price is {new_price}'))
+    if settings.TWILIO_ACCOUNT_SID:
+        phone_number = Account.objects.filter(user=previous_buyer).values_list('phone_number', flat=True).first()
+        if phone_number:
+            notifications.append(Notification(
+                channel='sms',
+                recipient=f'+48{phone_number}',
+                body=f'Your auction: "{auction.name}" has been outbid. New price is {new_price}!'))
+    Notification.objects.bulk_create(notifications)
+    return notifications
+
+
+def send_emails(batch):
+    """Sends emails using one connection to the mail server for the whole batch"""
+    now = timezone.now()
+    with get_connection() as connection:
+        for notification in batch:
+            message = EmailMessage(notification.subject, notification.body, settings.EMAIL_HOST_USER, [notification.recipient])
+            try:
+                if not connection.send_messages([message]):    # Number of delivered messages
+                    raise RuntimeError('Message was not delivered')
+                notification.sent_at = now
+            except Exception as error:
+                notification.attempts += 1
+                notification.last_error = str(error)
+
+
+def send_sms(batch):
+    """Sends SMS using one Twilio client for the whole batch"""
+    from twilio.rest import Client
+
+    now = timezone.now()
+    client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+    for notification in batch:
+        try:
+            client.messages.create(body=notification.body, from_=settings.TWILIO_FROM_NUMBER, to=notification.recipient)
+            notification.sent_at = now
+        except Exception as error:
+            notification.attempts += 1
+            notification.last_error = str(error)
+
+
+SENDERS = {
+    'email': send_emails,
+    'sms': send_sms,
+}
+
+
+def backoff(attempts):
+    """How long a notification which failed 'attempts' times waits before it is claimed again"""
+    return RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def claim(channel, batch_size, now):
+    """Claims a batch of unsent notifications for CLAIM_TIMEOUT and returns it. Rows are locked while they are
+    claimed (claimed by another worker are skipped), so two workers never get the same notification.
+    Claim of a worker which died while sending runs out and the batch is sent again, failed notifications
+    stay claimed until their backoff ends"""
+    with write_transaction():
+        ids = list(Notification.objects.select_for_update(skip_locked=True).filter(
+            Q(claimed_until__isnull=True) | Q(claimed_until__lt=now),
+            channel=channel,
+            sent_at__isnull=True,
+            attempts__lt=MAX_ATTEMPTS,
+        ).order_by('created').values_list('pk', flat=True)[:batch_size])
+        Notification.objects.filter(pk__in=ids).update(claimed_until=now + CLAIM_TIMEOUT)
+    return list(Notification.objects.filter(pk__in=ids).order_by('created'))
+
+
+def send_notifications(batch_size=100):
+    """Sends one batch of unsent notifications of every channel, returns number of sent notifications.
+    Several workers can run at once, each sends only notifications it claimed"""
+    sent = 0
+    for channel, sender in SENDERS.items():
+        batch = claim(channel, batch_size, timezone.now())
+        if not batch:
+            continue
+        attempts = {notification.pk: notification.attempts for notification in batch}
+        try:
+            sender(batch)
+        except Exception as error:   # e.g. mail server is down, notifications not tried or delivered yet are retried
+            for notification in batch:
+                if not notification.sent_at and notification.attempts == attempts[notification.pk]:
+                    notification.attempts += 1
+                    notification.last_error = str(error)
+        now = timezone.now()
+        for notification in batch:
+            # Failed ones wait longer after every attempt, so an outage doesn't use up MAX_ATTEMPTS in a few loops
+            notification.claimed_until = None if notification.sent_at else now + backoff(notification.attempts)
+        Notification.objects.bulk_update(batch, ['sent_at', 'attempts', 'last_error', 'claimed_until'])
+        sent += sum(1 for notification in batch if notification.sent_at)
+    return sent
+
+
+def run_worker(batch_size=100, interval=5, stdout=None):
+    """Long-running loop which drains the outbox, it sleeps only when there is nothing to send"""
+    while True:
+        sent = send_notifications(batch_size)
+        if stdout and sent:
+            stdout.write(f'Sent notifications: {sent}')
+        if not sent:
+            time.sleep(interval)
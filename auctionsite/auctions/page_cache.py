@@ -0,0 +1,154 @@
+import hashlib
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+
+from .async_views import run_query, maybe_await
+
+
+# Every object has a version token, every kind has a 'list' token (changes with any object of the kind) and an 'all'
+# token (changed by bulk updates which don't say which objects changed). Pages and fragments are cached under
+# the tokens of the data they show, so a write only has to give new tokens and old entries are never read again
+LIST = 'list'
+ALL = 'all'
+
+
+def get_cache():
+    return caches[settings.PAGE_CACHE_ALIAS]
+
+
+def version_key(kind, pk):
+    return f'version:{kind}:{pk}'
+
+
+def new_token():
+    return uuid.uuid4().hex
+
+
+def bump(kind, pk=None):
+    """Gives new version to the object and to the list of its kind (to every object of the kind if pk is None).
+    It is done again when the transaction commits, so a page rendered from data read before commit can't be
+    cached under the new version"""
+    names = [LIST, ALL] if pk is None else [LIST, pk]
+    keys = [version_key(kind, name) for name in names]
+
+    def set_tokens():
+        get_cache().set_many({key: new_token() for key in keys}, timeout=None)
+
+    set_tokens()
+    transaction.on_commit(set_tokens)
+
+
+def get_versions(dependencies):
+    """Returns version tokens of (kind, pk) pairs, 'all' token of every kind is added automatically.
+    Missing token (e.g. evicted) is replaced by a new one, so it never matches entries cached before"""
+    keys = [version_key(kind, pk) for kind, pk in dependencies]
+    keys += [version_key(kind, ALL) for kind in sorted({kind for kind, pk in dependencies})]
+    cache = get_cache()
+    tokens = cache.get_many(keys)
+    for key in keys:
+        if key not in tokens:
+            cache.add(key, new_token(), timeout=None)
+            tokens[key] = cache.get(key)
+    return [tokens[key] for key in keys]
+
+
+class CacheStats:
+    """Hits and misses of cached views in this process"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = Counter()
+        self.misses = Counter()
+
+    def record(self, name, hit):
+        with self.lock:
+            (self.hits if hit else self.misses)[name] += 1
+
+    def clear(self):
+        with self.lock:
+            self.hits.clear()
+            self.misses.clear()
+
+    def summary(self):
+        """Returns {view name: {'hits': ..., 'misses': ..., 'hit_ratio': ...}}"""
+        with self.lock:
+            summary = {}
+            for name in sorted(set(self.hits) | set(self.misses)):
+                hits, misses = self.hits[name], self.misses[name]
+                summary[name] = {'hits': hits, 'misses': misses, 'hit_ratio': hits / (hits + misses)}
+            return summary
+
+
+stats = CacheStats()
+
+
+class VersionedCacheMixin:
+    """Caches rendered GET responses under versions of the data they show. 'cache_dependencies' lists
+    (kind, URL kwarg) pairs, URL kwarg None means the list of the kind, e.g. (('auction', 'pk'),) or (('auction', None),).
+    Pages are cached per user (navigation bar shows username) and never when there are messages to show"""
+    cache_dependencies = ()
+
+    def get_cache_dependencies(self):
+        return [(kind, self.kwargs[kwarg] if kwarg else LIST) for kind, kwarg in self.cache_dependencies]
+
+    def get_cache_key(self):
+        versions = get_versions(self.get_cache_dependencies())
+        user = self.request.user.pk if self.request.user.is_authenticated else 'anonymous'
+        page = hashlib.md5(f'{self.request.get_full_path()}|{"|".join(versions)}'.encode()).hexdigest()
+        return f'page:{type(self).__name__}:{user}:{page}'
+
+    def get_cached_response(self, request):
+        """Returns cached response or None, remembers the key for cache_response() (None if the page can't be cached)"""
+        self.cache_key = None
+        if not settings.PAGE_CACHE_ENABLED or request.method != 'GET' or len(get_messages(request)):
+            return None
+        name = type(self).__name__
+        self.cache_key = self.get_cache_key()
+        cached = get_cache().get(self.cache_key)
+        if cached is None:
+            stats.record(name, hit=False)
+            return None
+        stats.record(name, hit=True)
+        response = HttpResponse(cached['content'], content_type=cached['content_type'])
+        response['X-Cache'] = 'hit'
+        return response
+
+    def cache_response(self, response):
+        if self.cache_key is None:
+            return response
+        if hasattr(response, 'render'):
+            response.render()
+        if response.status_code == 200:
+            get_cache().set(self.cache_key, {'content': response.content, 'content_type': response['Content-Type']},
+                            settings.PAGE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'miss'
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        if getattr(self, 'view_is_async', False):
+            return self.dispatch_async(request, *args, **kwargs)
+        cached = self.get_cached_response(request)
+        if cached is not None:
+            return cached
+        return self.cache_response(super().dispatch(request, *args, **kwargs))
+
+    async def dispatch_async(self, request, *args, **kwargs):
+        """dispatch() of async views (auctions.async_views), session, user and cache are used in worker threads"""
+        cached = await run_query(self.get_cached_response, request)
+        if cached is not None:
+            return cached
+        response = await maybe_await(super().dispatch(request, *args, **kwargs))
+        return await run_query(self.cache_response, response)
+
+    def get_context_data(self, **kwargs):
+        """Adds token for fragment caching, use it with {% cache %} tag for parts shared by all users"""
+        context = super().get_context_data(**kwargs)
+        context['cache_version'] = '-'.join(get_versions(self.get_cache_dependencies()))
+        context['cache_timeout'] = settings.PAGE_CACHE_TIMEOUT if settings.PAGE_CACHE_ENABLED else 0
+        return context
@@ -0,0 +1,174 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .async_views import run_query, load_page
+
+
+def encode_cursor(values):
+    """Encodes ordering values of the last row into URL safe string"""
+    data = json.dumps([str(value) for value in values])
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Decodes cursor created by encode_cursor, raises ValueError if cursor is broken"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+class CursorPage:
+    """One page of KeysetPaginator, behaves like a list of objects"""
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class KeysetPaginator:
+    """Paginates queryset with WHERE (ordering columns) < (last row values) instead of COUNT and OFFSET,
+    so every page costs the same no matter how deep it is. Ordering has to end with unique field, e.g. ('-end_date', '-id')"""
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = int(per_page)
+
+    def _after(self, values):
+        """Builds condition matching rows placed after the row with given values, raises ValueError
+        if they don't fit the ordering fields (the cursor is decoded fine, but e.g. the date isn't a date)"""
+        if len(values) != len(self.ordering):
+            raise ValueError('Invalid cursor')
+        try:
+            values = [self.queryset.model._meta.get_field(field.lstrip('-')).to_python(value)
+                      for field, value in zip(self.ordering, values)]
+        except (ValidationError, TypeError):
+            raise ValueError('Invalid cursor')
+        condition = Q()
+        for position, field in enumerate(self.ordering):
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            name = field.lstrip('-')
+            equal = {ordering.lstrip('-'): value for ordering, value in zip(self.ordering[:position], values)}
+            condition |= Q(**equal, **{f'{name}__{lookup}': values[position]})
+        # Inclusive bound on the first column lets the database use index range scan instead of checking the whole OR
+        first = self.ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': values[0]}) & condition
+
+    def get_page(self, cursor=None):
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self._after(decode_cursor(cursor)))
+        rows = list(queryset[:self.per_page + 1])    # One extra row tells if there is next page
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            last = rows[-1]
+            next_cursor = encode_cursor([getattr(last, field.lstrip('-')) for field in self.ordering])
+        return CursorPage(rows, next_cursor)
+
+
+class KeysetPaginationMixin:
+    """Opt-in cursor pagination for ListView, enabled by 'cursor' parameter in the URL (empty cursor means first page)"""
+    keyset_ordering = None
+
+    def paginate_queryset(self, queryset, page_size):
+        if 'cursor' not in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, self.keyset_ordering, page_size)
+        try:
+            page = paginator.get_page(self.request.GET['cursor'])
+        except ValueError:
+            raise Http404('Invalid cursor')
+        return (paginator, page, page.object_list, page.has_next())
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cursor_pagination'] = 'cursor' in self.request.GET
+        return context
+
+
+class PageNumberAPIPagination(PageNumberPagination):
+    """Default API pagination, client can ask for smaller or bigger pages with ?page_size= (up to max_page_size)"""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    async def paginate_queryset_async(self, queryset, request, view=None):
+        """paginate_queryset() for async views, counts and reads the page at the same time"""
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        page_number = request.query_params.get(self.page_query_param, 1)
+        if page_number in self.last_page_strings:   # Needs the count first
+            return await run_query(super().paginate_queryset, queryset, request, view)
+        self.request = request
+        paginator = self.django_paginator_class(queryset, page_size)
+        try:
+            self.page = await load_page(paginator, page_number)
+        except InvalidPage as error:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(error)))
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return list(self.page)
+
+
+class KeysetAPIPagination(PageNumberAPIPagination):
+    """DRF version of KeysetPaginationMixin, uses 'keyset_ordering' of the view.
+    Without 'cursor' parameter it works like PageNumberAPIPagination"""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page = None
+        if 'cursor' not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        paginator = KeysetPaginator(queryset, view.keyset_ordering, self.get_page_size(request))
+        try:
+            self.cursor_page = paginator.get_page(request.query_params['cursor'])
+        except ValueError:
+            raise NotFound('Invalid cursor')
+        return list(self.cursor_page)
+
+    async def paginate_queryset_async(self, queryset, request, view=None):
+        self.page = None
+        if 'cursor' not in request.query_params:
+            return await super().paginate_queryset_async(queryset, request, view)
+        return await run_query(self.paginate_queryset, queryset, request, view)
+
+    def get_next_link(self):
+        if self.page is not None:
+            return super().get_next_link()
+        if not self.cursor_page.has_next():
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), 'cursor', self.cursor_page.next_cursor)
+
+    def get_paginated_response(self, data):
+        if self.page is not None:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -0,0 +1,103 @@
+"""Rating stats of auctions and sellers (models.AuctionRating and models.SellerRating). Signals add and remove
+every created, edited or deleted opinion with one UPDATE per row, so reading an average or a reputation
+never touches the opinions"""
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Auction, AuctionRating, Opinion, SellerRating
+
+RATINGS = range(1, 11)
+# Stats model, field of Opinion grouping its rows and the way from the opinion to the key of the stats row
+SCOPES = (
+    (AuctionRating, 'auction', lambda opinion: opinion.auction_id),
+    (SellerRating, 'auction__seller', lambda opinion: opinion.seller_id),
+)
+FIELDS = ('count', 'total', *(f'rating_{rating}' for rating in RATINGS))
+
+
+def stats():
+    """Aggregate expressions counting every stats field from opinions"""
+    return {
+        'count': Count('id'),
+        'total': Coalesce(Sum('rating'), 0),
+        **{f'rating_{rating}': Count('id', filter=Q(rating=rating)) for rating in RATINGS},
+    }
+
+
+def change(model, key, rating, sign):
+    """Adds (sign=1) or removes (sign=-1) one rating. A missing row means nothing was rated yet (the migration
+    counted older opinions), so the first rating creates it empty and adds itself like any other. Counting it
+    from opinions instead would race: an opinion saved meanwhile would be in the count and add itself again.
+    Removing from a missing row does nothing, the row may have been deleted together with its auction or seller"""
+    changes = {'count': F('count') + sign, 'total': F('total') + sign * rating}
+    if rating in RATINGS:   # Validators keep ratings in 1-10, but the ORM can save anything
+        changes[f'rating_{rating}'] = F(f'rating_{rating}') + sign
+    rows = model.objects.filter(pk=key)
+    if not rows.update(**changes) and sign > 0:
+        model.objects.get_or_create(pk=key)     # Concurrent first ratings both get the one row
+        rows.update(**changes)
+
+
+def update(opinion, old_rating, new_rating):
+    """Moves the opinion from old_rating to new_rating (None when it is created or deleted) in stats of
+    its auction and of the seller"""
+    if old_rating == new_rating:
+        return
+    if not hasattr(opinion, 'seller_id'):   # Read once per instance, EditOpinion saves twice
+        opinion.seller_id = Auction.objects.filter(pk=opinion.auction_id).values_list('seller_id', flat=True).first()
+    for model, _, key_of in SCOPES:
+        key = key_of(opinion)
+        if key is None:     # Auction is gone already
+            continue
+        if old_rating is not None:
+            change(model, key, old_rating, -1)
+        if new_rating is not None:
+            change(model, key, new_rating, 1)
+
+
+def recount(opinion):
+    """Counts stats of the opinion's auction and seller from scratch (when the old rating isn't known)"""
+    opinion.seller_id = Auction.objects.filter(pk=opinion.auction_id).values_list('seller_id', flat=True).first()
+    for model, lookup, key_of in SCOPES:
+        key = key_of(opinion)
+        if key is not None:
+            model.objects.update_or_create(pk=key, defaults=Opinion.objects.filter(**{lookup: key}).aggregate(**stats()))
+
+
+def stats_of(instance, name):
+    """Stats row of the instance (e.g. stats_of(auction, 'rating')) or None when nothing is rated yet"""
+    try:
+        return getattr(instance, name)
+    except ObjectDoesNotExist:
+        return None
+
+
+def counted(lookup):
+    """{key: {field: value}} counted from opinions"""
+    rows = Opinion.objects.order_by().values(lookup).annotate(**stats())
+    return {row.pop(lookup): row for row in rows}
+
+
+def rebuild_ratings():
+    """Counts stats of every auction and seller from scratch, returns number of rows of both"""
+    rebuilt = 0
+    for model, lookup, _ in SCOPES:
+        rows = counted(lookup)
+        model.objects.all().delete()
+        model.objects.bulk_create((model(pk=key, **values) for key, values in rows.items()), batch_size=1000)
+        rebuilt += len(rows)
+    return rebuilt
+
+
+def inconsistent_ratings():
+    """Returns (model name, key) of stats rows which don't match the opinions"""
+    wrong = []
+    for model, lookup, _ in SCOPES:
+        stored = {row.pop('pk'): row for row in model.objects.values('pk', *FIELDS).iterator()}
+        for key, values in counted(lookup).items():
+            if stored.pop(key, None) != values:
+                wrong.append((model.__name__, key))
+        # Rows of auctions and sellers with no opinions left are fine when they count nothing
+        wrong += [(model.__name__, key) for key, values in stored.items() if any(values.values())]
+    return wrong
@@ -0,0 +1,48 @@
+import time
+
+from django.db.models import Min
+from django.utils import timezone
+
+from .db_backends import write_transaction
+from .models import Auction
+from . import counters, live, page_cache
+
+
+def close_finished_auctions(now=None):
+    """Moves every available auction past its end date to 'sold' (if it has bids) or 'expired'.
+    Uses two bulk UPDATEs, only keys of the closed auctions are loaded (to announce them to live pages).
+    Closed rows are locked first, so a bid can't change bid_count or end_date between the read and the UPDATEs"""
+    if now is None:
+        now = timezone.now()
+    with write_transaction():
+        finished = Auction.objects.filter(status='available', end_date__lt=now)
+        closing = list(finished.select_for_update().values_list('pk', 'bid_count'))
+        sold = finished.filter(bid_count__gt=0).update(status='sold')     # Sold must go first, otherwise everything would be expired
+        expired = finished.update(status='expired')
+        if sold or expired:     # Bulk UPDATE doesn't send signals
+            page_cache.bump('auction')      # Cache tokens and live events are sent on commit
+            counters.increment({'auctions_available': -(sold + expired), 'auctions_sold': sold, 'auctions_expired': expired})
+            for pk, bid_count in closing:
+                live.publish_status(pk, 'sold' if bid_count else 'expired')
+    return {'sold': sold, 'expired': expired}
+
+
+def next_deadline():
+    """Returns the nearest end date of an available auction (None if there is no such auction)"""
+    return Auction.objects.filter(status='available').aggregate(Min('end_date'))['end_date__min']
+
+
+def run_scheduler(interval=60, stdout=None):
+    """Long-running loop which closes auctions as their deadlines pass.
+    It sleeps until the nearest deadline, but never longer than 'interval' seconds
+    (new auctions or bids extending end dates are picked up on the next wake-up)"""
+    while True:
+        result = close_finished_auctions()
+        if stdout and (result['sold'] or result['expired']):
+            stdout.write(f"Closed auctions: {result['sold']} sold, {result['expired']} expired")
+        deadline = next_deadline()
+        sleep_for = interval
+        if deadline is not None:
+            seconds_left = (deadline - timezone.now()).total_seconds()
+            sleep_for = min(interval, max(seconds_left, 1))
+        time.sleep(sleep_for)
@@ -0,0 +1,114 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import SearchDocument, Item, Auction, Category
+
+
+FTS_TABLE = 'auctions_searchdocument_fts'   # SQLite FTS5 table created by migration 0040
+KIND_MODELS = {
+    'item': Item,
+    'auction': Auction,
+    'category': Category,
+}
+
+
+def kind_of(instance):
+    for kind, model in KIND_MODELS.items():
+        if isinstance(instance, model):
+            return kind
+    return None
+
+
+def object_key(instance):
+    """Primary key in the same format as the database stores it (migration copies raw column values)"""
+    return str(instance._meta.pk.get_db_prep_value(instance.pk, connection))
+
+
+def index_object(instance):
+    """Adds or updates search document of item, auction or category"""
+    SearchDocument.objects.update_or_create(
+        kind=kind_of(instance),
+        object_id=object_key(instance),
+        defaults={
+            'name': instance.name,
+            'description': getattr(instance, 'description', ''),
+        })
+
+
+def index_new_objects(instances):
+    """Creates search documents of objects created with bulk_create() (which doesn't send signals) in one INSERT"""
+    SearchDocument.objects.bulk_create([
+        SearchDocument(
+            kind=kind_of(instance),
+            object_id=object_key(instance),
+            name=instance.name,
+            description=getattr(instance, 'description', ''))
+        for instance in instances])
+
+
+def unindex_object(instance):
+    SearchDocument.objects.filter(kind=kind_of(instance), object_id=object_key(instance)).delete()
+
+
+def rebuild_index(batch_size=10000):
+    """Recreates all search documents (use it after bulk_create or raw SQL changes, which do not send signals)"""
+    SearchDocument.objects.all().delete()
+    for kind, model in KIND_MODELS.items():
+        documents = []
+        fields = ['pk', 'name', 'description'] if kind != 'auction' else ['pk', 'name']
+        for row in model.objects.values_list(*fields).iterator(chunk_size=batch_size):
+            pk = model._meta.pk.get_db_prep_value(row[0], connection)
+            documents.append(SearchDocument(
+                kind=kind,
+                object_id=str(pk),
+                name=row[1],
+                description=row[2] if len(row) > 2 else ''))
+            if len(documents) == batch_size:
+                SearchDocument.objects.bulk_create(documents)
+                documents = []
+        SearchDocument.objects.bulk_create(documents)
+
+
+def match_expression(query):
+    """Turns user input into full-text query where every word has to match as a prefix"""
+    words = re.findall(r'\w+', query.lower())
+    if not words:
+        return None
+    if connection.vendor == 'postgresql':
+        return ' & '.join(f'{word}:*' for word in words)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_ids(query, kind, limit, offset=0):
+    """Returns ids of objects of given kind matching the query, best matches (name is worth more than description) first"""
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    if connection.vendor == 'sqlite':
+        sql = (f'SELECT document.object_id FROM {FTS_TABLE} '
+               f'JOIN auctions_searchdocument document ON document.id = {FTS_TABLE}.rowid '
+               f'WHERE {FTS_TABLE} MATCH %s AND document.kind = %s '
+               f'ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s OFFSET %s')
+        params = [expression, kind, limit, offset]
+    elif connection.vendor == 'postgresql':
+        sql = ("SELECT object_id FROM auctions_searchdocument "
+               "WHERE document @@ to_tsquery('simple', %s) AND kind = %s "
+               "ORDER BY ts_rank(document, to_tsquery('simple', %s)) DESC LIMIT %s OFFSET %s")
+        params = [expression, kind, expression, limit, offset]
+    else:   # No full-text index for other databases
+        documents = SearchDocument.objects.filter(kind=kind).filter(Q(name__icontains=query) | Q(description__icontains=query))
+        return list(documents.values_list('object_id', flat=True)[offset:offset + limit])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search(query, kind, page=1, per_page=10):
+    """Returns one page of ranked items, auctions or categories matching the query"""
+    model = KIND_MODELS[kind]
+    ids = search_ids(query, kind, per_page, (page - 1) * per_page)
+    keys = [model._meta.pk.to_python(object_id) for object_id in ids]
+    objects = model.objects.in_bulk(keys)
+    return [objects[key] for key in keys if key in objects]
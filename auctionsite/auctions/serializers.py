@@ -7,31 +7,55 @@ from .models import Auction, Opinion, Item, Category, Account
 User = get_user_model()
 
 
-class AuctionSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """Lets clients ask only for the fields they need with ?fields=id,name (unknown names are ignored).
+    Works only for reading, so writes still validate every field"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        query_params = getattr(request, 'query_params', {})
+        if request is None or request.method != 'GET' or not query_params.get('fields'):
+            return
+        wanted = {name.strip() for name in query_params['fields'].split(',')}
+        for name in set(self.fields) - wanted:
+            self.fields.pop(name)
+
+
+class AuctionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Auction
         fields = ['id', 'name', 'item', 'min_price', 'buy_now_price', 'end_date', 'seller', 'buyer', 'status']
 
 
-class OpinionSerializer(serializers.ModelSerializer):
+class OpinionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Opinion
         fields = ['id', 'auction', 'reviewer', 'rating', 'comment', 'date_created', 'date_edited']
 
 
-class ItemSerializer(serializers.ModelSerializer):
+class ItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Item with URLs of smaller copies of its image (image_variants)"""
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Item
-        fields = ['id', 'name', 'description', 'image', 'category']
+        fields = ['id', 'name', 'description', 'image', 'image_variants', 'category']
+
+    def get_image_variants(self, obj):
+        request = self.context.get('request')
+        urls = obj.image_variants
+        if request is not None:
+            urls = {name: request.build_absolute_uri(url) for name, url in urls.items()}
+        return urls
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'description']
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Get user and his account data(phone_number)"""
     phone_number = serializers.SerializerMethodField()
 
@@ -41,4 +65,5 @@ class UserSerializer(serializers.ModelSerializer):
 
 
     def get_phone_number(self, obj):
-        return obj.account.phone_number
\ No newline at end of file
+        account = getattr(obj, 'account', None)    # Users created without Account (e.g. createsuperuser)
+        return account.phone_number if account else None
\ No newline at end of file
@@ -0,0 +1,147 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Item, Auction, Category, Bid, Opinion
+from . import counters, images, live, page_cache, ratings, search
+from .autocomplete import autocomplete
+from .storage import image_storage
+
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=Auction)
+@receiver(post_save, sender=Category)
+def update_search_index(sender, instance, **kwargs):
+    """Keeps search documents and autocomplete index (once the transaction commits) in sync with items, auctions
+    and categories"""
+    search.index_object(instance)
+    autocomplete.update(instance)
+
+
+@receiver(post_delete, sender=Item)
+@receiver(post_delete, sender=Auction)
+@receiver(post_delete, sender=Category)
+def remove_from_search_index(sender, instance, **kwargs):
+    search.unindex_object(instance)
+    autocomplete.remove(instance)
+
+
+@receiver(post_save, sender=User)
+def count_new_user(sender, instance, created, **kwargs):
+    if created:
+        counters.increment({'users': 1})
+
+
+@receiver(post_delete, sender=User)
+def count_deleted_user(sender, instance, **kwargs):
+    counters.increment({'users': -1})
+
+
+@receiver(post_save, sender=Auction)
+def publish_status_change(sender, instance, created, **kwargs):
+    """Has to be connected before count_auction, which updates saved_status"""
+    saved_status = getattr(instance, 'saved_status', None)
+    if not created and saved_status is not None and saved_status != instance.status:
+        live.publish_status(instance.pk, instance.status)
+
+
+@receiver(post_save, sender=Auction)
+def count_auction(sender, instance, created, **kwargs):
+    """Counts new auctions and status changes made by save() (bulk changes are counted by the scheduler)"""
+    saved_status = getattr(instance, 'saved_status', None)
+    if created:
+        counters.increment({'auctions': 1, f'auctions_{instance.status}': 1})
+    elif saved_status is not None and saved_status != instance.status:
+        counters.increment({f'auctions_{saved_status}': -1, f'auctions_{instance.status}': 1})
+    instance.saved_status = instance.status
+
+
+@receiver(post_delete, sender=Auction)
+def count_deleted_auction(sender, instance, **kwargs):
+    counters.increment({'auctions': -1, f'auctions_{instance.status}': -1})
+
+
+@receiver(post_save, sender=Auction)
+@receiver(post_delete, sender=Auction)
+def bump_auction_version(sender, instance, **kwargs):
+    page_cache.bump('auction', instance.pk)
+
+
+@receiver(post_save, sender=Opinion)
+def count_rating(sender, instance, created, **kwargs):
+    """Adds new opinion to rating stats of its auction and seller, or moves edited one to its new rating"""
+    if created:
+        ratings.update(instance, None, instance.rating)
+    elif hasattr(instance, 'saved_rating'):
+        ratings.update(instance, instance.saved_rating, instance.rating)
+    else:   # Saved over an existing row without reading it first
+        ratings.recount(instance)
+    instance.saved_rating = instance.rating
+
+
+@receiver(post_delete, sender=Opinion)
+def uncount_rating(sender, instance, **kwargs):
+    ratings.update(instance, getattr(instance, 'saved_rating', instance.rating), None)
+
+
+@receiver(post_save, sender=Bid)
+@receiver(post_save, sender=Opinion)
+@receiver(post_delete, sender=Bid)
+@receiver(post_delete, sender=Opinion)
+def bump_version_of_auction(sender, instance, **kwargs):
+    """Bids and opinions are shown on pages of their auction"""
+    page_cache.bump('auction', instance.auction_id)
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def bump_item_version(sender, instance, created=False, **kwargs):
+    page_cache.bump('item', instance.pk)
+    if not created:     # Auction pages show item name
+        for auction_id in Auction.objects.filter(item=instance).values_list('pk', flat=True):
+            page_cache.bump('auction', auction_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_category_version(sender, instance, created=False, **kwargs):
+    page_cache.bump('category', instance.pk)
+    if not created:     # Item pages show category name
+        page_cache.bump('item')
+
+
+@receiver(post_save, sender=Item)
+def create_image_variants(sender, instance, **kwargs):
+    """Thumbnails are created on upload, so the first page showing the item doesn't have to wait for them"""
+    if instance.image:
+        try:
+            images.generate_variants(instance.image)
+        except (OSError, ValueError):
+            pass    # Not an image, variant_urls() will show no variants
+
+
+def release_image(name):
+    """Removes reference of an item to the image file after commit (file and thumbnails go with the last reference)"""
+    def release():
+        image_storage.delete(name)
+        if not image_storage.exists(name):
+            images.delete_variants(name)
+    transaction.on_commit(release)
+
+
+@receiver(post_save, sender=Item)
+def release_replaced_image(sender, instance, **kwargs):
+    saved_image = getattr(instance, 'saved_image', None)
+    if saved_image and saved_image != instance.image.name:
+        release_image(saved_image)
+    instance.saved_image = instance.image.name
+
+
+@receiver(post_delete, sender=Item)
+def release_deleted_image(sender, instance, **kwargs):
+    if instance.image:
+        release_image(instance.image.name)
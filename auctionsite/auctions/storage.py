@@ -0,0 +1,132 @@
+import hashlib
+import os
+import re
+import tempfile
+from collections import Counter
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+
+BLOB_NAME = re.compile(r'(^|/)([0-9a-f]{2})/\2[0-9a-f]{62}(\.\w+)?$')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores every file once under the SHA-256 of its content, e.g. images/photo.jpg -> images/3f/3fa4...e1.jpg.
+    Uploading the same content again returns the existing name and adds a reference (MediaBlob), delete()
+    removes a reference and deletes the file only when nothing uses it anymore"""
+    chunk_size = 64 * 1024
+
+    @staticmethod
+    def blob_name(name, digest):
+        directory, extension = os.path.dirname(name), os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension).replace('\\', '/')
+
+    @staticmethod
+    def is_blob_name(name):
+        return bool(BLOB_NAME.search(name))
+
+    def digest(self, name):
+        digest = hashlib.sha256()
+        with self.open(name) as file:
+            for chunk in file.chunks(self.chunk_size):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get_available_name(self, name, max_length=None):
+        return name     # Final name is known after hashing, see _save()
+
+    def _save(self, name, content):
+        """Hashes the content while writing it to a temporary file next to the final place, then moves it there
+        (or throws it away if the blob already exists). Whole file is never kept in memory"""
+        digest = hashlib.sha256()
+        directory = self.path(os.path.dirname(name) or '.')
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, prefix='.upload-', delete=False) as temporary:
+            for chunk in content.chunks(self.chunk_size):
+                digest.update(chunk)
+                temporary.write(chunk)
+        final_name = self.blob_name(name, digest.hexdigest())
+        final_path = self.path(final_name)
+        if os.path.exists(final_path):
+            os.remove(temporary.name)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(temporary.name, final_path)      # Atomic, concurrent uploads of the same content are fine
+            if self.file_permissions_mode is not None:
+                os.chmod(final_path, self.file_permissions_mode)
+        self.add_reference(final_name, os.path.getsize(final_path))
+        return final_name
+
+    def add_reference(self, name, size, count=1):
+        from .models import MediaBlob
+        if not MediaBlob.objects.filter(name=name).update(references=F('references') + count):
+            try:
+                with transaction.atomic():
+                    MediaBlob.objects.create(name=name, size=size, references=count)
+            except IntegrityError:  # Created by a concurrent upload
+                MediaBlob.objects.filter(name=name).update(references=F('references') + count)
+
+    def delete(self, name):
+        """Removes one reference, the file is deleted with the last one. Files without MediaBlob
+        (e.g. saved before deduplication) are deleted right away"""
+        from .models import MediaBlob
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.references > 1:
+                blob.references -= 1
+                blob.save(update_fields=['references'])
+                return
+            if blob is not None:
+                blob.delete()
+        super().delete(name)
+
+
+image_storage = ContentAddressedStorage()
+
+
+def get_image_storage():
+    """Storage of Item.image (callable, so migrations don't depend on storage settings)"""
+    return image_storage
+
+
+def deduplicate_media(directory='images', dry_run=False, storage=image_storage):
+    """Moves files saved by the old storage (and files used by items) into content-addressed names.
+    Copies of the same content become one blob, items are pointed to it and references are counted.
+    Returns {'files': ..., 'duplicates': ..., 'freed_bytes': ..., 'missing': ...}"""
+    from .models import Item
+    from . import images, page_cache
+
+    references = Counter(Item.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True))
+    names = set(references)
+    if storage.exists(directory):
+        names.update(f'{directory}/{name}' for name in storage.listdir(directory)[1] if not name.startswith('.'))
+    result = {'files': 0, 'duplicates': 0, 'freed_bytes': 0, 'missing': 0}
+    blobs = set()
+    for name in sorted(names):
+        if storage.is_blob_name(name):
+            continue
+        if not storage.exists(name):
+            result['missing'] += 1
+            continue
+        result['files'] += 1
+        size = storage.size(name)
+        blob = storage.blob_name(name, storage.digest(name))
+        if blob in blobs or storage.exists(blob):
+            result['duplicates'] += 1
+            result['freed_bytes'] += size
+        blobs.add(blob)
+        if dry_run:
+            continue
+        if storage.exists(blob):
+            os.remove(storage.path(name))
+        else:
+            os.makedirs(os.path.dirname(storage.path(blob)), exist_ok=True)
+            os.replace(storage.path(name), storage.path(blob))
+        Item.objects.filter(image=name).update(image=blob)
+        storage.add_reference(blob, size, references[name])     # Unused files are kept with 0 references
+        images.delete_variants(name)
+    if not dry_run and result['files']:
+        page_cache.bump('item')     # Item pages show image URLs, bulk UPDATE doesn't send signals
+    return result
@@ -1,12 +1,39 @@
+import base64
+import hashlib
+import json
 import pytest
+import shutil
+import threading
+import time
+import uuid
 
 from datetime import datetime, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from PIL import Image as PILImage
 
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.mail.backends import locmem
+from django.core.paginator import Paginator
+from django.db import connection, close_old_connections, transaction
 from django.utils import timezone
+from rest_framework.test import APIClient
 
-from .models import Auction, Item, Category, Bid, Opinion
+from .models import Auction, Item, Category, Bid, Opinion, Notification, SearchDocument, Account, MediaBlob
+from .scheduler import close_finished_auctions
+from .bidding import place_bid, BidRejected
+from .notifications import send_notifications
+from .autocomplete import autocomplete
+from .counters import get_counters, reconcile
+from .bid_series import bid_series, bucket_width
+from . import bidding, images, notifications, page_cache, search
 
 @pytest.mark.django_db
 def test_home_page(client):
@@ -85,18 +112,157 @@ def test_auction_list_filter(auctions_create, client):
     assert 'auctions/expired_auction_list.html' in [t.name for t in response.templates] # Check if good template is used
 
 
+@pytest.mark.django_db
+def test_auction_list_filter_paginates_matching_rows(one_auction, client, django_assert_num_queries):
+    """Status filter should be done by the database, pages should be full and cost the same number of queries"""
+    for number in range(25):
+        Auction.objects.create(
+            name=f'auction {number}',
+            item=one_auction.item,
+            min_price=20,
+            end_date=timezone.now(),
+            seller=one_auction.seller,
+            status='sold' if number % 2 else 'expired')
+    for page, expected in ((1, 10), (2, 3)):
+        with django_assert_num_queries(2):  # COUNT and SELECT of one page
+            response = client.get('/auctions/', {'status': 'expired', 'page': page})
+        auctions = response.context['auctions']
+        assert len(auctions) == expected
+        assert all(auction.status == 'expired' for auction in auctions)
+    assert response.context['paginator'].count == 13
+
+
+@pytest.mark.django_db
+def test_auction_list_cursor_pagination(one_auction, client, django_assert_num_queries):
+    """Cursor pagination should return every auction once (even with equal end dates) without COUNT query"""
+    end_date = timezone.now()
+    for number in range(24):
+        Auction.objects.create(
+            name=f'auction {number}',
+            item=one_auction.item,
+            min_price=20,
+            end_date=end_date,
+            seller=one_auction.seller)
+    seen = []
+    cursor = ''
+    while cursor is not None:
+        with django_assert_num_queries(1):
+            response = client.get('/auctions/', {'cursor': cursor})
+        assert response.context['cursor_pagination']
+        seen += [auction.pk for auction in response.context['auctions']]
+        cursor = response.context['page_obj'].next_cursor
+    assert len(seen) == 25
+    assert set(seen) == set(Auction.objects.values_list('pk', flat=True))
+
+
+@pytest.mark.django_db
+def test_auction_list_invalid_cursor(auctions_create, client):
+    """Broken cursor should return 404 like invalid page number"""
+    response = client.get('/auctions/', {'cursor': 'broken'})
+    assert response.status_code == 404
+    User.objects.create_user(username='profile', password='12345')
+    bad_values = base64.urlsafe_b64encode(json.dumps(['notadate', 'x']).encode()).decode()   # Decodes, doesn't filter
+    for url in ('/auctions/', '/api/auctions/', '/items/', '/api/items/', '/user/profile'):
+        assert client.get(url, {'cursor': bad_values}).status_code == 404
+
+
+@pytest.mark.django_db
+def test_api_auctions_cursor_pagination(auctions_create, client):
+    """API uses page numbers by default and cursor pagination (without count) if cursor parameter is used"""
+    data = client.get('/api/auctions/').json()
+    assert data['count'] == 5
+    assert len(data['results']) == 5
+    response = client.get('/api/auctions/', {'cursor': ''})
+    data = response.json()
+    assert 'count' not in data
+    assert len(data['results']) == 5
+    assert data['next'] is None
+
+
+@pytest.mark.django_db
+def test_api_page_size_cap(client):
+    """Lists are paginated and client can't ask for a page bigger than max_page_size"""
+    Category.objects.bulk_create(Category(name=f'category{number}', description='test') for number in range(120))
+    data = client.get('/api/categories/').json()
+    assert data['count'] == 120
+    assert len(data['results']) == 20
+    assert len(client.get('/api/categories/', {'page_size': 5}).json()['results']) == 5
+    assert len(client.get('/api/categories/', {'page_size': 1000}).json()['results']) == 100
+
+
+@pytest.mark.django_db
+def test_api_auctions_filters(one_auction, client):
+    """Auctions can be filtered by status, seller, category and end date range"""
+    other_category = Category.objects.create(name='other', description='test')
+    other_item = Item.objects.create(name='other', description='test', category=other_category)
+    other_seller = User.objects.create_user(username='other_seller', password='12345')
+    now = timezone.now()
+    Auction.objects.create(name='sold', item=one_auction.item, min_price=20, end_date=now - timedelta(days=5),
+                           seller=one_auction.seller, status='sold')
+    Auction.objects.create(name='other', item=other_item, min_price=20, end_date=now + timedelta(days=5),
+                           seller=other_seller)
+
+    def names(**params):
+        return sorted(auction['name'] for auction in client.get('/api/auctions/', params).json()['results'])
+
+    assert names(status='sold') == ['sold']
+    assert names(seller=other_seller.pk) == ['other']
+    assert names(category='other') == ['other']
+    assert names(end_date_after=(now + timedelta(days=1)).isoformat()) == ['other']
+    assert names(end_date_before=(now - timedelta(days=1)).isoformat()) == ['sold']
+    assert client.get('/api/auctions/', {'seller': 'abc'}).status_code == 400
+    assert client.get('/api/auctions/', {'end_date_after': 'tomorrow'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_api_sparse_fields(auctions_create, client):
+    """?fields= returns only asked fields, so the response gets smaller"""
+    full = client.get('/api/auctions/')
+    sparse = client.get('/api/auctions/', {'fields': 'id,name'})
+    assert [set(auction) for auction in sparse.json()['results']] == [{'id', 'name'}] * 5
+    assert len(sparse.content) < len(full.content) / 2
+
+
 @pytest.mark.django_db
 def test_auctions_list_update_status(auction, client):
-    """Create auction that should be expired, tests auction list view"""
-    url = '/auctions/'
-    response = client.get(url)
+    """Create auction that should be expired, tests that the scheduler closes it"""
+    auction.end_date = timezone.now() - timedelta(days=1)
+    auction.save()
+    result = close_finished_auctions()
     expired_auction = Auction.objects.get(pk=auction.pk)
-    expired_auction.end_date = datetime.now() - timedelta(days=1)
-    expired_auction.save()
-    assert response.status_code == 200
+    assert result == {'sold': 0, 'expired': 1}
     assert expired_auction.status == 'expired'
 
 
+@pytest.mark.django_db
+def test_close_finished_auctions_sold(one_auction, user_create):
+    """Auction with bids should be sold, auction which is still running should stay available"""
+    place_bid(one_auction.pk, user_create, 30)
+    Auction.objects.filter(pk=one_auction.pk).update(end_date=timezone.now() - timedelta(days=1))
+    running_auction = Auction.objects.create(
+        name='running',
+        item=one_auction.item,
+        min_price=20,
+        end_date=timezone.now() + timedelta(days=1),
+        seller=one_auction.seller)
+    result = close_finished_auctions()
+    one_auction.refresh_from_db()
+    running_auction.refresh_from_db()
+    assert result == {'sold': 1, 'expired': 0}
+    assert one_auction.status == 'sold'
+    assert running_auction.status == 'available'
+
+
+@pytest.mark.django_db
+def test_auctions_list_is_read_only(auctions_create, client):
+    """Auction list view should not write to the database"""
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get('/auctions/')
+    assert response.status_code == 200
+    assert not [q for q in queries if q['sql'].startswith(('UPDATE', 'INSERT'))]
+    assert Auction.objects.filter(status='available').count() == 5
+
+
 @pytest.mark.django_db
 def test_auction_details(auction, client):
     """Tests auction details view"""
@@ -245,6 +411,17 @@ def test_buy_now_post(client, user_create, auction):
     assert auction.buyer == user_create
 
 
+@pytest.mark.django_db
+def test_buy_now_post_ended_auction(client, user_create, one_auction):
+    """Auction past its end date can't be bought before the scheduler marks it expired"""
+    client.force_login(user_create)
+    Auction.objects.filter(pk=one_auction.pk).update(end_date=timezone.now() - timedelta(minutes=5))
+    response = client.post(f'/buy-now/{one_auction.pk}', {'buyer': user_create.pk, 'status': 'sold'})
+    one_auction.refresh_from_db()
+    assert response.status_code == 302
+    assert response.url == f'/auction/{one_auction.pk}/'
+    assert (one_auction.status, one_auction.buyer) == ('available', None)
+
 @pytest.mark.django_db
 def test_add_item(category_object, client):
     """Test AddItem view"""
@@ -354,7 +531,212 @@ def test_bid_auction_post(client, one_auction, user_create):
     assert response.url == f'/auction/{one_auction.id}'
     assert one_auction.min_price == 50
     assert one_auction.buyer == user_create
-    
+
+
+@pytest.mark.django_db
+def test_place_bid(one_auction, user_create):
+    """Accepted bid changes auction, extends its end and returns previous buyer"""
+    one_auction.refresh_from_db()
+    end_date = one_auction.end_date
+    bid, previous_buyer = place_bid(one_auction.pk, user_create, 50)
+    one_auction.refresh_from_db()
+    assert previous_buyer is None
+    assert bid.amount == 50 and bid.bidder == user_create
+    assert one_auction.min_price == 50
+    assert one_auction.buyer == user_create
+    assert one_auction.end_date == end_date + timedelta(minutes=20)
+    with pytest.raises(BidRejected):
+        place_bid(one_auction.pk, user_create, 60)  # Last bidder cannot bid again
+    with pytest.raises(BidRejected):
+        place_bid(one_auction.pk, one_auction.seller, 60)
+
+
+@pytest.mark.django_db
+def test_place_bid_lost_race(one_auction, user_create, monkeypatch):
+    """Higher bid accepted between check and update must not be overwritten by lower bid"""
+    competitor = User.objects.create_user(username='competitor', password='12345')
+    original_check = bidding.check_bid
+    calls = []
+
+    def check_with_concurrent_bid(auction, user, amount):
+        original_check(auction, user, amount)
+        if not calls:   # Another request wins the race right after the first check
+            calls.append(amount)
+            place_bid(auction.pk, competitor, 100)
+
+    monkeypatch.setattr(bidding, 'check_bid', check_with_concurrent_bid)
+    with pytest.raises(BidRejected):
+        place_bid(one_auction.pk, user_create, 50)
+    one_auction.refresh_from_db()
+    assert one_auction.min_price == 100
+    assert one_auction.buyer == competitor
+    assert list(Bid.objects.values_list('amount', flat=True)) == [100]
+
+
+@pytest.mark.django_db
+def test_place_bid_on_ended_auction(one_auction, user_create, monkeypatch):
+    """Auction past its end date is closed for bids before the scheduler marks it, also when it ends between the
+    check and the update, and its end date is never extended back into the future"""
+    end_date = timezone.now() - timedelta(minutes=5)
+    Auction.objects.filter(pk=one_auction.pk).update(end_date=end_date)
+    with pytest.raises(BidRejected):
+        place_bid(one_auction.pk, user_create, 50)
+    with pytest.raises(BidRejected):
+        bidding.place_proxy_bid(one_auction.pk, user_create, 50)
+    monkeypatch.setattr(bidding, 'check_bid', lambda auction, user, amount: None)
+    with pytest.raises(BidRejected):     # Conditional UPDATE keeps failing, retries run out
+        place_bid(one_auction.pk, user_create, 50)
+    one_auction.refresh_from_db()
+    assert (one_auction.status, one_auction.end_date, one_auction.buyer) == ('available', end_date, None)
+    assert not Bid.objects.exists()
+
+
+@pytest.mark.django_db
+def test_place_bid_updates_bid_stats(one_auction, user_create):
+    """Bid columns of auction follow accepted bids, rejected bids don't change them"""
+    other_user = User.objects.create_user(username='competitor', password='12345')
+    place_bid(one_auction.pk, user_create, 50)
+    second, _ = place_bid(one_auction.pk, other_user, 70)
+    with pytest.raises(BidRejected):
+        place_bid(one_auction.pk, user_create, 60)
+    one_auction.refresh_from_db()
+    assert one_auction.bid_count == 2
+    assert one_auction.highest_bid == second
+    assert one_auction.last_bid_at == second.time
+    assert bidding.inconsistent_bid_stats() == []
+
+
+@pytest.mark.django_db
+def test_rebuild_bid_stats(one_auction, user_create):
+    """Checker finds auctions with bids created outside place_bid and rebuild fixes them"""
+    bid = Bid.objects.create(amount=30, auction=one_auction, bidder=user_create)
+    assert bidding.inconsistent_bid_stats() == [one_auction.pk]
+    with pytest.raises(CommandError):
+        call_command('rebuild_bid_stats', '--check', stdout=StringIO())
+    call_command('rebuild_bid_stats', stdout=StringIO())
+    one_auction.refresh_from_db()
+    assert (one_auction.bid_count, one_auction.highest_bid, one_auction.last_bid_at) == (1, bid, bid.time)
+    call_command('rebuild_bid_stats', '--check', stdout=StringIO())
+
+
+class SlowEmailBackend(locmem.EmailBackend):
+    """Email backend with slow mail server"""
+    def send_messages(self, messages):
+        time.sleep(1)
+        return super().send_messages(messages)
+
+
+@pytest.mark.django_db
+def test_bid_does_not_wait_for_mail(client, one_auction, user_create, settings):
+    """Outbid email is queued, bid response does not depend on mail delivery time"""
+    settings.EMAIL_BACKEND = 'auctions.tests.SlowEmailBackend'
+    previous_buyer = User.objects.create_user(username='previous', password='12345', email='previous@example.com')
+    place_bid(one_auction.pk, previous_buyer, 30)
+    client.force_login(user_create)
+    start = time.perf_counter()
+    client.post(f'/bid-auction/{one_auction.pk}', {'amount': 50})
+    assert time.perf_counter() - start < 1
+    assert len(mail.outbox) == 0
+    notification = Notification.objects.get()
+    assert notification.recipient == 'previous@example.com'
+    assert notification.sent_at is None
+
+
+@pytest.mark.django_db
+def test_send_notifications_batch(monkeypatch):
+    """Worker sends the whole batch using one connection and does not send it again"""
+    for number in range(5):
+        Notification.objects.create(recipient=f'user{number}@example.com', subject='auction', body='You have been outbid')
+    connections = []
+    original_get_connection = notifications.get_connection
+
+    def counting_get_connection(*args, **kwargs):
+        connections.append(1)
+        return original_get_connection(*args, **kwargs)
+
+    monkeypatch.setattr(notifications, 'get_connection', counting_get_connection)
+    assert send_notifications(batch_size=10) == 5
+    assert len(connections) == 1
+    assert len(mail.outbox) == 5
+    assert send_notifications(batch_size=10) == 0
+    assert not Notification.objects.filter(sent_at__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_outbid_notification_is_part_of_the_bid(one_auction, user_create, monkeypatch):
+    """Notification is written in the bid's transaction, the bid isn't accepted when it can't be queued"""
+    previous_buyer = User.objects.create_user(username='previous', password='12345', email='previous@example.com')
+    place_bid(one_auction.pk, previous_buyer, 30)
+    place_bid(one_auction.pk, user_create, 40)
+    assert list(Notification.objects.values_list('recipient', flat=True)) == ['previous@example.com']
+
+    def crash(*args, **kwargs):
+        raise RuntimeError('outbox is not available')
+
+    monkeypatch.setattr(bidding, 'notify_outbid', crash)
+    with pytest.raises(RuntimeError):
+        place_bid(one_auction.pk, previous_buyer, 50)
+    one_auction.refresh_from_db()
+    assert (one_auction.min_price, one_auction.buyer, Bid.objects.count()) == (40, user_create, 2)
+
+
+@pytest.mark.django_db
+def test_send_notifications_skips_claimed():
+    """Notifications claimed by another worker are not sent twice, unless its claim runs out"""
+    for number in range(5):
+        Notification.objects.create(recipient=f'user{number}@example.com', subject='auction', body='You have been outbid')
+    claimed = notifications.claim('email', 3, timezone.now())     # Another worker is sending these
+    assert send_notifications(batch_size=10) == 2
+    assert sorted(message.to[0] for message in mail.outbox) == sorted(
+        set(Notification.objects.values_list('recipient', flat=True)) - {notification.recipient for notification in claimed})
+    assert send_notifications(batch_size=10) == 0
+    Notification.objects.filter(pk__in=[notification.pk for notification in claimed]).update(
+        claimed_until=timezone.now() - timedelta(seconds=1))     # The worker died
+    assert send_notifications(batch_size=10) == 3
+    assert len(mail.outbox) == 5
+
+
+class FlakyEmailBackend(locmem.EmailBackend):
+    """Email backend refusing messages to 'down@' and silently dropping messages to 'lost@'"""
+    def send_messages(self, messages):
+        recipient = messages[0].to[0]
+        if recipient.startswith('down@'):
+            raise ConnectionError('Mail server is down')
+        return 0 if recipient.startswith('lost@') else super().send_messages(messages)
+
+
+@pytest.mark.django_db
+def test_send_notifications_backs_off_failed(settings, monkeypatch):
+    """Failed notification isn't claimed again before its backoff ends, the backoff grows with every attempt.
+    Only delivered messages count as sent, also when the batch fails after some of them went out"""
+    settings.EMAIL_BACKEND = 'auctions.tests.FlakyEmailBackend'
+    for name in ('ok', 'down', 'lost'):
+        Notification.objects.create(recipient=f'{name}@example.com', subject='auction', body='You have been outbid')
+    start = timezone.now()
+    assert send_notifications(batch_size=10) == 1
+    failed = Notification.objects.filter(sent_at__isnull=True)
+    assert sorted(failed.values_list('recipient', 'attempts')) == [('down@example.com', 1), ('lost@example.com', 1)]
+    assert min(failed.values_list('claimed_until', flat=True)) >= start + notifications.RETRY_DELAY
+    assert send_notifications(batch_size=10) == 0    # Still backing off
+    assert set(failed.values_list('attempts', flat=True)) == {1}
+
+    failed.update(claimed_until=timezone.now() - timedelta(seconds=1))
+    start = timezone.now()
+    assert send_notifications(batch_size=10) == 0
+    assert set(failed.values_list('attempts', flat=True)) == {2}
+    assert min(failed.values_list('claimed_until', flat=True)) >= start + 2 * notifications.RETRY_DELAY
+
+    def closing_fails(batch):   # Messages went out, closing the connection didn't
+        notifications.send_emails(batch)
+        raise ConnectionError('Connection reset')
+
+    monkeypatch.setitem(notifications.SENDERS, 'email', closing_fails)
+    Notification.objects.create(recipient='late@example.com', subject='auction', body='You have been outbid')
+    failed.update(claimed_until=None)
+    assert send_notifications(batch_size=10) == 1
+    assert sorted(Notification.objects.values_list('recipient', 'attempts')) == [
+        ('down@example.com', 3), ('late@example.com', 0), ('lost@example.com', 3), ('ok@example.com', 0)]
+    assert [message.to[0] for message in mail.outbox] == ['ok@example.com', 'late@example.com']
 
 @pytest.mark.django_db
 def test_bid_history(client, auction):
@@ -366,6 +748,56 @@ def test_bid_history(client, auction):
     assert list(response.context['bids']) == list(auction.bid_set.all().order_by('-time'))
 
 
+def count_queries(client, url):
+    """Returns number of queries used to render the page"""
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(queries)
+
+
+def add_rows(auction, user, start, count):
+    """Adds 'count' opinions, bids, auctions, items and categories related to the auction and the user"""
+    for number in range(start, start + count):
+        reviewer = User.objects.create(username=f'reviewer{number}')
+        Opinion.objects.create(auction=auction, reviewer=reviewer, rating=number % 10 + 1, comment='comment')
+        other_auction = Auction.objects.create(
+            name=f'auction {number}',
+            item=auction.item,
+            min_price=20,
+            end_date=timezone.now(),
+            seller=auction.seller,
+            buyer=reviewer)
+        Bid.objects.create(amount=30, auction=other_auction, bidder=user)
+        Bid.objects.create(amount=30 + number, auction=auction, bidder=reviewer)
+        Item.objects.create(name=f'item {number}', description='test', category=auction.item.category, creator=user)
+        Category.objects.create(name=f'category{number}', description='test')
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('url', [
+    '/home/',
+    '/items/',
+    '/items/{auction.item.pk}',
+    '/auctions/',
+    '/auctions/?status=available',
+    '/auctions/?cursor=',
+    '/auction/{auction.pk}/',
+    '/categories/',
+    '/category/{auction.item.category.name}/',
+    '/bids/{auction.pk}',
+    '/user/{user.username}',
+])
+def test_query_count_does_not_grow(client, auction, user_create, url, settings):
+    """Every page should run the same number of queries no matter how many rows it shows"""
+    settings.PAGE_CACHE_ENABLED = False     # Measures queries of rendering, not cache hits
+    url = url.format(auction=auction, user=user_create)
+    add_rows(auction, user_create, 0, 2)
+    queries = count_queries(client, url)
+    add_rows(auction, user_create, 2, 10)
+    assert count_queries(client, url) == queries
+
+
 @pytest.mark.django_db
 def test_search_auction_post(client, auctions_create, category):
     """Test SearchAuction view POST request"""
@@ -377,6 +809,90 @@ def test_search_auction_post(client, auctions_create, category):
     assert list(response.context['category_result']) == list(Category.objects.filter(name__icontains='test'))
 
 
+@pytest.mark.django_db
+def test_search_ranking(client, category_object):
+    """Name matches are ranked before description matches, words are matched as prefixes"""
+    in_description = Item.objects.create(name='lamp', description='old guitar lamp', category=category_object)
+    in_name = Item.objects.create(name='Guitar', description='acoustic', category=category_object)
+    Item.objects.create(name='table', description='wooden', category=category_object)
+    assert search.search('guit', 'item') == [in_name, in_description]
+    response = client.get('/search', {'search': 'guitar'})
+    assert response.context['item_result'] == [in_name, in_description]
+
+
+@pytest.mark.django_db
+def test_search_index_follows_changes(category_object):
+    """Search documents are updated and deleted by signals"""
+    item = Item.objects.create(name='bicycle', description='red', category=category_object)
+    assert search.search('bicycle', 'item') == [item]
+    item.name = 'scooter'
+    item.save()
+    assert search.search('bicycle', 'item') == []
+    assert search.search('scooter', 'item') == [item]
+    item.delete()
+    assert search.search('scooter', 'item') == []
+    assert not SearchDocument.objects.filter(kind='item').exists()
+
+
+@pytest.mark.django_db
+def test_search_pagination(client, category_object):
+    """Results are paginated, next page is linked with GET"""
+    for number in range(15):
+        Item.objects.create(name=f'chair {number}', description='test', category=category_object)
+    response = client.post('/search', {'search': 'chair'})
+    assert len(response.context['item_result']) == 10
+    assert response.context['has_next']
+    response = client.get('/search', {'search': 'chair', 'page': 2})
+    assert len(response.context['item_result']) == 5
+    assert not response.context['has_next']
+
+
+@pytest.mark.django_db
+def test_autocomplete(client, category_object, django_assert_num_queries, django_capture_on_commit_callbacks):
+    """Autocomplete matches word prefixes, is served from memory and follows changes"""
+    autocomplete.clear()
+    Item.objects.create(name='Old guitar', description='test', category=category_object)
+    Item.objects.create(name='Guitar strings', description='test', category=category_object)
+    Item.objects.create(name='Piano', description='test', category=category_object)
+    client.get('/api/autocomplete/', {'q': 'x'})     # First request loads names from the database
+    with django_assert_num_queries(0):
+        response = client.get('/api/autocomplete/', {'q': 'GUI'})
+    names = [item['name'] for item in response.json()['items']]
+    assert sorted(names) == ['Guitar strings', 'Old guitar']
+    assert response.json()['auctions'] == [] and response.json()['categories'] == []
+    with django_capture_on_commit_callbacks(execute=True):
+        violin = Item.objects.create(name='Violin', description='test', category=category_object)
+    with django_assert_num_queries(0):
+        response = client.get('/api/autocomplete/', {'q': 'vio', 'limit': 100})
+    assert response.json()['items'] == [{'id': str(violin.pk), 'name': 'Violin'}]
+    with django_capture_on_commit_callbacks(execute=True):
+        violin.delete()
+    assert client.get('/api/autocomplete/', {'q': 'vio'}).json()['items'] == []
+    with pytest.raises(RuntimeError), transaction.atomic():     # Rolled back names never get in
+        Item.objects.create(name='Viola', description='test', category=category_object)
+        raise RuntimeError
+    assert autocomplete.lookup('vio')['items'] == []
+    autocomplete.clear()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_autocomplete_refreshes_in_background(category_object):
+    """Stale indexes are served while a thread reloads them, changes signalled meanwhile are kept"""
+    autocomplete.clear()
+    Item.objects.create(name='Old guitar', description='test', category=category_object)
+    assert len(autocomplete.lookup('gui')['items']) == 1
+    Item.objects.bulk_create([Item(name='Guitar strings', description='test', category=category_object)])   # No signals
+    autocomplete.expire()
+    assert len(autocomplete.lookup('gui')['items']) == 1    # Old indexes, reload started
+    refresher = autocomplete.refresher
+    Item.objects.create(name='Guitar case', description='test', category=category_object)   # While reloading
+    if refresher is not None:
+        refresher.join()
+    names = sorted(item['name'] for item in autocomplete.lookup('gui')['items'])
+    assert names == ['Guitar case', 'Guitar strings', 'Old guitar']
+    autocomplete.clear()
+
+
 @pytest.mark.django_db
 def test_add_user_post_valid(client):
     """Test AddUser view POST request with valid form"""
@@ -477,4 +993,825 @@ def test_delete_user(client, user_create):
     response = client.post(url)
     assert response.status_code == 302
     assert response.url == '/home'
-    assert User.objects.count() == 0
\ No newline at end of file
+    assert User.objects.count() == 0
+
+@pytest.fixture
+def many_users():
+    """10k users, every second one without Account"""
+    User.objects.bulk_create(User(username=f'user{number}') for number in range(10000))
+    users = User.objects.order_by('id').values_list('pk', flat=True)[::2]
+    Account.objects.bulk_create(Account(user_id=pk, phone_number='123456789') for pk in users)
+
+
+@pytest.fixture
+def staff_api_client():
+    """API client authenticated as staff without a session (no queries for the user)"""
+    client = APIClient()
+    client.force_authenticate(User.objects.create_user(username='staff', password='12345', is_staff=True))
+    return client
+
+
+@pytest.mark.django_db
+def test_api_users_are_staff_only(client, user_create):
+    """Anonymous and ordinary users can't list, export or change users"""
+    for url in ('/api/users/', '/api/users/export/', f'/api/users/{user_create.pk}/'):
+        assert client.get(url).status_code in (401, 403)
+    assert client.post('/api/users/', {'username': 'created'}).status_code in (401, 403)
+    client.force_login(user_create)
+    assert client.get('/api/users/export/').status_code == 403
+    assert client.delete(f'/api/users/{user_create.pk}/').status_code == 403
+    assert User.objects.filter(pk=user_create.pk).exists() and not User.objects.filter(username='created').exists()
+
+
+@pytest.mark.django_db
+def test_api_users_query_count(many_users, staff_api_client, django_assert_num_queries):
+    """Phone numbers are read with users (COUNT and one SELECT for any page size), missing Account gives None"""
+    client = staff_api_client
+    for page_size in (10, 100):
+        with django_assert_num_queries(2):
+            data = client.get('/api/users/', {'page_size': page_size}).json()
+        assert data['count'] == 10001     # And the staff user
+        assert [user['phone_number'] for user in data['results'][:2]] == ['123456789', None]
+
+
+@pytest.mark.django_db
+def test_api_users_export(many_users, staff_api_client, django_assert_num_queries):
+    """Export streams every user with one query"""
+    client = staff_api_client
+    response = client.get('/api/users/export/', {'fields': 'id,phone_number'})
+    assert response.streaming
+    with django_assert_num_queries(1):
+        lines = b''.join(response.streaming_content).splitlines()
+    assert len(lines) == 10001
+    assert json.loads(lines[0]) == {'id': User.objects.order_by('id').first().pk, 'phone_number': '123456789'}
+
+
+@pytest.mark.django_db
+def test_home_page_counters(client, one_auction, user_create, django_assert_num_queries):
+    """Home page reads counters from memory, counters follow new users, status changes and deletes"""
+    client.get('/home/')
+    with django_assert_num_queries(0):
+        response = client.get('/home/')
+    assert response.context['users'] == 3
+    assert response.context['auctions'] == 1
+    place_bid(one_auction.pk, user_create, 50)
+    Auction.objects.create(name='finished', item=one_auction.item, min_price=20,
+                           end_date=timezone.now() - timedelta(days=1), seller=one_auction.seller)
+    one_auction.refresh_from_db()
+    one_auction.end_date = timezone.now() - timedelta(days=1)
+    one_auction.save()
+    close_finished_auctions()
+    User.objects.create_user(username='new_user', password='12345')
+    counters = client.get('/home/').context['counters']
+    assert counters['users'] == 4
+    assert counters['auctions'] == 2
+    assert (counters['auctions_available'], counters['auctions_sold'], counters['auctions_expired']) == (0, 1, 1)
+    auction = Auction.objects.get(pk=one_auction.pk)
+    auction.status = 'available'     # e.g. changed in the admin
+    auction.save()
+    Auction.objects.filter(name='finished').delete()
+    counted = dict(get_counters())
+    assert reconcile() == {**counted, 'active_bidders': 1}     # Active bidders are counted only by reconciliation
+
+
+@pytest.mark.django_db
+def test_page_cache(client, one_auction, user_create, django_assert_num_queries):
+    """Second request is served from the cache, every write related to the page makes it render again"""
+    url = f'/auction/{one_auction.pk}/'
+    first = client.get(url)
+    with django_assert_num_queries(0):
+        cached = client.get(url)
+    assert (first['X-Cache'], cached['X-Cache']) == ('miss', 'hit')
+    assert cached.content == first.content
+    place_bid(one_auction.pk, user_create, 55)
+    response = client.get(url)
+    assert response['X-Cache'] == 'miss' and b'55' in response.content
+    one_auction.item.name = 'renamed item'
+    one_auction.item.save()
+    assert b'renamed item' in client.get(url).content
+    Opinion.objects.create(auction=one_auction, reviewer=user_create, rating=7, comment='new opinion')
+    assert b'new opinion' in client.get(url).content
+    Auction.objects.filter(pk=one_auction.pk).update(end_date=timezone.now() - timedelta(days=1))
+    close_finished_auctions()   # Bulk UPDATE without signals
+    assert b'Status: <span id="live-status">sold</span>' in client.get(url).content
+    assert page_cache.stats.summary()['AuctionDetails'] == {'hits': 1, 'misses': 5, 'hit_ratio': 1 / 6}
+
+
+@pytest.mark.django_db
+def test_page_cache_lists_and_users(client, one_auction, user_create):
+    """Lists follow new rows, logged in user gets own page, pages with messages are not cached"""
+    assert client.get('/auctions/')['X-Cache'] == 'miss'
+    assert client.get('/auctions/')['X-Cache'] == 'hit'
+    Auction.objects.create(name='brand new', item=one_auction.item, min_price=20,
+                           end_date=timezone.now() + timedelta(days=1), seller=one_auction.seller)
+    assert b'brand new' in client.get('/auctions/').content
+    client.force_login(user_create)
+    response = client.get('/auctions/')
+    assert response['X-Cache'] == 'miss' and user_create.username.encode() in response.content
+    client.get('/categories/')
+    Category.objects.create(name='newcategory', description='test')
+    assert b'newcategory' in client.get('/categories/').content
+    client.post(f'/bid-auction/{one_auction.pk}', {'amount': 10})    # Rejected bid leaves error message
+    response = client.get(f'/auction/{one_auction.pk}/', follow=True)
+    assert 'X-Cache' not in response
+
+
+def upload_image(width=2400, height=1600):
+    """Big JPEG like a photo from a phone"""
+    output = BytesIO()
+    PILImage.effect_noise((width, height), 80).convert('RGB').save(output, format='JPEG', quality=95)
+    return SimpleUploadedFile('photo.jpg', output.getvalue(), content_type='image/jpeg')
+
+
+@pytest.mark.django_db
+def test_image_variants(client, category_object, settings, tmp_path):
+    """Upload creates small JPEG and WebP copies, pages and API show them instead of the original"""
+    settings.MEDIA_ROOT = str(tmp_path)
+    item = Item.objects.create(name='photo', description='test', category=category_object, image=upload_image())
+    original_size = item.image.size
+    for size, limit in images.SIZES.items():
+        for image_format in images.FORMATS:
+            path = tmp_path / images.variant_name(item.image.name, size, image_format)
+            with PILImage.open(path) as variant:
+                assert variant.format == image_format.upper()
+                assert max(variant.size) == max(limit)
+    thumbnail = tmp_path / images.variant_name(item.image.name, 'thumbnail', 'webp')
+    assert thumbnail.stat().st_size * 20 < original_size
+    urls = Item.objects.get(pk=item.pk).image_variants
+    content = client.get('/items/').content.decode()
+    assert urls['thumbnail_webp'] in content and item.image.url not in content
+    assert urls['medium_webp'] in client.get(f'/items/{item.pk}').content.decode()
+    data = client.get('/api/items/').json()['results'][0]
+    assert data['image_variants']['thumbnail'] == 'http://testserver' + urls['thumbnail']
+
+
+@pytest.mark.django_db
+def test_image_variants_created_lazily(category_object, settings, tmp_path):
+    """Missing variants (e.g. of images uploaded before) are created on first use, broken image has no variants"""
+    settings.MEDIA_ROOT = str(tmp_path)
+    item = Item.objects.create(name='photo', description='test', category=category_object, image=upload_image(300, 200))
+    shutil.rmtree(tmp_path / images.VARIANTS_DIR)
+    assert set(Item.objects.get(pk=item.pk).image_variants) == {'thumbnail', 'thumbnail_webp', 'medium', 'medium_webp'}
+    assert (tmp_path / images.variant_name(item.image.name, 'medium', 'jpeg')).exists()
+    broken = Item.objects.create(name='broken', description='test', category=category_object,
+                                 image=SimpleUploadedFile('broken.jpg', b'not an image'))
+    assert broken.image_variants == {}
+
+
+@pytest.mark.django_db
+def test_identical_uploads_are_stored_once(category_object, settings, tmp_path, django_capture_on_commit_callbacks):
+    """Same content gets the same file, file is deleted with the last item using it"""
+    settings.MEDIA_ROOT = str(tmp_path)
+    photo = upload_image(300, 200)
+    content = photo.read()
+    first, second = [
+        Item.objects.create(name=f'item {number}', description='test', category=category_object,
+                            image=SimpleUploadedFile(f'copy{number}.jpg', content))
+        for number in range(2)]
+    other = Item.objects.create(name='other', description='test', category=category_object, image=upload_image(300, 200))
+    assert first.image.name == second.image.name != other.image.name
+    assert first.image.name == f'images/{hashlib.sha256(content).hexdigest()[:2]}/{hashlib.sha256(content).hexdigest()}.jpg'
+    assert len([path for path in (tmp_path / 'images').rglob('*') if path.is_file()]) == 2
+    assert MediaBlob.objects.get(name=first.image.name).references == 2
+    path = tmp_path / first.image.name
+    with django_capture_on_commit_callbacks(execute=True):
+        first.delete()
+    assert path.exists() and MediaBlob.objects.get(name=second.image.name).references == 1
+    with django_capture_on_commit_callbacks(execute=True):
+        second.image = SimpleUploadedFile('new.jpg', b'replaced with another file')
+        second.save()
+    assert not path.exists() and not (tmp_path / images.variant_name(first.image.name, 'thumbnail', 'jpeg')).exists()
+    assert not MediaBlob.objects.filter(name=first.image.name).exists()
+
+
+@pytest.mark.django_db
+def test_dedupe_media(category_object, settings, tmp_path):
+    """Command moves old copies into one blob and points items to it"""
+    settings.MEDIA_ROOT = str(tmp_path)
+    (tmp_path / 'images').mkdir()
+    for name in ('cover.jpg', 'cover_Bu6ijz8.jpg', 'cover_EEL9539.jpg'):
+        (tmp_path / 'images' / name).write_bytes(b'cover' * 1000)
+    (tmp_path / 'images' / 'other.png').write_bytes(b'other')
+    item = Item.objects.create(name='cover', description='test', category=category_object)
+    Item.objects.filter(pk=item.pk).update(image='images/cover_EEL9539.jpg')
+    output = StringIO()
+    call_command('dedupe_media', '--dry-run', stdout=output)
+    assert 'duplicates: 2' in output.getvalue()
+    assert len(list((tmp_path / 'images').iterdir())) == 4
+    call_command('dedupe_media', stdout=StringIO())
+    files = [path for path in (tmp_path / 'images').rglob('*') if path.is_file()]
+    assert len(files) == 2
+    item.refresh_from_db()
+    assert item.image.read() == b'cover' * 1000
+    assert MediaBlob.objects.get(name=item.image.name).references == 1
+    assert MediaBlob.objects.exclude(name=item.image.name).get().references == 0    # other.png is not used
+
+
+postgresql_only = pytest.mark.skipif(connection.vendor != 'postgresql', reason='run with DATABASE_ENGINE=postgresql')
+
+
+@postgresql_only
+@pytest.mark.django_db(transaction=True)
+def test_connection_health_check():
+    """Persistent connection killed by the server is replaced at the start of the next request"""
+    import psycopg2
+    connection.ensure_connection()
+    pid = connection.connection.get_backend_pid()
+    killer = psycopg2.connect(**connection.get_connection_params())
+    with killer, killer.cursor() as cursor:
+        cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+    killer.close()
+    close_old_connections()     # Request boundary
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_backend_pid()')
+        assert cursor.fetchone()[0] != pid
+
+
+@postgresql_only
+@pytest.mark.django_db
+def test_connection_pool_waits_for_free_connection():
+    """Pool never opens more than its size, waiting request gets a connection returned by another one"""
+    from psycopg2.pool import PoolError
+    from .db_backends.postgresql.base import BlockingPool
+    pool = BlockingPool(1, 0.1, **connection.get_connection_params())
+    first = pool.getconn()
+    with pytest.raises(PoolError):
+        pool.getconn()
+    threading.Timer(0.05, pool.putconn, [first]).start()
+    pool.timeout = 5
+    assert pool.getconn() is first
+    pool.closeall()
+
+
+def tuned_sqlite_connection(path):
+    from django.db.utils import ConnectionHandler
+    return ConnectionHandler({'default': {'ENGINE': 'auctions.db_backends.sqlite3', 'NAME': str(path)}})['default']
+
+
+@pytest.mark.django_db    # Unblocks connections of the test
+def test_tuned_sqlite_pragmas(tmp_path):
+    tuned = tuned_sqlite_connection(tmp_path / 'tuned.sqlite3')
+    with tuned.cursor() as cursor:
+        for pragma, value in (('journal_mode', 'wal'), ('synchronous', 1), ('busy_timeout', 10000), ('temp_store', 2)):
+            cursor.execute(f'PRAGMA {pragma}')
+            assert cursor.fetchone()[0] == value
+    tuned.close()
+
+
+@pytest.mark.django_db    # Unblocks connections of the test
+def test_tuned_sqlite_immediate_transaction(tmp_path):
+    """Write transaction takes the write lock at BEGIN, so another writer can't start until it ends"""
+    import sqlite3
+    path = tmp_path / 'tuned.sqlite3'
+    tuned = tuned_sqlite_connection(path)
+    other = sqlite3.connect(path, timeout=0, isolation_level=None)
+    for immediate, locked in ((False, False), (True, True)):
+        tuned.immediate_transaction = immediate
+        tuned.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        try:
+            other.execute('BEGIN IMMEDIATE')
+            other.execute('ROLLBACK')
+            assert not locked
+        except sqlite3.OperationalError:
+            assert locked
+        tuned.rollback()
+        tuned.set_autocommit(True)
+    other.close()
+    tuned.close()
+
+
+def test_tuned_sqlite_stress():
+    """Runs the multi-process stress benchmark briefly, writers and readers must not see "database is locked" """
+    import os
+    import subprocess
+    import sys
+    from django.conf import settings
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.sqlite_concurrency', '--writers', '3', '--readers', '3',
+         '--duration', '3', '--auctions', '50', '--check'],
+        cwd=settings.BASE_DIR, env={**os.environ, 'DATABASE_ENGINE': 'sqlite-tuned'},
+        capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert 'lock errors     0' in result.stdout
+
+
+@pytest.mark.django_db(transaction=True)
+def test_live_stream_many_subscribers(one_auction, user_create):
+    """Every client watching the auction gets the accepted bid (with end date extension) and the status change"""
+    import asyncio
+    from asgiref.sync import sync_to_async
+    from .live import broker, auction_channel, router
+    app = router(None)  # Streams don't reach Django application
+    subscribers = 500
+    channel = auction_channel(one_auction.pk)
+
+    async def client(path, messages, disconnect):
+        async def receive():
+            await disconnect.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+        await app({'type': 'http', 'path': path}, receive, send)
+
+    def events(messages):
+        body = b''.join(message.get('body', b'') for message in messages[1:]).decode()
+        return [json.loads(line[len('data: '):]) for line in body.splitlines() if line.startswith('data: ')]
+
+    async def wait_until(condition):
+        for _ in range(1000):
+            if condition():
+                return
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        disconnect = asyncio.Event()
+        inboxes = [[] for _ in range(subscribers)]
+        tasks = [asyncio.ensure_future(client(f'/auction/{one_auction.pk}/events', inbox, disconnect)) for inbox in inboxes]
+        missing = []
+        tasks.append(asyncio.ensure_future(client(f'/auction/{uuid.uuid4()}/events', missing, disconnect)))
+        await wait_until(lambda: all(len(inbox) == 2 for inbox in inboxes))     # Response start and current state
+        assert broker.subscribers(channel) == subscribers
+        await sync_to_async(place_bid)(one_auction.pk, user_create, 50)
+        await sync_to_async(close_finished_auctions)(timezone.now() + timedelta(hours=1))
+        await wait_until(lambda: all(len(inbox) == 4 for inbox in inboxes))
+        disconnect.set()
+        await asyncio.wait_for(asyncio.gather(*tasks), 10)
+        return inboxes, missing
+
+    inboxes, missing = asyncio.run(scenario())
+    assert missing[0]['status'] == 404
+    assert broker.subscribers(channel) == 0
+    for inbox in inboxes:
+        assert inbox[0]['status'] == 200
+        state, bid, status = events(inbox)
+        assert state['type'] == 'state' and state['price'] == '20.00' and state['bid_count'] == 0
+        assert bid['type'] == 'bid' and bid['price'] == '50' and bid['buyer'] == 'testuser' and bid['bid_count'] == 1
+        assert bid['extended'] and bid['end_date'] > state['end_date']
+        assert status == {'type': 'status', 'auction': str(one_auction.pk), 'status': 'sold'}
+
+
+@pytest.mark.parametrize('count, orphans', [(0, 0), (23, 0), (23, 3), (20, 0), (21, 2)])
+@pytest.mark.django_db
+def test_load_page_matches_paginator(one_auction, count, orphans):
+    """Page read together with the count is the same page Paginator reads after counting"""
+    from asgiref.sync import async_to_sync
+    from django.core.paginator import InvalidPage
+    from .async_views import load_page
+    load = async_to_sync(load_page)     # Queries go back to the thread of the test
+    Auction.objects.all().delete()
+    for number in range(count):
+        Auction.objects.create(name=f'auction {number}', item=one_auction.item, min_price=20,
+                               end_date=timezone.now(), seller=one_auction.seller)
+    queryset = Auction.objects.order_by('name')
+    for number in (1, 2, 3, 4, 'x', 0):
+        try:
+            expected = Paginator(queryset, 10, orphans=orphans).page(number)
+        except InvalidPage as error:
+            with pytest.raises(type(error)):
+                load(Paginator(queryset, 10, orphans=orphans), number)
+            continue
+        page = load(Paginator(queryset, 10, orphans=orphans), number)
+        assert list(page) == list(expected)
+        assert (page.paginator.count, page.has_next()) == (count, expected.has_next())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_async_views_with_parallel_queries(one_auction, user_create, client, settings):
+    """Read views are async and give the same pages when their queries run in separate threads and connections"""
+    import asyncio
+    from django.urls import resolve
+    settings.ASYNC_PARALLEL_QUERIES = True
+    settings.PAGE_CACHE_ENABLED = False
+    for number in range(12):
+        Opinion.objects.create(auction=one_auction, reviewer=user_create, rating=number % 5, comment=f'opinion {number}')
+        Auction.objects.create(name=f'auction {number}', item=one_auction.item, min_price=20,
+                               end_date=timezone.now(), seller=one_auction.seller)
+    place_bid(one_auction.pk, user_create, 30)
+    for url in ('/auctions/', f'/auction/{one_auction.pk}/', f'/bids/{one_auction.pk}', '/api/auctions/', '/api/items/'):
+        assert asyncio.iscoroutinefunction(resolve(url).func)
+
+    response = client.get('/auctions/', {'page': 2})
+    assert len(response.context['auctions']) == 3 and response.context['paginator'].count == 13
+    assert client.get('/auctions/', {'page': 3}).status_code == 404
+    response = client.get(f'/auction/{one_auction.pk}/', {'page': 5})   # Past the end shows the last page
+    assert response.context['auction'] == one_auction
+    assert response.context['average_rating'] == pytest.approx(sum(number % 5 for number in range(12)) / 12)
+    assert [opinion.comment for opinion in response.context['opinions']] == ['opinion 1', 'opinion 0']
+    response = client.get(f'/bids/{one_auction.pk}')
+    assert [bid.amount for bid in response.context['bids']] == [30]
+    assert client.get(f'/bids/{uuid.uuid4()}').status_code == 404
+    data = client.get('/api/auctions/', {'page_size': 5, 'page': 3}).json()
+    assert data['count'] == 13 and len(data['results']) == 3
+    assert client.get('/api/auctions/', {'status': 'bogus-date', 'end_date_after': 'x'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_import_auctions_command(user_create, category_object, tmp_path):
+    """Valid rows become items and auctions of the seller, broken rows are reported with their number"""
+    future = (timezone.now() + timedelta(days=3)).isoformat()
+    path = tmp_path / 'catalog.csv'
+    path.write_text(
+        'name,item_name,item_description,category,min_price,buy_now_price,end_date\n'
+        f'Old lamp,Lamp,Brass lamp,{category_object.name},10,50,{future}\n'
+        f'Chair,Chair,Oak chair,{category_object.name},20,,{future}\n'
+        f'Table,Table,Pine table,{category_object.name},30,20,{future}\n'        # Buy now below min price
+        f'Vase,Vase,Glass vase,{category_object.name},5,10,2000-01-01T00:00:00\n'  # Past end date
+        f'Clock,Clock,Wall clock,no such category,abc,10,{future}\n')
+    stdout, stderr = StringIO(), StringIO()
+    call_command('import_auctions', str(path), seller=user_create.username, batch_size=1, chunk_size=1,
+                 stdout=stdout, stderr=stderr)
+    assert 'Imported 2 auctions, rejected 3 rows' in stdout.getvalue()
+    errors = stderr.getvalue().splitlines()
+    assert errors[0] == 'Row 3: buy_now_price: Price without bidding cannot be less than minimum price'
+    assert errors[1] == 'Row 4: end_date: End date cannot be past'
+    assert errors[2].startswith('Row 5: min_price: Enter a number.; category:')
+    auctions = Auction.objects.filter(seller=user_create).select_related('item').order_by('name')
+    assert [(auction.name, auction.item.name, auction.item.creator) for auction in auctions] == [
+        ('Chair', 'Chair', user_create), ('Old lamp', 'Lamp', user_create)]
+    assert search.search('lamp', 'item')[0].name == 'Lamp'
+    assert get_counters()['auctions_available'] == Auction.objects.filter(status='available').count()
+
+
+@pytest.mark.django_db
+def test_import_auctions_api(user_create, category_object, client):
+    future = (timezone.now() + timedelta(days=3)).isoformat()
+    rows = [
+        {'name': 'Bike', 'item_name': 'Bike', 'item_description': 'Red bike', 'category': category_object.name,
+         'min_price': 100, 'buy_now_price': 300, 'end_date': future},
+        {'name': 'Kite', 'item_name': 'Kite', 'item_description': 'Kite', 'category': category_object.name,
+         'min_price': '5.5', 'end_date': 'tomorrow'},
+    ]
+    body = '\n'.join(json.dumps(row) for row in rows) + '\nnot json\n'
+    assert client.post('/api/import/', body, content_type='application/x-ndjson').status_code == 403
+    client.force_login(user_create)
+    response = client.post('/api/import/', body, content_type='application/x-ndjson')
+    assert response.json() == {'imported': 1, 'failed': 2, 'errors': [
+        {'row': 2, 'errors': {'end_date': ['Enter a valid date/time.']}},
+        {'row': 3, 'errors': {'__all__': ['Row is not a JSON object']}},
+    ]}
+    assert Auction.objects.get(name='Bike').buy_now_price == 300
+
+
+@pytest.mark.django_db
+def test_export_auction_bids(one_auction, user_create, client):
+    """Bids of the auction, oldest first, as CSV or NDJSON, the history page shows one page of them"""
+    other_user = User.objects.create_user(username='otheruser', password='12345')
+    place_bid(one_auction.pk, user_create, 30)
+    place_bid(one_auction.pk, other_user, 40)
+    response = client.get(f'/bids/{one_auction.pk}/export')
+    assert response.streaming and response['Content-Type'] == 'text/csv'
+    assert response['Content-Disposition'] == f'attachment; filename="bids-{one_auction.pk}.csv"'
+    lines = b''.join(response.streaming_content).decode().splitlines()
+    assert lines[0] == 'id,time,amount,bidder'
+    assert [line.split(',')[2:] for line in lines[1:]] == [['30.00', 'testuser'], ['40.00', 'otheruser']]
+    response = client.get(f'/bids/{one_auction.pk}/export', {'format': 'ndjson'})
+    rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+    assert [(row['amount'], row['bidder']) for row in rows] == [('30.00', 'testuser'), ('40.00', 'otheruser')]
+    assert client.get(f'/bids/{one_auction.pk}/export', {'format': 'xml'}).status_code == 400
+    assert client.get(f'/bids/{uuid.uuid4()}/export').status_code == 404
+    response = client.get(f'/bids/{one_auction.pk}')
+    assert [bid.amount for bid in response.context['bids']] == [40, 30]
+
+
+@pytest.mark.django_db
+def test_export_user_bids(one_auction, user_create, client):
+    """Users export their own bids, staff anyone's"""
+    other_user = User.objects.create_user(username='otheruser', password='12345')
+    place_bid(one_auction.pk, user_create, 30)
+    url = f'/user/{user_create.username}/bids/export'
+    assert client.get(url).status_code == 302     # Login page
+    client.force_login(other_user)
+    assert client.get(url).status_code == 403
+    client.force_login(user_create)
+    rows = [json.loads(line) for line in b''.join(client.get(url, {'format': 'ndjson'}).streaming_content).splitlines()]
+    assert [(row['auction'], row['auction_name'], row['amount']) for row in rows] == [
+        (str(one_auction.pk), 'random_name', '30.00')]
+    other_user.is_staff = True
+    other_user.save()
+    client.force_login(other_user)
+    assert len(b''.join(client.get(url).streaming_content).splitlines()) == 2
+
+
+@pytest.mark.django_db
+def test_export_sales(one_auction, user_create, client):
+    """Staff exports sold auctions which ended in the date range with the price they were sold for"""
+    other_user = User.objects.create_user(username='otheruser', password='12345')
+    day = timezone.now().replace(hour=12)
+    for number, (days, bid) in enumerate(((0, 70), (0, None), (1, 50), (-1, 60))):
+        auction = Auction.objects.create(name=f'sold {number}', item=one_auction.item, min_price=20, buy_now_price=100,
+                                         end_date=timezone.now() + timedelta(days=1), seller=one_auction.seller)
+        if bid:
+            place_bid(auction.pk, user_create, bid)
+        Auction.objects.filter(pk=auction.pk).update(status='sold', buyer=user_create, end_date=day + timedelta(days=days))
+    client.force_login(user_create)
+    assert client.get('/sales/export').status_code == 403
+    other_user.is_staff = True
+    other_user.save()
+    client.force_login(other_user)
+    params = {'start': day.date().isoformat(), 'end': (day + timedelta(days=1)).date().isoformat(), 'format': 'ndjson'}
+    response = client.get('/sales/export', params)
+    rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+    assert sorted((row['name'], Decimal(row['price']), row['buyer']) for row in rows) == [
+        ('sold 0', 70, 'testuser'), ('sold 1', 100, 'testuser'), ('sold 2', 50, 'testuser')]
+    assert len(b''.join(client.get('/sales/export').streaming_content).splitlines()) == 5    # Header and every sale
+    assert client.get('/sales/export', {'start': '2030-01-02', 'end': '2030-01-01'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_export_memory_is_bounded(one_auction, user_create, client):
+    """Peak memory of streaming the export doesn't grow with the number of rows"""
+    import tracemalloc
+
+    def export_peak():
+        response = client.get(f'/bids/{one_auction.pk}/export')
+        tracemalloc.start()
+        size = sum(len(part) for part in response.streaming_content)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return size, peak
+
+    peaks = []
+    for count in (3000, 30000):
+        Bid.objects.all().delete()
+        Bid.objects.bulk_create(
+            (Bid(auction=one_auction, bidder=user_create, amount=number) for number in range(count)), batch_size=5000)
+        size, peak = export_peak()
+        assert size > count * 30
+        peaks.append(peak)
+    assert peaks[1] < peaks[0] * 1.5, peaks
+
+
+@pytest.mark.django_db
+def test_export_streams_under_asgi(one_auction, user_create):
+    """ASGI handler reads streaming responses outside of the event loop, so exports can query the database"""
+    from asgiref.sync import async_to_sync
+    from .async_views import ASGIHandler
+    place_bid(one_auction.pk, user_create, 30)
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+    path = f'/bids/{one_auction.pk}/export'
+    async_to_sync(ASGIHandler())({
+        'type': 'http', 'method': 'GET', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+        'root_path': '', 'headers': [(b'host', b'testserver')], 'client': ('127.0.0.1', 50000),
+        'server': ('testserver', 80)}, receive, send)
+    assert messages[0]['status'] == 200
+    body = b''.join(message.get('body', b'') for message in messages[1:]).decode()
+    assert body.splitlines()[1].endswith(',30.00,testuser')
+    assert not messages[-1].get('more_body')
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.django_db
+def test_rating_stats_match_recount(seed, one_auction, user_create):
+    """Random creates, edits and deletes of opinions keep stats of every auction and seller equal to a full recount"""
+    import random
+    from django.db.models import Avg, Count
+    from .ratings import inconsistent_ratings, stats_of
+    generator = random.Random(seed)
+    sellers = [one_auction.seller, User.objects.create_user(username='seller2', password='12345')]
+    auctions = [one_auction] + [
+        Auction.objects.create(name=f'auction {number}', item=one_auction.item, min_price=20,
+                               end_date=timezone.now(), seller=sellers[number % 2]) for number in range(3)]
+    for _ in range(80):
+        opinions = list(Opinion.objects.all())
+        action = generator.random()
+        if action < 0.5 or not opinions:
+            Opinion.objects.create(auction=generator.choice(auctions), reviewer=user_create,
+                                   rating=generator.randint(1, 10), comment='random')
+        elif action < 0.8:
+            opinion = generator.choice(opinions)
+            opinion.rating = generator.randint(1, 10)
+            opinion.save()
+        else:
+            generator.choice(opinions).delete()
+    assert inconsistent_ratings() == []
+    for auction in Auction.objects.select_related('rating', 'seller__seller_rating'):
+        for stats, opinions in ((stats_of(auction, 'rating'), Opinion.objects.filter(auction=auction)),
+                                (stats_of(auction.seller, 'seller_rating'), Opinion.objects.filter(auction__seller=auction.seller))):
+            expected = opinions.aggregate(count=Count('id'), mean=Avg('rating'))
+            assert (stats.count if stats else 0) == expected['count']
+            assert (stats.mean if stats else None) == pytest.approx(expected['mean'])
+            if stats:
+                assert stats.histogram == {rating: opinions.filter(rating=rating).count() for rating in range(1, 11)}
+    auctions[1].delete()    # Opinions go away with the auction, the seller's stats follow
+    assert inconsistent_ratings() == []
+
+
+@pytest.mark.django_db
+def test_rating_stats_views_and_rebuild(opinion, client):
+    """Edit and delete views update stats, pages read them from one row, rebuild_ratings fixes broken rows"""
+    from .models import AuctionRating, SellerRating
+    auction = opinion.auction
+    client.force_login(opinion.reviewer)
+    Opinion.objects.create(auction=auction, reviewer=opinion.reviewer, rating=9, comment='great')
+    client.post(f'/edit-opinion/{opinion.pk}', {'comment': 'better', 'rating': 7})
+    assert AuctionRating.objects.get(auction=auction).histogram[7] == 1
+    response = client.get(f'/auction/{auction.pk}/')
+    assert response.context['average_rating'] == 8 and response.context['rating'].count == 2
+    assert client.get(f'/user/{auction.seller.username}').context['seller_rating'].mean == 8
+    client.post(f'/delete-opinion/{opinion.pk}')
+    assert (SellerRating.objects.get(seller=auction.seller).count, SellerRating.objects.get(seller=auction.seller).total) == (1, 9)
+
+    AuctionRating.objects.update(count=5)
+    SellerRating.objects.all().delete()
+    Opinion.objects.create(auction=auction, reviewer=opinion.reviewer, rating=3, comment='missing row starts empty')
+    assert SellerRating.objects.get(seller=auction.seller).count == 1
+    stdout = StringIO()
+    with pytest.raises(CommandError):
+        call_command('rebuild_ratings', '--check', stdout=stdout)
+    assert stdout.getvalue() == (f'Wrong rating stats: AuctionRating {auction.pk}\n'
+                                 f'Wrong rating stats: SellerRating {auction.seller.pk}\n')
+    call_command('rebuild_ratings', stdout=StringIO())
+    call_command('rebuild_ratings', '--check', stdout=stdout)
+    assert AuctionRating.objects.get(auction=auction).mean == 6
+    assert SellerRating.objects.get(seller=auction.seller).mean == 6
+
+
+@pytest.mark.django_db
+def test_rating_stats_first_opinions_race(one_auction, user_create):
+    """Two first opinions saved at once: the one counted second is already saved when the first one creates
+    the stats row, each still adds itself only once"""
+    from . import ratings
+    from .models import AuctionRating, SellerRating
+    late = Opinion.objects.bulk_create([Opinion(auction=one_auction, reviewer=user_create, rating=4, comment='late')])[0]
+    Opinion.objects.create(auction=one_auction, reviewer=user_create, rating=8, comment='first')
+    ratings.update(late, None, late.rating)     # Its signal runs after the row exists
+    for stats in (AuctionRating.objects.get(auction=one_auction), SellerRating.objects.get(seller=one_auction.seller)):
+        assert (stats.count, stats.total, stats.rating_4, stats.rating_8) == (2, 12, 1, 1)
+
+
+def test_proxy_bids_settle_with_two_strongest():
+    """Runner-up bids its maximum, winner one increment more (capped at its maximum), earlier maximum wins a tie
+    one increment above the runner-up"""
+    from .bidding import proxy_bids
+    assert proxy_bids(20, None, [], 1) == []
+    assert proxy_bids(20, None, [('a', 100, 1)], 1) == [('a', 21)]
+    assert proxy_bids(20, None, [('a', 100, 1), ('b', 60, 2)], 1) == [('b', 60), ('a', 61)]
+    assert proxy_bids(30, ('l', 30, 0), [('a', 100, 1), ('b', 60, 2)], 1) == [('b', 60), ('a', 61)]
+    assert proxy_bids(30, ('l', 80, 0), [('a', 100, 1), ('b', 60, 2)], 1) == [('l', 80), ('a', 81)]
+    assert proxy_bids(30, ('l', 100, 0), [('a', 100, 1)], 1) == [('a', 99), ('l', 100)]
+    assert proxy_bids(30, ('l', 100, 2), [('a', 100, 1)], 1) == [('l', 99), ('a', 100)]
+    assert proxy_bids(30, ('l', 150, 0), [('a', 100, 1)], 1) == [('a', 100), ('l', 101)]
+    assert proxy_bids(30, ('l', 100.5, 0), [('a', 100, 1)], 1) == [('a', 100), ('l', 100.5)]
+    assert proxy_bids(50, ('l', 50, 2), [('a', 50, 1)], 1) == [('a', 50)]   # Runner-up can't bid below the price
+
+
+@pytest.mark.django_db
+def test_proxy_bidding_many_bidders(one_auction, user_create):
+    """Every maximum settles with at most two bids, the strongest maximum wins one increment above the second one"""
+    import random
+    from .models import ProxyBid
+    generator = random.Random(1)
+    bidders = [User.objects.create_user(username=f'proxy{number}', email=f'proxy{number}@example.com')
+               for number in range(60)]
+    maximums = {}
+    for bidder in bidders:
+        maximums[bidder] = generator.randint(21, 500)
+        try:
+            bid, previous_buyer = bidding.place_proxy_bid(one_auction.pk, bidder, maximums[bidder])
+        except BidRejected:     # Maximum below the current price
+            continue
+        # Outbid right away only after bidding its maximum (one increment less when an earlier one is equal)
+        assert bid.leading or bid.amount in (maximums[bidder], maximums[bidder] - 1)
+    one_auction.refresh_from_db()
+    ranking = sorted(maximums, key=lambda bidder: -maximums[bidder])   # Stable, so earlier one first in a tie
+    assert one_auction.buyer == ranking[0]
+    assert one_auction.min_price == min(maximums[ranking[0]], maximums[ranking[1]] + 1)
+    assert one_auction.bid_count <= 2 * ProxyBid.objects.count()
+    assert bidding.inconsistent_bid_stats() == []
+
+    bid, previous_buyer = place_bid(one_auction.pk, user_create, one_auction.min_price + 1)     # Answered by the leader
+    assert not bid.leading and previous_buyer is None
+    one_auction.refresh_from_db()
+    assert one_auction.buyer == ranking[0] and one_auction.min_price == min(maximums[ranking[0]], bid.amount + 1)
+
+
+@pytest.mark.django_db
+def test_proxy_bid_view(client, one_auction, user_create):
+    """Maximum set on the page bids for the user, outbid user gets one notification"""
+    rival = User.objects.create_user(username='rival', password='12345', email='rival@example.com')
+    place_bid(one_auction.pk, rival, 30)
+    client.force_login(user_create)
+    response = client.post(f'/proxy-bid/{one_auction.pk}', {'max_amount': '100'})
+    assert response.status_code == 302
+    one_auction.refresh_from_db()
+    assert (one_auction.buyer, one_auction.min_price) == (user_create, 31)
+    assert Notification.objects.filter(recipient='rival@example.com').count() == 1
+    place_bid(one_auction.pk, rival, 60)
+    one_auction.refresh_from_db()
+    assert (one_auction.buyer, one_auction.min_price) == (user_create, 61)
+    assert list(Bid.objects.filter(auction=one_auction).order_by('id').values_list('amount', flat=True)) == [30, 31, 60, 61]
+    assert client.post(f'/proxy-bid/{one_auction.pk}', {'max_amount': '10'}).status_code == 302     # Raised or not, no error page
+
+
+@pytest.mark.django_db
+def test_proxy_bid_outbid_right_away(one_auction):
+    """New maximum beaten by an existing one (or equal to it, the earlier one wins) bids up to its maximum and its
+    bidder is notified, the leader isn't"""
+    leader, weaker, equal = (User.objects.create_user(username=name, password='12345', email=f'{name}@example.com')
+                             for name in ('leader', 'weaker', 'equal'))
+    bidding.place_proxy_bid(one_auction.pk, leader, 100)
+    bid, previous_buyer = bidding.place_proxy_bid(one_auction.pk, weaker, 50)
+    assert (bid.amount, bid.leading, previous_buyer) == (50, False, None)
+    bid, previous_buyer = bidding.place_proxy_bid(one_auction.pk, equal, 100)
+    assert (bid.amount, bid.leading, previous_buyer) == (99, False, None)
+    one_auction.refresh_from_db()
+    assert (one_auction.buyer, one_auction.min_price) == (leader, 100)
+    assert sorted(Notification.objects.values_list('recipient', flat=True)) == ['equal@example.com', 'weaker@example.com']
+
+
+@pytest.mark.django_db
+def test_proxy_bid_ties_go_to_the_earlier_maximum(one_auction):
+    """Bid equal to an earlier maximum is taken by that proxy, and a later equal maximum loses even when its own
+    bidder bids, the leading bid is always above every other one"""
+    from .models import ProxyBid
+    first, second = (User.objects.create_user(username=name, password='12345', email=f'{name}@example.com')
+                     for name in ('first', 'second'))
+    bidding.place_proxy_bid(one_auction.pk, first, 50)
+    bid, previous_buyer = place_bid(one_auction.pk, second, 50)
+    assert (bid.pk, bid.leading, previous_buyer) == (None, False, None)
+    one_auction.refresh_from_db()
+    assert (one_auction.buyer, one_auction.min_price) == (first, 50)
+    assert list(Bid.objects.order_by('id').values_list('bidder__username', 'amount')) == [('first', 21), ('first', 50)]
+    assert list(Notification.objects.values_list('recipient', flat=True)) == ['second@example.com']
+
+    Bid.objects.all().delete()
+    Auction.objects.filter(pk=one_auction.pk).update(min_price=20, buyer=None, bid_count=0)
+    ProxyBid.objects.filter(bidder=first).update(created=timezone.now() - timedelta(minutes=1))
+    ProxyBid.objects.create(auction=one_auction, bidder=second, max_amount=50, created=timezone.now())
+    bid, _ = place_bid(one_auction.pk, second, 21)     # Defended by the later maximum
+    one_auction.refresh_from_db()
+    assert (one_auction.buyer, one_auction.min_price, bid.amount, bid.leading) == (first, 50, 49, False)
+    assert list(Bid.objects.order_by('id').values_list('bidder__username', 'amount')) == [
+        ('second', 21), ('second', 49), ('first', 50)]
+
+
+def timed_bids(auction, bidder, times, amounts):
+    """Bids with the given times (auto_now_add overrides time on create)"""
+    bids = Bid.objects.bulk_create(Bid(auction=auction, bidder=bidder, amount=amount) for amount in amounts)
+    bids = list(Bid.objects.filter(auction=auction).order_by('id'))[-len(bids):]
+    for bid, bid_time in zip(bids, times):
+        bid.time = bid_time
+    Bid.objects.bulk_update(bids, ['time'])
+    return bids
+
+
+@pytest.mark.django_db
+def test_bid_series_buckets(one_auction, user_create, client):
+    """Buckets match the same grouping done in Python, more points give narrower buckets"""
+    import random
+    generator = random.Random(0)
+    start = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    times = sorted(start + timedelta(seconds=generator.randrange(6 * 3600)) for _ in range(500))
+    amounts = [Decimal(100 + index) for index in range(len(times))]
+    timed_bids(one_auction, user_create, times, amounts)
+
+    for points in (10, 100):
+        series = bid_series(one_auction.pk, points)
+        width = series['bucket_seconds']
+        assert width == bucket_width(int(times[0].timestamp()), int(times[-1].timestamp()), points)
+        assert len(series['time']) <= points
+        expected = {}
+        for bid_time, amount in zip(times, amounts):
+            expected.setdefault(int(bid_time.timestamp()) // width * width, []).append(amount)
+        assert series['time'] == sorted(expected)
+        assert list(map(Decimal, series['open'])) == [expected[bucket][0] for bucket in series['time']]
+        assert list(map(Decimal, series['high'])) == [max(expected[bucket]) for bucket in series['time']]
+        assert list(map(Decimal, series['last'])) == [expected[bucket][-1] for bucket in series['time']]
+        assert series['count'] == [len(expected[bucket]) for bucket in series['time']]
+    assert bid_series(one_auction.pk, 10)['bucket_seconds'] > bid_series(one_auction.pk, 100)['bucket_seconds']
+
+    response = client.get(f'/api/auctions/{one_auction.pk}/bid-series/?points=10')
+    assert response.status_code == 200
+    assert response.json()['count'] == bid_series(one_auction.pk, 10)['count']
+    assert client.get(f'/api/auctions/{one_auction.pk}/bid-series/?points=0').status_code == 400
+    assert client.get(f'/api/auctions/{one_auction.pk}/bid-series/?points=x').status_code == 400
+    assert client.get(f'/api/auctions/{uuid.uuid4()}/bid-series/').status_code == 404
+
+
+@pytest.mark.django_db
+def test_bid_series_many_bids_and_cache(one_auction, user_create, client, django_assert_num_queries):
+    """100k bids still give a few kilobytes, finished auction is served from cache without queries"""
+    Bid.objects.bulk_create((Bid(auction=one_auction, bidder=user_create, amount=Decimal(index) / 100)
+                             for index in range(100000)), batch_size=5000)
+    ids = list(Bid.objects.filter(auction=one_auction).order_by('id').values_list('id', flat=True))
+    start = datetime(2030, 1, 1, tzinfo=timezone.utc)
+    for hour, first in enumerate(range(0, len(ids), 1000)):     # 1000 bids per hour over 100 hours
+        Bid.objects.filter(id__range=(ids[first], ids[first + 999])).update(time=start + timedelta(hours=hour))
+    url = f'/api/auctions/{one_auction.pk}/bid-series/'
+    response = client.get(url)
+    assert len(response.content) < 8 * 1024
+    assert sum(response.json()['count']) == 100000
+
+    one_auction.status = 'sold'
+    one_auction.save()
+    client.get(url)
+    with django_assert_num_queries(0):
+        response = client.get(url)
+    assert sum(response.json()['count']) == 100000
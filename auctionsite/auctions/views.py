@@ -1,31 +1,34 @@
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
 from typing import Any, Dict, Optional, Type
-from PIL import Image
-from io import BytesIO
 
 from django.forms.models import BaseModelForm, modelform_factory
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic import View, ListView, CreateView, DeleteView, DetailView, UpdateView
 from django.contrib.auth import get_user_model, login, logout, authenticate
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
 from django.core.exceptions import PermissionDenied
 from django.contrib.messages.views import SuccessMessageMixin
-from django.http import HttpResponse, HttpResponseRedirect, Http404
-from django.db.models import Q, Avg
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, Http404
+from django.db.models import Q
 from django.utils import timezone
 from django.core.paginator import Paginator
-from django.core.mail import send_mail
 from django.conf import settings
 from django.utils.safestring import mark_safe
 from django.urls import reverse_lazy, reverse
 
 from django_email_verification import send_email
-from twilio.rest import Client
 
-from .models import Auction, Item, Opinion, Bid, Category, Account
-from .utils import average_rating
-from .forms import SearchForm, ResetPasswordForm, EditUserForm
+from .models import Auction, Item, Opinion, Bid, Category, Account, SellerRating
+from .pagination import KeysetPaginator, KeysetPaginationMixin
+from .bidding import place_bid, place_proxy_bid, BidRejected
+from .db_backends import write_transaction
+from .counters import get_counters
+from .page_cache import VersionedCacheMixin
+from .async_views import AsyncViewMixin, AsyncListMixin, run_query, load_page_or_last
+from . import exports, ratings, search as search_index
+from .forms import SearchForm, ResetPasswordForm, EditUserForm, ProxyBidForm, ExportForm, SalesExportForm, auction_errors
 
 
 
@@ -38,47 +41,59 @@ class StartPage(View):
     title = 'Auction house'
     
     def get(self, request):
-        users = User.objects.count()
-        auctions = Auction.objects.count()
+        counters = get_counters()     # Cached counter table instead of COUNT of whole tables
         context = {
             'title': self.title,
-            'auctions': auctions,
-            'users': users,
+            'auctions': counters['auctions'],
+            'users': counters['users'],
+            'counters': counters,
         }
         return render(request, self.template_name, context)
 
 
-class ItemsList(ListView):
-    """Shows a list of all available items"""
+class ItemsList(KeysetPaginationMixin, ListView):
+    """Shows a list of all available items (add ?cursor= to the URL to use cursor pagination)"""
     model = Item
     paginate_by = 10
+    keyset_ordering = ('name', 'id')
 
 
-class ItemDetails(DetailView):
+class ItemDetails(VersionedCacheMixin, DetailView):
     """This view shows the details of particural item"""
+    cache_dependencies = (('item', 'pk'),)
     model = Item
     context_object_name = 'item'
+    queryset = Item.objects.select_related('category', 'creator')
 
 
-class AuctionsList(ListView):
-    """Shows a list of all auctions 
-    # TODO: after server depoloyment use scheduler to automate changing auction status"""
+class AuctionsList(VersionedCacheMixin, AsyncListMixin, KeysetPaginationMixin, ListView):
+    """Shows a list of all auctions (read-only, auction status is changed by 'manage.py close_auctions').
+    Add ?cursor= to the URL to use cursor pagination. Async view, page and count are read at the same time"""
+    cache_dependencies = (('auction', None),)
     model = Auction
     context_object_name = 'auctions'
     paginate_by = 10
     ordering = '-end_date'
+    keyset_ordering = ('-end_date', '-id')
+
+    def get_status(self):
+        """Returns 'status' parameter from the URL (None if it is not a valid auction status)"""
+        status = self.request.GET.get('status')
+        if status in dict(Auction.CHOICES):
+            return status
+        return None
+
+    def get_queryset(self):
+        """Filters auctions in the database, so pagination counts only auctions with requested status"""
+        queryset = super().get_queryset()
+        status = self.get_status()
+        if status:
+            queryset = queryset.filter(status=status)
+        return queryset
 
     def get_context_data(self, **kwargs):
-        """Method is used to change auction status after expired or sold"""
-        context = super().get_context_data(**kwargs)    # Get default context data
-        for auction in context['auctions']:
-            if auction.status == 'available':
-                if auction.end_date < timezone.now():   # Check if end date is past
-                    auction.status = 'expired'
-                    auction.save()   
-                if auction.end_date < timezone.now() and auction.bid_set.count() > 0:
-                    auction.status = 'sold'
-                    auction.save()      
+        context = super().get_context_data(**kwargs)
+        context['status'] = self.get_status()
         return context
 
     def get_template_names(self, **kwargs):
@@ -94,23 +109,36 @@ class AuctionsList(ListView):
             return 'auctions/auction_list.html'
 
 
-class AuctionDetails(DetailView):
-    """This view shows the details (includes opinions) of particural auction"""
+class AuctionDetails(VersionedCacheMixin, AsyncViewMixin, DetailView):
+    """This view shows the details (includes opinions) of particural auction.
+    Async view, auction with its rating stats and page of opinions are read at the same time"""
+    cache_dependencies = (('auction', 'pk'),)
     context_object_name = 'auction'
     model = Auction
+    opinions_per_page = 10
+
+    def get_queryset(self):
+        return Auction.objects.select_related('item', 'seller', 'buyer', 'rating')     # Rating stats come with the row
+
+    async def get(self, request, *args, **kwargs):
+        opinions = Opinion.objects.filter(auction=self.kwargs['pk']).select_related('reviewer').order_by('-date_created')
+        self.object, self.opinions = await asyncio.gather(
+            run_query(self.get_object),
+            load_page_or_last(Paginator(opinions, self.opinions_per_page), request.GET.get('page')))
+        return self.render_to_response(self.get_context_data(object=self.object))
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        auction = self.object
-        opinions = Opinion.objects.filter(auction=auction)
-        average_rating = opinions.aggregate(Avg('rating'))['rating__avg']
-        context['average_rating'] = average_rating
+        context['opinions'] = self.opinions
+        context['rating'] = ratings.stats_of(self.object, 'rating')
+        context['average_rating'] = context['rating'] and context['rating'].mean
         return context
 
 
-class CategoriesList(ListView):
+class CategoriesList(VersionedCacheMixin, ListView):
     """Shows names and descriptions of categories"""
     model = Category
+    cache_dependencies = (('category', None),)
 
 
 class CategoryDetails(DetailView):
@@ -118,12 +146,23 @@ class CategoryDetails(DetailView):
     context_object_name = 'category'
     model = Category
 
+    items_per_page = 10
+
     def get_object(self, queryset=None):
         if queryset is None:
             queryset = self.get_queryset()
         category_slug = self.kwargs['slug']
         category = Category.objects.get(name=category_slug)
         return category
+
+    def get_context_data(self, **kwargs):
+        """Items are paginated, so big category does not load every item"""
+        context = super().get_context_data(**kwargs)
+        paginator = Paginator(self.object.item_set.order_by('name', 'id'), self.items_per_page)
+        page_obj = paginator.get_page(self.request.GET.get('page'))
+        context['page_obj'] = page_obj
+        context['items'] = page_obj.object_list
+        return context
     
 
 class AddAuction(LoginRequiredMixin, CreateView):
@@ -138,15 +177,11 @@ class AddAuction(LoginRequiredMixin, CreateView):
     def form_valid(self, form):
         """Check if form is valid and saves data"""
         form.instance.seller = self.request.user
-        min_price = form.cleaned_data['min_price']
-        buy_now_price = form.cleaned_data['buy_now_price']
-        end_date = form.cleaned_data['end_date']
-        
-        if buy_now_price and min_price > buy_now_price:
-            form.add_error('buy_now_price', 'Price without bidding cannot be less than minimum price')
-            return self.form_invalid(form)
-        if end_date < timezone.now():   # Check if date is not past
-            form.add_error('end_date', 'End date cannot be past')
+        errors = auction_errors(
+            form.cleaned_data['min_price'], form.cleaned_data['buy_now_price'], form.cleaned_data['end_date'])
+        if errors:     # Same rules as bulk import (auctions.bulk_import)
+            for field, error in errors.items():
+                form.add_error(field, error)
             return self.form_invalid(form)
         form.save()
         return HttpResponseRedirect(self.get_success_url())
@@ -173,29 +208,34 @@ class BuyNow(LoginRequiredMixin, UpdateView):
     def form_valid(self, form):
         """Check if form is valid, display messages and saves data"""
         user = self.request.user
-        auction = self.get_object()  # Access the auction object
-        error_messages = {
-            auction.bid_set.count() > 0: 'You cannot buy right now because someone started to bid on auction already(you can bid too)',
-            auction.status == 'available' and auction.buy_now_price is None: 'You can not do this because auction has no buy-now price',
-            auction.status == 'sold' or auction.status == 'expired': 'Buying expired or sold auctions is prohibited',
-            auction.seller == user or auction.buyer == user: 'Buying as buyer or seller is prohibited',
-        }
-        for condition, error_message in error_messages.items():
-            if condition:
-                messages.error(self.request, error_message)
-                return redirect(reverse_lazy('auction-detail', kwargs={'pk': auction.pk}))
-        form.instance.buyer = user
-        form.instance.status = 'sold'
-        auction = form.save()
-        messages.success(self.request, f'Congratulation! You bought {auction.item.name} from {auction.name}')
-        return super().form_valid(form)
-        
+        # Checks and save have to see the same auction, so it is read again inside a write transaction
+        # (BEGIN IMMEDIATE on tuned SQLite, row lock elsewhere) which a concurrent bid can't slip into
+        with write_transaction():
+            auction = self.get_object(self.get_queryset().select_for_update())
+            error_messages = {
+                auction.bid_count > 0: 'You cannot buy right now because someone started to bid on auction already(you can bid too)',
+                auction.status == 'available' and auction.buy_now_price is None: 'You can not do this because auction has no buy-now price',
+                auction.status == 'sold' or auction.status == 'expired': 'Buying expired or sold auctions is prohibited',
+                auction.end_date <= timezone.now(): 'Buying expired or sold auctions is prohibited',   # Before the scheduler closes it
+                auction.seller == user or auction.buyer == user: 'Buying as buyer or seller is prohibited',
+            }
+            for condition, error_message in error_messages.items():
+                if condition:
+                    messages.error(self.request, error_message)
+                    return redirect(reverse_lazy('auction-detail', kwargs={'pk': auction.pk}))
+            auction.buyer = user
+            auction.status = 'sold'
+            form.instance = auction
+            auction = form.save()
+            messages.success(self.request, f'Congratulation! You bought {auction.item.name} from {auction.name}')
+            return super().form_valid(form)
+
     def get_object(self, queryset=None):
         """Returns objects from the URL"""
         if queryset is None:
             queryset = self.get_queryset()
         auction_id = self.kwargs['pk']
-        auction = Auction.objects.get(pk=auction_id)
+        auction = queryset.select_related('item').get(pk=auction_id)
         return auction
 
 
@@ -283,14 +323,14 @@ class DeleteOpinion(LoginRequiredMixin, SuccessMessageMixin, DeleteView):
 
 class BidAuction(LoginRequiredMixin, CreateView):
     """The view destined to bid on auctions (if bid is 20 minutes before end of auction,
-    it increases end of auction time for 20 minutes). 
-    # TODO after server deployment use account_sid and auth_token to send SMS whenever auction is outbid """
+    it increases end of auction time for 20 minutes, see bidding.place_bid).
+    Outbid person gets email and SMS (if TWILIO_ACCOUNT_SID is set) from the notification outbox"""
     model = Bid
     fields = ['amount']
 
     def get_object(self, queryset=None):
         auction_id = self.kwargs['pk']
-        auction = Auction.objects.get(id=auction_id)
+        auction = Auction.objects.select_related('item').get(id=auction_id)
         return auction
     
     def get_context_data(self, **kwargs):
@@ -299,83 +339,157 @@ class BidAuction(LoginRequiredMixin, CreateView):
         return context
     
     def form_valid(self, form):
-        """Check if form is valid, sends errors and if everything is OK sends mail to outbided person."""
+        """Check if form is valid, places the bid atomically together with notifications to outbided person (see bidding.place_bid)."""
         user = self.request.user
-        auction = self.get_object()
+        auction_id = self.kwargs['pk']
         new_price = form.cleaned_data['amount']
-        # account_sid = ''  # account sid used to send SMS
-        # auth_token = ''     # account auth_token used to send SMS
-        # client = Client(account_sid, auth_token)
-        error_messages = {
-            auction.buyer == user: 'You cannot bid because last person who bids is you!',
-            auction.seller == user: 'You cannot bid on your own auction!',
-            auction.status == 'expired' or auction.status == 'sold': 'Bid on expired or sold auctions is not allowed!',
-            auction.min_price >= new_price: 'New price cannot be equal or less than minimum price!',
-        }
-        for condition, error_message in error_messages.items():
-            if condition:
-                messages.error(self.request, error_message)
-                return redirect(reverse_lazy('auction-detail', kwargs={'pk': auction.pk}))
-        if timezone.now() + timezone.timedelta(minutes=20) > auction.end_date:
-            auction.end_date += timezone.timedelta(minutes=20)
-        # if auction.buyer and auction.buyer.phone_number:
-        #     client.messages.create(
-        # body=f'Your auction: "{auction.name}" has been outbid. New price is {new_price}!',
-        # from_='+12543544729',
-        # to='+48{}'.format(auction.buyer.phone_number)
-        # )
-        if auction.buyer and auction.buyer.email:
-            send_mail(f'{auction.name}',    # Sends email to outbid person
-                    f'You have been outbid. New price is {new_price}',
-                    f'{settings.EMAIL_HOST_USER}',
-                    [f'{auction.buyer.email}'])  
-        auction.min_price = new_price
-        auction.buyer = user
-        auction.save()
-        form.instance.amount = new_price
-        form.instance.auction = auction
-        form.instance.bidder = user
-        form.save()
-        messages.success(self.request, 'Bid successfully')  # Display success and redirect to the auction details page
-        return super().form_valid(form)
+        try:
+            bid, _ = place_bid(auction_id, user, new_price)
+        except BidRejected as error:
+            messages.error(self.request, str(error))
+            return redirect(reverse_lazy('auction-detail', kwargs={'pk': auction_id}))
+        self.object = bid   # Notifications are sent later by 'manage.py send_notifications'
+        if bid.leading:
+            messages.success(self.request, 'Bid successfully')  # Display success and redirect to the auction details page
+        else:
+            messages.error(self.request, 'Your bid was outbid right away by automatic bid of another user')
+        return HttpResponseRedirect(self.get_success_url())
     
     def get_success_url(self):
         auction = self.get_object()
         return reverse('auction-detail', kwargs={'pk': auction.pk})
 
 
-class BidHistory(ListView):
-    """Shows every bid for auction"""
+class ProxyBidAuction(LoginRequiredMixin, View):
+    """Sets hidden maximum of the user, the site bids for them (see bidding.place_proxy_bid),
+    so they don't have to come back every time they are outbid"""
+    template_name = 'auctions/proxy_bid_form.html'
+
+    def get(self, request, *args, **kwargs):
+        auction = get_object_or_404(Auction.objects.select_related('item'), pk=kwargs['pk'])
+        return render(request, self.template_name, {'auction': auction, 'form': ProxyBidForm()})
+
+    def post(self, request, *args, **kwargs):
+        auction = get_object_or_404(Auction.objects.select_related('item'), pk=kwargs['pk'])
+        form = ProxyBidForm(request.POST)
+        if not form.is_valid():
+            return render(request, self.template_name, {'auction': auction, 'form': form})
+        try:
+            bid, _ = place_proxy_bid(auction.pk, request.user, form.cleaned_data['max_amount'])
+        except BidRejected as error:
+            messages.error(request, str(error))
+            return redirect(reverse_lazy('auction-detail', kwargs={'pk': auction.pk}))
+        if bid is None or bid.leading:
+            messages.success(request, f"Your maximum is {form.cleaned_data['max_amount']}, you are the highest bidder")
+        else:
+            messages.error(request, 'Another user has a higher (or earlier) maximum, you have been outbid')
+        return redirect(reverse_lazy('auction-detail', kwargs={'pk': auction.pk}))
+
+
+class BidHistory(AsyncViewMixin, ListView):
+    """Shows bids of auction, newest first (async view, auction and the page of bids are read at the same time).
+    Full history can be downloaded from ExportAuctionBids"""
     model = Bid
+    paginate_by = 50
     template_name = 'auctions/bid_history_list.html'
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    async def get(self, request, *args, **kwargs):
         auction_id = self.kwargs['pk']      # Get auction ID from the URL
-        auction = Auction.objects.get(pk=auction_id)
-        bids = auction.bid_set.order_by('-time')
-        context['auction'] = auction
-        context['bids'] = bids
-        return context
+        bids = Bid.objects.filter(auction=auction_id).select_related('bidder').order_by('-time', '-id')
+        auction, page = await asyncio.gather(
+            run_query(get_object_or_404, Auction.objects.select_related('buyer'), pk=auction_id),
+            load_page_or_last(Paginator(bids, self.paginate_by), request.GET.get('page')))
+        self.object_list = page.object_list
+        return self.render_to_response(self.get_context_data(auction=auction, bids=page))
+
+
+class ExportView(View):
+    """Streams rows of get_queryset() as CSV (?format=csv, default) or newline delimited JSON (?format=ndjson)"""
+    form_class = ExportForm
+    columns = ()
+
+    def get(self, request, *args, **kwargs):
+        form = self.form_class(request.GET)
+        if not form.is_valid():
+            return HttpResponseBadRequest(form.errors.as_json(), content_type='application/json')
+        queryset = self.get_queryset(form.cleaned_data)
+        return exports.export_response(queryset, self.columns, form.cleaned_data['format'], self.get_filename())
+
+
+class ExportAuctionBids(ExportView):
+    """Every bid of the auction, oldest first (public, like BidHistory)"""
+    columns = exports.AUCTION_BID_COLUMNS
+
+    def get_queryset(self, params):
+        self.auction = get_object_or_404(Auction, pk=self.kwargs['pk'])
+        return exports.auction_bids(self.auction.pk)
+
+    def get_filename(self):
+        return f'bids-{self.auction.pk}'
+
+
+class ExportUserBids(LoginRequiredMixin, ExportView):
+    """Every bid of the user, oldest first. Users export their own bids, staff anyone's"""
+    columns = exports.USER_BID_COLUMNS
+
+    def get_queryset(self, params):
+        self.user = get_object_or_404(User, username=self.kwargs['username'])
+        if self.user != self.request.user and not self.request.user.is_staff:
+            raise PermissionDenied
+        return exports.user_bids(self.user)
+
+    def get_filename(self):
+        return f'bids-{self.user.username}'
+
+
+class ExportSales(UserPassesTestMixin, ExportView):
+    """Sold auctions which ended between ?start= and ?end= (both days included), staff only"""
+    form_class = SalesExportForm
+    columns = exports.SALE_COLUMNS
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get_queryset(self, params):
+        self.params = params
+        start, end = params['start'], params['end']
+        return exports.sales(start and self.start_of_day(start), end and self.start_of_day(end + timedelta(days=1)))
+
+    @staticmethod
+    def start_of_day(day):
+        return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+    def get_filename(self):
+        return f"sales-{self.params['start'] or 'start'}-{self.params['end'] or 'end'}"
+
 
 class SearchAuction(View):
-    """This view is destined to search auction, category or item by name"""
+    """This view is destined to search auction, category or item by name (and description), best matches first"""
     template_name = 'auctions/search_form.html'
+    per_page = 10
 
     def get(self, request, *args, **kwargs):
+        if 'search' in request.GET:     # Next pages of results are linked with GET
+            return self.search(request, SearchForm(request.GET))
         form = SearchForm()
         return render(request, self.template_name, {'form': form})
 
     def post(self, request, *args, **kwargs):
-        form = SearchForm(request.POST)
+        return self.search(request, SearchForm(request.POST))
+
+    def search(self, request, form):
         context = {
             'form': form,
         }
         if form.is_valid():
             search = form.cleaned_data['search']    # Get search query from form
-            item_results = Item.objects.filter(Q(name__icontains=search) | Q(name__startswith=search))
-            auction_result = Auction.objects.filter(Q(name__icontains=search) | Q(name__startswith=search))
-            category_result = Category.objects.filter(Q(name__icontains=search) | Q(name__startswith=search))
+            try:
+                page = max(int(request.GET.get('page', 1)), 1)
+            except ValueError:
+                page = 1
+            item_results = search_index.search(search, 'item', page, self.per_page)
+            auction_result = search_index.search(search, 'auction', page, self.per_page)
+            category_result = search_index.search(search, 'category', page, self.per_page)
             if not item_results and not auction_result and not category_result:
                 messages.error(request, 'Didnt match any result')   # If no results found display error message
                 return render(request, self.template_name, context)
@@ -383,6 +497,9 @@ class SearchAuction(View):
                 context['item_result'] = item_results
                 context['auction_result'] = auction_result
                 context['category_result'] = category_result
+                context['search'] = search
+                context['page'] = page
+                context['has_next'] = self.per_page in (len(item_results), len(auction_result), len(category_result))
                 return render(request, self.template_name, context)
         else:
             return render(request, self.template_name, {'form': form})
@@ -393,13 +510,22 @@ class UserProfile(View):
     def get(self, request, *args, **kwargs):
         username = kwargs['username']   # Get user profile from the URL
         user = User.objects.get(username=username)  # Get user data
-        bids = Bid.objects.filter(bidder=user).order_by('-time')  # Get every user bids
-        paginator = Paginator(bids, 3)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
+        bids = Bid.objects.filter(bidder=user).select_related('auction').order_by('-time')  # Get every user bids
+        if 'cursor' in request.GET:     # Cursor pagination, page cost does not depend on page depth
+            paginator = KeysetPaginator(bids, ('-time', '-id'), 3)
+            try:
+                page_obj = paginator.get_page(request.GET['cursor'])
+            except ValueError:
+                raise Http404('Invalid cursor')
+        else:
+            paginator = Paginator(bids, 3)
+            page_number = request.GET.get('page')
+            page_obj = paginator.get_page(page_number)
         context = {
             'user': user,
             'bids': page_obj,
+            'cursor_pagination': 'cursor' in request.GET,
+            'seller_rating': SellerRating.objects.filter(seller=user).first(),  # Opinions about all user's auctions
         }
         try:
             user_account = Account.objects.get(user=user)
@@ -9,8 +9,14 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'auctionsite.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)     # What get_asgi_application() does before creating the handler
+
+from auctions.async_views import ASGIHandler  # noqa: E402 (needs configured Django)
+from auctions.live import router  # noqa: E402
+
+django_application = ASGIHandler()     # Streams exports from the database without blocking the event loop
+application = router(django_application)     # /auction/<pk>/events streams are served next to Django
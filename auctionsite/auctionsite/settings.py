@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+from decimal import Decimal
 from pathlib import Path
 import os
 
@@ -92,12 +93,45 @@ WSGI_APPLICATION = 'auctionsite.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DATABASE_ENGINE=sqlite (default, db.sqlite3), sqlite-tuned (the same file in WAL mode with busy timeout,
+# for small deployments with a few worker processes) or postgresql (production, settings from POSTGRES_* variables).
+# PostgreSQL connections are kept for DATABASE_CONN_MAX_AGE seconds and checked before reuse, with
+# DATABASE_POOL_SIZE > 0 they are shared by all threads of a worker instead (CONN_MAX_AGE is then 0).
+# Behind PgBouncer in transaction mode set DATABASE_PGBOUNCER=1 (server-side cursors don't work there)
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', 0))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'auctions.db_backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'auctionsite'),
+            'USER': os.environ.get('POSTGRES_USER', 'auctionsite'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': 0 if DATABASE_POOL_SIZE else int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'POOL_SIZE': DATABASE_POOL_SIZE,
+            'POOL_TIMEOUT': int(os.environ.get('DATABASE_POOL_TIMEOUT', 30)),
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DATABASE_PGBOUNCER') == '1',
+        }
+    }
+elif DATABASE_ENGINE == 'sqlite-tuned':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'auctions.db_backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': 60,     # Pragmas are set once per connection
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
 
 
 # Password validation
@@ -168,6 +202,56 @@ EMAIL_HOST_USER = 'testdjangoapp381@gmail.com'
 EMAIL_HOST_PASSWORD = ''
 EMAIL_USE_TLS = True
 
+# Outbid SMS (sent by 'manage.py send_notifications', disabled when account sid is empty)
+TWILIO_ACCOUNT_SID = ''
+TWILIO_AUTH_TOKEN = ''
+TWILIO_FROM_NUMBER = '+12543544729'
+
+# Proxy bids (auctions.bidding) outbid others by this much, up to the bidder's maximum
+BID_INCREMENT = Decimal('1.00')
+
+# Cache of rendered pages (auctions.page_cache). Page versions are bumped by every process writing to the database
+# (web workers, scheduler, management commands), so the cache has to be shared by all of them: AUCTIONS_CACHE=file
+# (default, processes on one host) or redis (several hosts, AUCTIONS_REDIS_URL). locmem lives in one process,
+# bumps of other processes would never reach it, so page caching is off with it
+AUCTIONS_CACHE = os.environ.get('AUCTIONS_CACHE', 'file')
+CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('AUCTIONS_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',     # Needs the redis package
+        'LOCATION': os.environ.get('AUCTIONS_REDIS_URL', 'redis://127.0.0.1:6379'),
+    },
+}
+CACHES = {
+    'default': CACHE_BACKENDS[AUCTIONS_CACHE],
+}
+PAGE_CACHE_ALIAS = 'default'
+PAGE_CACHE_ENABLED = AUCTIONS_CACHE != 'locmem'
+PAGE_CACHE_TIMEOUT = 600
+
+# Live auction pages (auctions.live, served by asgi.py). LocalBackend reaches clients of one ASGI process,
+# with several processes use auctions.live.PostgresBackend (LISTEN/NOTIFY, needs DATABASE_ENGINE=postgresql)
+LIVE_EVENTS_BACKEND = os.environ.get('LIVE_EVENTS_BACKEND', 'auctions.live.LocalBackend')
+LIVE_EVENTS_KEEPALIVE = 15     # Seconds between comments sent to idle streams
+
+# Queries of async views (auctions.async_views) run in a thread pool, each thread with its own connection,
+# so independent queries of one request run at the same time. False runs them one by one in the request's thread
+ASYNC_PARALLEL_QUERIES = True
+
+# Every API list is paginated, ?page_size= can change the size up to PageNumberAPIPagination.max_page_size
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'auctions.pagination.PageNumberAPIPagination',
+    'PAGE_SIZE': 20,
+}
+
 
 #allauth configurations
 LOGIN_URL = '/accounts/login/'
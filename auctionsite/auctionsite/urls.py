@@ -43,6 +43,7 @@ urlpatterns = [
     path('add-item/', auctions.AddItem.as_view()),
     path('add-opinion/<uuid:pk>', auctions.AddOpinion.as_view()),
     path('bid-auction/<uuid:pk>', auctions.BidAuction.as_view()),
+    path('proxy-bid/<uuid:pk>', auctions.ProxyBidAuction.as_view()),
     path('search', auctions.SearchAuction.as_view()),
     path('edit-opinion/<uuid:pk>', auctions.EditOpinion.as_view()),
     # path('logout/', auctions.Logout.as_view()),
@@ -53,6 +54,9 @@ urlpatterns = [
     path('edit-profile/<int:pk>', auctions.EditUserProfile.as_view()),
     path('reset-password/<str:username>', auctions.ResetPassword.as_view()),
     path('bids/<uuid:pk>', auctions.BidHistory.as_view()),
+    path('bids/<uuid:pk>/export', auctions.ExportAuctionBids.as_view()),
+    path('user/<str:username>/bids/export', auctions.ExportUserBids.as_view()),
+    path('sales/export', auctions.ExportSales.as_view()),
     path('delete-opinion/<uuid:pk>', auctions.DeleteOpinion.as_view()),
     path('expired-auctions/', auctions.AuctionsList.as_view()),
     path('email/', include(mail_urls)),
@@ -63,6 +67,9 @@ urlpatterns = [
     
     path('api/auctions/', api_views.AuctionView.as_view()),
     path('api/auctions/<int:pk>', api_views.AuctionDetailView.as_view()),
+    path('api/auctions/<uuid:pk>/bid-series/', api_views.BidSeriesView.as_view()),
+    path('api/autocomplete/', api_views.AutocompleteView.as_view()),
+    path('api/import/', api_views.BulkImportView.as_view()),
     path('api/', include((router.urls, 'api'))),
 
 ]
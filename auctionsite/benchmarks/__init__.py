@@ -0,0 +1 @@
+"""Performance benchmarks, run them from the 'auctionsite' directory, e.g. 'python -m benchmarks.auction_list'"""
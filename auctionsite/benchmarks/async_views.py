@@ -0,0 +1,175 @@
+"""Compares sync and async read views under concurrent load. Requests go straight to Django's ASGI application
+(the same messages uvicorn or daphne would send), so the result doesn't depend on the server or HTTP client.
+Sync views are copies of the views before they became async, all of them share the one thread Django runs sync
+views in. --latency adds a delay to every query to simulate a database on another host.
+
+Usage: python -m benchmarks.async_views [--concurrency 20] [--requests 400] [--latency 2] [--serial-queries]
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.utils import setup, benchmark_database, seed_users, seed_auctions
+
+setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.asgi import get_asgi_application  # noqa: E402
+from django.core.paginator import Paginator  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.db.models import Avg  # noqa: E402
+from django.urls import include, path  # noqa: E402
+from django.views.generic import DetailView, ListView  # noqa: E402
+from rest_framework import generics  # noqa: E402
+
+from auctions.api_views import QueryFilterMixin, AuctionView  # noqa: E402
+from auctions.bidding import place_bid  # noqa: E402
+from auctions.models import Auction, Bid, Opinion  # noqa: E402
+from auctions.page_cache import VersionedCacheMixin  # noqa: E402
+from auctions.pagination import KeysetAPIPagination  # noqa: E402
+from auctions.serializers import AuctionSerializer  # noqa: E402
+
+
+class SyncAuctionsList(VersionedCacheMixin, ListView):
+    cache_dependencies = (('auction', None),)
+    model = Auction
+    context_object_name = 'auctions'
+    paginate_by = 10
+    ordering = '-end_date'
+    template_name = 'auctions/auction_list.html'
+
+
+class SyncAuctionDetails(VersionedCacheMixin, DetailView):
+    """Copy of AuctionDetails before it became async"""
+    cache_dependencies = (('auction', 'pk'),)
+    context_object_name = 'auction'
+    model = Auction
+    template_name = 'auctions/auction_detail.html'
+
+    def get_queryset(self):
+        return Auction.objects.select_related('item', 'seller', 'buyer').annotate(average_rating=Avg('opinion__rating'))
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        opinions = Opinion.objects.filter(auction=self.object).select_related('reviewer').order_by('-date_created')
+        context['opinions'] = Paginator(opinions, 10).get_page(self.request.GET.get('page'))
+        context['average_rating'] = self.object.average_rating
+        return context
+
+
+class SyncBidHistory(ListView):
+    model = Bid
+    template_name = 'auctions/bid_history_list.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        auction = Auction.objects.select_related('buyer').get(pk=self.kwargs['pk'])
+        context['auction'] = auction
+        context['bids'] = auction.bid_set.select_related('bidder').order_by('-time')
+        return context
+
+
+class SyncAuctionView(QueryFilterMixin, generics.ListAPIView):
+    queryset = Auction.objects.order_by('-end_date', '-id')
+    serializer_class = AuctionSerializer
+    pagination_class = KeysetAPIPagination
+    keyset_ordering = ('-end_date', '-id')
+    filter_lookups = AuctionView.filter_lookups
+
+
+urlpatterns = [
+    path('sync/auctions/', SyncAuctionsList.as_view()),
+    path('sync/auction/<uuid:pk>/', SyncAuctionDetails.as_view()),
+    path('sync/bids/<uuid:pk>', SyncBidHistory.as_view()),
+    path('sync/api/auctions/', SyncAuctionView.as_view()),
+    path('', include('auctionsite.urls')),
+]
+
+
+def add_latency(seconds):
+    """Every query of every connection (any thread) waits 'seconds' first, like a round trip to the database"""
+    def delay(execute, sql, params, many, context):
+        time.sleep(seconds)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        connection.execute_wrappers.append(delay)
+    connection_created.connect(install, weak=False)
+
+
+async def get(application, url):
+    """Sends GET request to ASGI application, returns status code"""
+    route, _, query = url.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': route, 'raw_path': route.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+    }
+    response = {}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+    await application(scope, receive, send)
+    return response['status']
+
+
+async def load(application, url, concurrency, requests):
+    """'concurrency' clients send 'requests' requests in total, returns (requests per second, p50 ms, p95 ms)"""
+    latencies = []
+    remaining = iter(range(requests))
+
+    async def client():
+        for _ in remaining:
+            start = time.perf_counter()
+            status = await get(application, url)
+            assert status == 200, f'{url} returned {status}'
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return requests / elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=2, help='milliseconds added to every query')
+    parser.add_argument('--serial-queries', action='store_true', help='run with ASYNC_PARALLEL_QUERIES = False')
+    args = parser.parse_args()
+    settings.ROOT_URLCONF = __name__
+    settings.PAGE_CACHE_ENABLED = False     # Measure the views, not the cache
+    settings.ASYNC_PARALLEL_QUERIES = not args.serial_queries
+
+    with benchmark_database(file_based=True):
+        users = seed_users(50)
+        seed_auctions(1000, users[:1])
+        auction = Auction.objects.filter(status='available').first()
+        for number, user in enumerate(users[1:]):
+            place_bid(auction.pk, user, 100 + number)
+            Opinion.objects.create(auction=auction, reviewer=user, rating=number % 10, comment='benchmark')
+        if args.latency:
+            add_latency(args.latency / 1000)
+        application = get_asgi_application()
+        print(f'{args.concurrency} concurrent clients, {args.requests} requests, {args.latency} ms per query, '
+              f'parallel queries: {settings.ASYNC_PARALLEL_QUERIES}')
+        pages = (
+            ('auction list', '/auctions/?page=3'),
+            ('auction details', f'/auction/{auction.pk}/?page=2'),
+            ('bid history', f'/bids/{auction.pk}'),
+            ('API auction list', '/api/auctions/?page=3'),
+        )
+        for name, url in pages:
+            for mode, prefix in (('sync', '/sync'), ('async', '')):
+                rate, p50, p95 = asyncio.run(load(application, prefix + url, args.concurrency, args.requests))
+                print(f'{name + " (" + mode + ")":<28} {rate:8.1f} requests/s   p50 {p50:8.2f} ms   p95 {p95:8.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
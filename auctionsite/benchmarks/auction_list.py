@@ -0,0 +1,66 @@
+"""Compares /auctions/ latency of the old view (which closed auctions while rendering) with the read-only view.
+
+Usage: python -m benchmarks.auction_list [--auctions 100000] [--pages 50]
+"""
+import argparse
+
+from benchmarks.utils import setup, benchmark_database, measure, report, seed_users, seed_auctions
+
+setup()
+
+from django.test import RequestFactory  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from auctions.models import Auction, Bid  # noqa: E402
+from auctions.bidding import rebuild_bid_stats  # noqa: E402
+from auctions.scheduler import close_finished_auctions  # noqa: E402
+from auctions.views import AuctionsList  # noqa: E402
+
+
+class LegacyAuctionsList(AuctionsList):
+    """Copy of the view before the scheduler was introduced"""
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        for auction in context['auctions']:
+            if auction.status == 'available':
+                if auction.end_date < timezone.now():
+                    auction.status = 'expired'
+                    auction.save()
+                if auction.end_date < timezone.now() and auction.bid_set.count() > 0:
+                    auction.status = 'sold'
+                    auction.save()
+        return context
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--auctions', type=int, default=100000)
+    parser.add_argument('--pages', type=int, default=50)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        users = seed_users(100)
+        seed_auctions(args.auctions, users, expired_ratio=0.5)
+        bids = [Bid(amount=11, auction=auction, bidder=users[1])
+                for auction in Auction.objects.filter(end_date__lt=timezone.now())[:args.auctions // 10]]
+        Bid.objects.bulk_create(bids, batch_size=1000)
+        rebuild_bid_stats()     # bulk_create skips place_bid, the scheduler reads bid_count
+        factory = RequestFactory()
+        first_finished_page = args.auctions // 2 // AuctionsList.paginate_by + 1   # Pages with auctions past their end date
+
+        def get_page(view):
+            def run(number):
+                request = factory.get('/auctions/', {'page': first_finished_page + number})
+                view(request).render()
+            return run
+
+        print(f'{args.auctions} auctions, {args.pages} pages with finished auctions')
+        report('before (status changed in the view)', measure(get_page(LegacyAuctionsList.as_view()), args.pages))
+        Auction.objects.update(status='available')
+        report('after (read-only view)', measure(get_page(AuctionsList.as_view()), args.pages))
+        report('close_auctions sweep (all auctions)', measure(lambda number: close_finished_auctions(), 1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Load test: many concurrent bidders on one hot auction.
+Reports accepted bids per second and checks that no accepted bid was lost or overwritten by a lower one,
+for the old read-modify-write code and for bidding.place_bid. Every attempt ends like a request
+(close_old_connections), so connection reuse and pooling settings are part of the result.
+Compare databases by running it with DATABASE_ENGINE=sqlite and DATABASE_ENGINE=postgresql (plus DATABASE_POOL_SIZE).
+
+Usage: python -m benchmarks.bid_load [--bidders 32] [--attempts 50]
+"""
+import argparse
+import random
+import threading
+import time
+from decimal import Decimal
+
+from benchmarks.utils import setup, benchmark_database, seed_users, seed_auctions
+
+setup()
+
+from django.db import connection, close_old_connections, OperationalError  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from auctions.bidding import place_bid, BidRejected  # noqa: E402
+from auctions.models import Auction, Bid  # noqa: E402
+
+
+def legacy_place_bid(auction_id, user, amount):
+    """Copy of BidAuction.form_valid before bidding.place_bid was introduced"""
+    auction = Auction.objects.get(id=auction_id)
+    if auction.buyer == user or auction.seller == user or auction.min_price >= amount:
+        raise BidRejected('rejected')
+    if timezone.now() + timezone.timedelta(minutes=20) > auction.end_date:
+        auction.end_date += timezone.timedelta(minutes=20)
+    auction.min_price = amount
+    auction.buyer = user
+    auction.save()
+    return Bid.objects.create(amount=amount, auction=auction, bidder=user), None
+
+
+def run(place, auction_id, bidders, attempts):
+    counters = {'accepted': 0, 'rejected': 0, 'errors': 0}
+    lock = threading.Lock()
+    start_event = threading.Event()
+
+    def bidder(user):
+        start_event.wait()
+        for _ in range(attempts):
+            price = Auction.objects.values_list('min_price', flat=True).get(pk=auction_id)
+            try:
+                place(auction_id, user, price + Decimal(random.randint(1, 5)))
+                result = 'accepted'
+            except BidRejected:
+                result = 'rejected'
+            except OperationalError:    # e.g. "database is locked"
+                result = 'errors'
+            with lock:
+                counters[result] += 1
+            close_old_connections()     # End of request
+        connection.close()
+
+    threads = [threading.Thread(target=bidder, args=(user,)) for user in bidders]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+    start_event.set()
+    for thread in threads:
+        thread.join()
+    return counters, time.perf_counter() - start
+
+
+def lost_updates(auction_id):
+    """Counts accepted bids which are not higher than an earlier accepted bid, and checks final auction state"""
+    amounts = list(Bid.objects.filter(auction_id=auction_id).order_by('id').values_list('amount', flat=True))
+    lost = sum(1 for previous, amount in zip(amounts, amounts[1:]) if amount <= previous)
+    auction = Auction.objects.get(pk=auction_id)
+    highest = Bid.objects.filter(auction_id=auction_id).order_by('-amount', '-id').first()
+    consistent = highest is None or (auction.min_price == highest.amount and auction.buyer_id == highest.bidder_id)
+    return lost, consistent
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bidders', type=int, default=32)
+    parser.add_argument('--attempts', type=int, default=50)
+    args = parser.parse_args()
+
+    with benchmark_database(file_based=True):
+        users = seed_users(args.bidders + 1)
+        seller, bidders = users[0], users[1:]
+        seed_auctions(2, [seller], expired_ratio=0)
+        print(f"{connection.vendor}, CONN_MAX_AGE {connection.settings_dict['CONN_MAX_AGE']}, "
+              f"pool size {connection.settings_dict.get('POOL_SIZE', 0)}, {args.bidders} bidders")
+        for name, place in (('old read-modify-write', legacy_place_bid), ('bidding.place_bid', place_bid)):
+            auction = Auction.objects.filter(bid__isnull=True).first()
+            counters, elapsed = run(place, auction.pk, bidders, args.attempts)
+            lost, consistent = lost_updates(auction.pk)
+            print(f"{name:<22} accepted {counters['accepted']:5d}   rejected {counters['rejected']:5d}   "
+                  f"errors {counters['errors']:4d}   {counters['accepted'] / elapsed:8.1f} accepted bids/s   "
+                  f"lost updates {lost:4d}   final state consistent: {consistent}")
+
+
+if __name__ == '__main__':
+    main()
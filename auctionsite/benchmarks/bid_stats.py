@@ -0,0 +1,58 @@
+"""Compares counting bids and finding the leading bid from the Bid table with reading the denormalized
+bid_count/highest_bid columns of Auction, on auctions with many bids.
+
+Usage: python -m benchmarks.bid_stats [--auctions 20] [--bids 10000] [--repeat 50]
+"""
+import argparse
+
+from benchmarks.utils import setup, benchmark_database, measure, report, seed_users, seed_auctions
+
+setup()
+
+from auctions.bidding import rebuild_bid_stats, inconsistent_bid_stats  # noqa: E402
+from auctions.models import Auction, Bid  # noqa: E402
+
+
+def seed_bids(auctions, bidders, count, batch_size=10000):
+    bids = []
+    for auction in auctions:
+        for number in range(count):
+            bids.append(Bid(amount=number + 1, auction=auction, bidder=bidders[number % len(bidders)]))
+            if len(bids) == batch_size:
+                Bid.objects.bulk_create(bids)
+                bids = []
+    Bid.objects.bulk_create(bids)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--auctions', type=int, default=20)
+    parser.add_argument('--bids', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        users = seed_users(50)
+        seed_auctions(args.auctions, users[:1], expired_ratio=0)
+        auction_ids = list(Auction.objects.values_list('pk', flat=True))
+        seed_bids(list(Auction.objects.all()), users[1:], args.bids)
+        print(f'{args.auctions} auctions with {args.bids} bids each')
+
+        def from_bids(number):
+            auction = Auction.objects.get(pk=auction_ids[number % len(auction_ids)])
+            auction.bid_set.count()
+            auction.bid_set.order_by('-amount', '-id').first()
+
+        def from_columns(number):
+            auction = Auction.objects.select_related('highest_bid').get(pk=auction_ids[number % len(auction_ids)])
+            auction.bid_count
+            auction.highest_bid
+
+        report('rebuild_bid_stats (all auctions)', measure(lambda number: rebuild_bid_stats(), 1))
+        report('inconsistent_bid_stats (all auctions)', measure(lambda number: inconsistent_bid_stats(), 1))
+        report('count + leading bid from Bid', measure(from_bids, args.repeat))
+        report('bid_count + highest_bid columns', measure(from_columns, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
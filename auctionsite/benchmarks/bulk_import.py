@@ -0,0 +1,72 @@
+"""Imports generated CSV catalog with auctions.bulk_import and compares it with saving rows one by one
+(what AddItem and AddAuction do for every form post). Rows are generated while they are read, so peak memory
+shows what the import itself needs.
+
+Usage: python -m benchmarks.bulk_import [--rows 1000000] [--baseline-rows 2000] [--chunk-size 10000]
+"""
+import argparse
+import resource
+import time
+from decimal import Decimal
+
+from benchmarks.utils import setup, benchmark_database, seed_users
+
+setup()
+
+from django.utils import timezone  # noqa: E402
+
+from auctions.bulk_import import import_rows, read_rows  # noqa: E402
+from auctions.models import Auction, Category, Item  # noqa: E402
+
+HEADER = 'name,item_name,item_description,category,min_price,buy_now_price,end_date\n'
+
+
+def catalog(rows, category):
+    """CSV lines of 'rows' rows, every 100th row is broken (buy now price below min price)"""
+    end_date = (timezone.now() + timezone.timedelta(days=7)).isoformat()
+    yield HEADER
+    for number in range(rows):
+        buy_now = 5 if number % 100 == 99 else 150
+        yield f'auction {number},item {number},description of item {number},{category},{10 + number % 90},{buy_now},{end_date}\n'
+
+
+def peak_memory_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def one_by_one(rows, seller, category):
+    end_date = timezone.now() + timezone.timedelta(days=7)
+    for number in range(rows):
+        item = Item.objects.create(name=f'item {number}', description='one by one', category=category, creator=seller)
+        Auction.objects.create(name=f'auction {number}', item=item, min_price=Decimal(10), buy_now_price=Decimal(150),
+                               end_date=end_date, seller=seller)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--baseline-rows', type=int, default=2000)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    with benchmark_database(file_based=True):
+        seller = seed_users(1)[0]
+        category = Category.objects.create(name='benchmark', description='benchmark')
+
+        start = time.perf_counter()
+        one_by_one(args.baseline_rows, seller, category)
+        elapsed = time.perf_counter() - start
+        print(f'{"row by row save()":<24} {args.baseline_rows:8d} rows  {args.baseline_rows / elapsed:10.1f} rows/s')
+
+        memory_before = peak_memory_mib()
+        start = time.perf_counter()
+        result = import_rows(read_rows(catalog(args.rows, category.name), 'csv'), seller,
+                             chunk_size=args.chunk_size, max_errors=10)
+        elapsed = time.perf_counter() - start
+        print(f'{"bulk import":<24} {args.rows:8d} rows  {args.rows / elapsed:10.1f} rows/s   {elapsed:8.1f} s   '
+              f'imported {result.imported}, rejected {result.failed}   '
+              f'peak memory {memory_before:.0f} MiB before, {peak_memory_mib():.0f} MiB after')
+
+
+if __name__ == '__main__':
+    main()
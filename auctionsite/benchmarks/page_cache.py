@@ -0,0 +1,59 @@
+"""Requests per second of cached pages (AuctionDetails, AuctionsList, CategoriesList, ItemDetails)
+with cold cache (cleared before every request) and warm cache, plus hit/miss counts.
+Uses the configured cache, the file-based one by default (AUCTIONS_CACHE=redis to measure Redis).
+
+Usage: python -m benchmarks.page_cache [--auctions 10000] [--requests 200]
+"""
+import argparse
+
+from benchmarks.utils import setup, benchmark_database, measure, report, seed_users, seed_auctions
+
+setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from auctions import page_cache  # noqa: E402
+from auctions.models import Auction, Category, Item, Opinion  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--auctions', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        users = seed_users(100)
+        seed_auctions(args.auctions, users, expired_ratio=0.5)
+        auction = Auction.objects.first()
+        Opinion.objects.bulk_create(
+            Opinion(auction=auction, reviewer=user, rating=5, comment='benchmark') for user in users[1:])
+        Category.objects.bulk_create(Category(name=f'category{number}', description='benchmark') for number in range(200))
+        urls = [
+            f'/auction/{auction.pk}/',
+            '/auctions/',
+            '/auctions/?status=available&page=3',
+            '/categories/',
+            f'/items/{Item.objects.first().pk}',
+        ]
+        client = Client()
+        print(f'{args.auctions} auctions, {len(urls)} URLs')
+        for url in urls:
+            def cold(number):
+                cache.clear()
+                client.get(url)
+
+            def warm(number):
+                client.get(url)
+
+            for name, function in (('cold', cold), ('warm', warm)):
+                stats = measure(function, args.requests)
+                report(f'{name} {url}', stats)
+                print(f"{'':<40} {1000 / stats['mean']:8.1f} requests/s")
+        for view, counts in page_cache.stats.summary().items():
+            print(f"{view:<20} hits {counts['hits']:6d}   misses {counts['misses']:6d}   hit ratio {counts['hit_ratio']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
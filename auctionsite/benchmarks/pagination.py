@@ -0,0 +1,72 @@
+"""Compares OFFSET pagination (django Paginator) with cursor pagination at page 1, 1000 and 10000.
+
+Usage: python -m benchmarks.pagination [--per-page 10] [--repeat 20]
+"""
+import argparse
+
+from benchmarks.utils import setup, benchmark_database, measure, report, seed_users, seed_auctions
+
+setup()
+
+from django.core.paginator import Paginator  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from auctions.models import Auction, Bid  # noqa: E402
+from auctions.pagination import KeysetPaginator, encode_cursor  # noqa: E402
+
+PAGES = (1, 1000, 10000)
+
+
+def seed_bids(count, auction, bidder, batch_size=1000):
+    start = timezone.now()
+    bids = []
+    for number in range(count):
+        bids.append(Bid(amount=number + 1, auction=auction, bidder=bidder))
+        if len(bids) == batch_size:
+            Bid.objects.bulk_create(bids)
+            bids = []
+    Bid.objects.bulk_create(bids)
+    # auto_now_add gives almost equal times, spread them so ordering by time is meaningful
+    for number, pk in enumerate(Bid.objects.order_by('id').values_list('id', flat=True).iterator()):
+        if number % batch_size == 0:
+            Bid.objects.filter(id__gte=pk, id__lt=pk + batch_size).update(time=start + timezone.timedelta(seconds=number))
+
+
+def cursor_for_page(queryset, ordering, per_page, page):
+    """Returns cursor pointing at the given page (computed once, like a client following 'next' links would have it)"""
+    if page == 1:
+        return None
+    last = queryset.order_by(*ordering)[(page - 1) * per_page - 1]
+    return encode_cursor([getattr(last, field.lstrip('-')) for field in ordering])
+
+
+def compare(name, queryset, ordering, per_page, repeat):
+    for page in PAGES:
+        def offset(number):
+            list(Paginator(queryset.order_by(*ordering), per_page).get_page(page))
+        cursor = cursor_for_page(queryset, ordering, per_page, page)
+
+        def keyset(number):
+            list(KeysetPaginator(queryset, ordering, per_page).get_page(cursor))
+        report(f'{name} page {page} OFFSET', measure(offset, repeat))
+        report(f'{name} page {page} cursor', measure(keyset, repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    rows = PAGES[-1] * args.per_page + args.per_page
+
+    with benchmark_database():
+        users = seed_users(10)
+        seed_auctions(rows, users)
+        seed_bids(rows, Auction.objects.first(), users[1])
+        print(f'{rows} auctions and bids, {args.per_page} rows per page')
+        compare('auctions', Auction.objects.all(), ('-end_date', '-id'), args.per_page, args.repeat)
+        compare('user bids', Bid.objects.filter(bidder=users[1]), ('-time', '-id'), args.per_page, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Simulates thousands of bidders fighting over one auction, each willing to pay up to its own maximum.
+Manual: bidders keep posting the lowest accepted bid (price + increment) whenever they are outbid, every post is
+a request, a Bid and an outbid notification. Proxy: every bidder sets its maximum once (auctions.bidding.place_proxy_bid)
+and the proxies settle each new maximum in one transaction. Write statements are counted on the connection.
+
+Usage: python -m benchmarks.proxy_bidding [--bidders 2000] [--max-price 2000] [--seed 1]
+"""
+import argparse
+import bisect
+import random
+import time
+from decimal import Decimal
+
+from benchmarks.utils import setup, benchmark_database, seed_users
+
+setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from auctions.bidding import place_bid, place_proxy_bid, BidRejected  # noqa: E402
+from auctions.models import Auction, Bid, Category, Item, Notification  # noqa: E402
+
+
+class WriteCounter:
+    """Execute wrapper counting INSERT, UPDATE and DELETE statements"""
+    def __init__(self):
+        self.writes = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')):
+            self.writes += 1
+        return execute(sql, params, many, context)
+
+
+def new_auction(seller, name):
+    category = Category.objects.get_or_create(name='benchmark', description='benchmark')[0]
+    item = Item.objects.create(name=name, description='benchmark', category=category, creator=seller)
+    return Auction.objects.create(name=name, item=item, min_price=Decimal(10),
+                                  end_date=timezone.now() + timezone.timedelta(days=1), seller=seller)
+
+
+def manual(auction, bidders, maximums, generator):
+    """Outbid bidders who can still afford it post price + increment until nobody can. Returns number of requests"""
+    ranked = sorted(zip(maximums, range(len(bidders))))
+    limits = [maximum for maximum, _ in ranked]
+    price, leader, requests = auction.min_price, None, 0
+    while True:
+        start = bisect.bisect_left(limits, price + settings.BID_INCREMENT)     # First bidder who can afford it
+        if start == len(ranked) or (start == len(ranked) - 1 and ranked[start][1] == leader):
+            return requests
+        while True:
+            index = ranked[generator.randrange(start, len(ranked))][1]
+            if index != leader:
+                break
+        amount = price + settings.BID_INCREMENT
+        requests += 1
+        place_bid(auction.pk, bidders[index], amount)     # Outbid bidder is notified in the same transaction
+        price, leader = amount, index
+
+
+def proxy(auction, bidders, maximums):
+    """Every bidder sets its maximum once. Returns number of requests"""
+    requests = 0
+    for bidder, maximum in zip(bidders, maximums):
+        requests += 1
+        try:
+            place_proxy_bid(auction.pk, bidder, maximum)
+        except BidRejected:     # Maximum is below the price already
+            continue
+    return requests
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bidders', type=int, default=2000)
+    parser.add_argument('--max-price', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    generator = random.Random(args.seed)
+    maximums = [Decimal(generator.randint(11, args.max_price)) for _ in range(args.bidders)]
+
+    with benchmark_database(file_based=True):
+        users = seed_users(args.bidders + 1)
+        seller, bidders = users[0], users[1:]
+        results = {}
+        for mode in ('manual', 'proxy'):
+            auction = new_auction(seller, mode)
+            notifications = Notification.objects.count()
+            counter = WriteCounter()
+            start = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                if mode == 'manual':
+                    requests = manual(auction, bidders, maximums, generator)
+                else:
+                    requests = proxy(auction, bidders, maximums)
+            elapsed = time.perf_counter() - start
+            auction.refresh_from_db()
+            results[mode] = {
+                'requests': requests,
+                'bids': Bid.objects.filter(auction=auction).count(),
+                'notifications': Notification.objects.count() - notifications,
+                'writes': counter.writes,
+            }
+            print(f'{mode:<8} {requests:8d} requests {results[mode]["bids"]:8d} bids '
+                  f'{results[mode]["notifications"]:8d} notifications {counter.writes:8d} write statements '
+                  f'{elapsed:8.2f} s   winner {auction.buyer.username} at {auction.min_price}')
+        for name in ('requests', 'bids', 'notifications', 'writes'):
+            manual_count, proxy_count = results['manual'][name], results['proxy'][name]
+            print(f'{name:<14} saved {manual_count - proxy_count:8d} ({(1 - proxy_count / max(manual_count, 1)) * 100:5.1f}%)')
+
+
+if __name__ == '__main__':
+    main()
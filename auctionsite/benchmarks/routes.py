@@ -0,0 +1,440 @@
+"""Benchmark of every route in auctionsite/urls.py on a database of realistic size: thousands of users, items and
+auctions, with bids skewed like on a real auction site (a few popular auctions and a few very active bidders get
+most of them). Every route is requested one request at a time with the Django test client, then over HTTP by
+--concurrency clients of a threaded WSGI server running in this process. For both it reports p50/p95/p99 latency,
+queries per request (counted on every connection, worker threads included) and throughput.
+
+--output saves the results as JSON, --compare checks them against a saved run and exits with status 1 when a route
+is slower by more than --threshold (and --min-difference milliseconds) or runs more queries than before.
+Compare runs made with the same arguments on the same machine. Compare databases with DATABASE_ENGINE=sqlite-tuned
+or postgresql, plain SQLite answers concurrent writes with "database is locked" (counted as 500 responses).
+
+Usage: python -m benchmarks.routes [--users 2000] [--auctions 20000] [--bids 100000] [--requests 50]
+       [--http-requests 100] [--concurrency 8] [--only /api/] [--no-http] [--no-cache]
+       [--output routes.json] [--compare baseline.json] [--threshold 0.25] [--metric p95]
+"""
+import argparse
+import base64
+import bisect
+import http.client
+import itertools
+import json
+import logging
+import platform
+import random
+import sys
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import urlencode
+
+from benchmarks.utils import setup, benchmark_database, percentiles, seed_users
+
+setup()
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler  # noqa: E402
+from django.core.wsgi import get_wsgi_application  # noqa: E402
+from django.db import connection, connections  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from django.utils.crypto import get_random_string  # noqa: E402
+
+from auctions import counters, search  # noqa: E402
+from auctions.bidding import rebuild_bid_stats  # noqa: E402
+from auctions.models import Account, Auction, Bid, Category, Item, Opinion  # noqa: E402
+from auctions.ratings import rebuild_ratings  # noqa: E402
+from auctionsite import urls  # noqa: E402
+
+PASSWORD = 'benchmark'
+WORDS = ('vintage', 'camera', 'guitar', 'bicycle', 'watch', 'lamp', 'chair', 'record', 'poster', 'phone',
+         'laptop', 'vase', 'coin', 'stamp', 'painting', 'jacket', 'antique', 'silver', 'wooden', 'retro')
+
+
+def form(values):
+    """POST body of a HTML form"""
+    return 'application/x-www-form-urlencoded', urlencode(values)
+
+
+def bid_data(objects, number):
+    return form({'amount': next(objects['amounts'])})
+
+
+def proxy_bid_data(objects, number):
+    return form({'max_amount': next(objects['amounts']) + 50})
+
+
+def import_data(objects, number):
+    end_date = (timezone.now() + timedelta(days=7)).isoformat()
+    rows = ''.join(f'imported {number}-{row},imported item,benchmark,{objects["category"]},10,,{end_date}\n'
+                   for row in range(10))
+    return 'text/csv', 'name,item_name,item_description,category,min_price,buy_now_price,end_date\n' + rows
+
+
+# pattern is the route of auctionsite/urls.py the request covers, url is formatted with the seeded objects
+# (see seed()), data(objects, request number) returns (content type, body) of POST requests.
+# user is None (anonymous), 'user' (the most active bidder), 'staff' or 'api' (staff with HTTP Basic authentication,
+# session authenticated API requests have to pass the CSRF check, which can't read a CSV body)
+Route = namedtuple('Route', 'pattern method url user data', defaults=(None, None))
+ROUTES = (
+    Route('admin/', 'GET', '/admin/', 'staff'),
+    Route('home/', 'GET', '/home/'),
+    Route('items/', 'GET', '/items/'),
+    Route('items/<uuid:pk>', 'GET', '/items/{item}'),
+    Route('auctions/', 'GET', '/auctions/'),
+    Route('auctions/', 'GET', '/auctions/?status=available&page=50'),
+    Route('auction/<uuid:pk>/', 'GET', '/auction/{hot}/'),
+    Route('add-auction/', 'GET', '/add-auction/', 'user'),
+    Route('add-item/', 'GET', '/add-item/', 'user'),
+    Route('add-opinion/<uuid:pk>', 'GET', '/add-opinion/{auction}', 'user'),
+    Route('bid-auction/<uuid:pk>', 'POST', '/bid-auction/{hot}', 'user', bid_data),
+    Route('proxy-bid/<uuid:pk>', 'POST', '/proxy-bid/{hot}', 'user', proxy_bid_data),
+    Route('search', 'GET', '/search?search=vintage+camera'),
+    Route('edit-opinion/<uuid:pk>', 'GET', '/edit-opinion/{opinion}', 'user'),
+    Route('categories/', 'GET', '/categories/'),
+    Route('category/<slug:slug>/', 'GET', '/category/{category}/'),
+    Route('user/<str:username>', 'GET', '/user/{username}'),
+    Route('edit-profile/<int:pk>', 'GET', '/edit-profile/{user_id}', 'user'),
+    Route('reset-password/<str:username>', 'GET', '/reset-password/{username}', 'user'),
+    Route('bids/<uuid:pk>', 'GET', '/bids/{hot}'),
+    Route('bids/<uuid:pk>/export', 'GET', '/bids/{hot}/export'),
+    Route('user/<str:username>/bids/export', 'GET', '/user/{username}/bids/export', 'user'),
+    Route('sales/export', 'GET', '/sales/export', 'staff'),
+    Route('delete-opinion/<uuid:pk>', 'GET', '/delete-opinion/{opinion}', 'user'),
+    Route('expired-auctions/', 'GET', '/expired-auctions/'),
+    Route('email/', 'GET', '/email/email/invalid-token'),
+    Route('buy-now/<uuid:pk>', 'GET', '/buy-now/{auction}', 'user'),
+    Route('delete-user/<int:pk>', 'GET', '/delete-user/{user_id}', 'user'),
+    Route('accounts/', 'GET', '/accounts/login/'),
+    Route('api/auctions/', 'GET', '/api/auctions/?status=available'),
+    Route('api/auctions/<int:pk>', 'GET', '/api/auctions/1'),     # Auction keys are UUIDs, always 404
+    Route('api/auctions/<uuid:pk>/bid-series/', 'GET', '/api/auctions/{hot}/bid-series/'),
+    Route('api/autocomplete/', 'GET', '/api/autocomplete/?q=vin'),
+    Route('api/import/', 'POST', '/api/import/', 'api', import_data),
+    Route('api/', 'GET', '/api/'),
+    Route('api/', 'GET', '/api/users/', 'staff'),
+    Route('api/', 'GET', '/api/users/{user_id}/', 'staff'),
+    Route('api/', 'GET', '/api/opinions/?auction={hot}'),
+    Route('api/', 'GET', '/api/items/?category={category}'),
+    Route('api/', 'GET', '/api/categories/'),
+)
+
+
+def route_name(route):
+    return f'{route.method} {route.url}'
+
+
+def uncovered_routes():
+    """Routes of auctionsite/urls.py no entry of ROUTES requests"""
+    covered = {route.pattern for route in ROUTES}
+    media = '^' + settings.MEDIA_URL.lstrip('/')    # Served by the web server, with DEBUG by static()
+    return [str(pattern.pattern) for pattern in urls.urlpatterns
+            if str(pattern.pattern) not in covered and not str(pattern.pattern).startswith(media)]
+
+
+def skewed(count, exponent=1.1):
+    """Cumulative weights of a Zipf distribution, the first of 'count' choices is the most popular"""
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+def seed(users_count, auctions_count, bids_count, generator):
+    """Fills the database and returns {name: value} of objects the routes are formatted with"""
+    now = timezone.now()
+    users = seed_users(users_count)
+    Account.objects.bulk_create((Account(user=user) for user in users), batch_size=1000)
+    staff = User.objects.create_superuser('staff', 'staff@example.com', PASSWORD)
+    categories = Category.objects.bulk_create(
+        Category(name=f'category-{number}', description='benchmark') for number in range(50))
+    items = Item.objects.bulk_create((
+        Item(name=f'{generator.choice(WORDS)} {generator.choice(WORDS)} {number}', description='benchmark',
+             category=generator.choice(categories), creator=generator.choice(users))
+        for number in range(auctions_count // 2)), batch_size=1000)
+    auctions = []
+    for number in range(auctions_count):
+        end_date = now + timedelta(minutes=generator.randint(-30 * 24 * 60, 30 * 24 * 60))
+        price = Decimal(generator.randint(1, 100))
+        auctions.append(Auction(
+            name=f'{generator.choice(WORDS)} {generator.choice(WORDS)} {number}', item=generator.choice(items),
+            min_price=price, buy_now_price=price * 5 if number % 3 == 0 else None, end_date=end_date,
+            seller=generator.choice(users), status='available' if end_date > now else 'expired'))
+    # The most popular auction (the first one) is the one the routes read and bid on, it has to be running
+    auctions[0].end_date, auctions[0].status = now + timedelta(days=7), 'available'
+    Auction.objects.bulk_create(auctions, batch_size=1000)
+
+    # Bidders are skewed too, users[0] bids the most and is the user the benchmark logs in as
+    auction_weights, user_weights = skewed(len(auctions)), skewed(len(users))
+    bid_counts = Counter(bisect.bisect_left(auction_weights, generator.random() * auction_weights[-1])
+                         for _ in range(bids_count))
+    bids = []
+    for index, count in bid_counts.items():
+        auction = auctions[index]
+        for _ in range(count):
+            bidder = users[bisect.bisect_left(user_weights, generator.random() * user_weights[-1])]
+            if bidder == auction.seller:
+                continue
+            auction.min_price += generator.randint(1, 10)
+            auction.buyer = bidder
+            bids.append(Bid(auction=auction, bidder=bidder, amount=auction.min_price))
+        if auction.status == 'expired' and auction.buyer:
+            auction.status = 'sold'
+    Bid.objects.bulk_create(bids, batch_size=5000)
+    Auction.objects.bulk_update(auctions, ['min_price', 'buyer', 'status'], batch_size=1000)
+    rebuild_bid_stats()
+
+    # Half of the buyers rate what they bought
+    Opinion.objects.bulk_create((
+        Opinion(auction=auction, reviewer=auction.buyer, rating=generator.randint(1, 10), comment='benchmark')
+        for auction in auctions if auction.status == 'sold' and generator.random() < 0.5), batch_size=1000)
+    user = users[0]
+    opinion = Opinion.objects.create(auction=auctions[1], reviewer=user, rating=7, comment='benchmark')
+    rebuild_ratings()
+    search.rebuild_index()
+    counters.reconcile()
+
+    hot = auctions[0]
+    return {
+        'hot': hot.pk,
+        'auction': next(auction.pk for auction in auctions[1:] if auction.status == 'available'),
+        'item': items[0].pk,
+        'category': categories[0].name,
+        'opinion': opinion.pk,
+        'username': user.username,
+        'user_id': user.pk,
+        'user': user,
+        'staff': staff,
+        'api': staff,
+        'bids': len(bids),
+        'hot_bids': bid_counts[0],
+        'amounts': itertools.count(int(hot.min_price) + 1000),  # Bids of the benchmark keep raising the price
+    }
+
+
+class QueryCounter:
+    """Execute wrapper counting queries of every connection, including ones opened later by other threads"""
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        for existing in connections.all():
+            self.add(existing)
+        connection_created.connect(lambda sender, connection, **kwargs: self.add(connection), weak=False)
+
+    def add(self, wrapper):
+        if self not in wrapper.execute_wrappers:
+            wrapper.execute_wrappers.append(self)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    """Threaded WSGI server (the one of runserver) on a free port, returns (host, port)"""
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=False)
+    server.set_app(get_wsgi_application())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address
+
+
+def prepare(route, objects, number):
+    """(url, content type, body) of the route's request"""
+    url = route.url.format(**objects)
+    if route.data is None:
+        return url, None, None
+    content_type, body = route.data(objects, number)
+    return url, content_type, body
+
+
+def client_request(clients, route, objects, number):
+    """Sends the request with the test client and reads the whole response, returns status code"""
+    url, content_type, body = prepare(route, objects, number)
+    client = clients[route.user]
+    if route.method == 'GET':
+        response = client.get(url)
+    else:
+        response = client.generic(route.method, url, body, content_type)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response.status_code
+
+
+def http_request(address, headers, route, objects, number):
+    """Sends the request over a new HTTP connection, returns (status code, milliseconds)"""
+    url, content_type, body = prepare(route, objects, number)
+    headers = dict(headers[route.user])
+    if content_type:
+        headers['Content-Type'] = content_type
+    start = time.perf_counter()
+    http_connection = http.client.HTTPConnection(*address, timeout=60)
+    try:
+        http_connection.request(route.method, url, body=body and body.encode(), headers=headers)
+        response = http_connection.getresponse()
+        response.read()
+    finally:
+        http_connection.close()
+    return response.status, (time.perf_counter() - start) * 1000
+
+
+def summary(latencies, statuses, queries, elapsed):
+    stats = percentiles(latencies)
+    stats.update({
+        'requests': len(latencies),
+        'throughput': len(latencies) / elapsed,
+        'queries': queries / len(latencies),
+        'statuses': dict(Counter(str(status) for status in statuses)),
+    })
+    return stats
+
+
+def run_client(clients, counter, route, objects, requests):
+    client_request(clients, route, objects, -1)     # Fills caches, the first request isn't measured
+    latencies, statuses = [], []
+    queries = counter.count
+    start = time.perf_counter()
+    for number in range(requests):
+        request_start = time.perf_counter()
+        statuses.append(client_request(clients, route, objects, number))
+        latencies.append((time.perf_counter() - request_start) * 1000)
+    return summary(latencies, statuses, counter.count - queries, time.perf_counter() - start)
+
+
+def run_http(address, headers, counter, route, objects, requests, concurrency):
+    http_request(address, headers, route, objects, -1)
+    queries = counter.count
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(lambda number: http_request(address, headers, route, objects, number),
+                                range(requests)))
+    elapsed = time.perf_counter() - start
+    return summary([latency for _, latency in results], [status for status, _ in results],
+                   counter.count - queries, elapsed)
+
+
+def logged_in(objects):
+    """Test clients and HTTP headers of every kind of user of ROUTES"""
+    csrf_token = get_random_string(32)  # Double submit: the same token in the cookie and in the header
+    credentials = base64.b64encode(f'{objects["api"].username}:{PASSWORD}'.encode()).decode()
+    clients = {'api': Client(raise_request_exception=False, HTTP_AUTHORIZATION=f'Basic {credentials}')}
+    headers = {'api': {'Host': 'testserver', 'Authorization': f'Basic {credentials}'}}
+    for role in (None, 'user', 'staff'):
+        client = Client(raise_request_exception=False)
+        cookie = f'csrftoken={csrf_token}'
+        if role:
+            client.force_login(objects[role])
+            cookie += f'; {settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+        clients[role] = client
+        headers[role] = {'Host': 'testserver', 'Cookie': cookie, 'X-CSRFToken': csrf_token}
+    return clients, headers
+
+
+def report(name, mode, stats):
+    statuses = ' '.join(f'{status}x{count}' for status, count in sorted(stats['statuses'].items()))
+    print(f"{name[:52]:<52} {mode:<6} p50 {stats['p50']:8.2f}  p95 {stats['p95']:8.2f}  p99 {stats['p99']:8.2f} ms"
+          f"  {stats['queries']:6.1f} queries  {stats['throughput']:8.1f} requests/s  {statuses}")
+
+
+def compare(baseline, results, metric='p95', threshold=0.25, min_difference=1.0):
+    """Messages about routes slower than in the baseline by more than 'threshold' (0.25 is 25%) and
+    'min_difference' milliseconds, or running more queries per request"""
+    regressions = []
+    for name, modes in results['routes'].items():
+        for mode, stats in modes.items():
+            old = baseline['routes'].get(name, {}).get(mode)
+            if old is None:
+                continue
+            if stats[metric] > old[metric] * (1 + threshold) and stats[metric] - old[metric] > min_difference:
+                regressions.append(f'{name} ({mode}): {metric} {old[metric]:.2f} ms -> {stats[metric]:.2f} ms')
+            if stats['queries'] > old['queries'] + 0.5:
+                regressions.append(f'{name} ({mode}): {old["queries"]:.1f} -> {stats["queries"]:.1f} queries per request')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--auctions', type=int, default=20000)
+    parser.add_argument('--bids', type=int, default=100000)
+    parser.add_argument('--requests', type=int, default=50, help='test client requests per route')
+    parser.add_argument('--http-requests', type=int, default=100, help='HTTP requests per route')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent HTTP clients')
+    parser.add_argument('--only', default='', help='only routes whose URL contains this text')
+    parser.add_argument('--no-http', action='store_true', help='test client only')
+    parser.add_argument('--no-cache', action='store_true', help='run with PAGE_CACHE_ENABLED = False')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='save results as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run, exit with status 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, 0.25 is 25%%')
+    parser.add_argument('--min-difference', type=float, default=1.0, help='ignore slowdowns under these ms')
+    parser.add_argument('--metric', choices=('mean', 'p50', 'p95', 'p99'), default='p95')
+    args = parser.parse_args()
+    if args.no_cache:
+        settings.PAGE_CACHE_ENABLED = False
+    # Basic authentication checks the password on every request, a slow hash would be most of its time
+    settings.PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+    for pattern in uncovered_routes():
+        print(f'Not benchmarked: {pattern}')
+
+    # Requests changing data run last, so they don't change what the other routes read
+    routes = sorted((route for route in ROUTES if args.only in route.url), key=lambda route: route.method != 'GET')
+    with benchmark_database(file_based=True):   # The HTTP server's threads need their own connections
+        start = time.perf_counter()
+        objects = seed(args.users, args.auctions, args.bids, random.Random(args.seed))
+        print(f'{args.users} users, {args.auctions} auctions, {objects["bids"]} bids '
+              f'({objects["hot_bids"]} on the most popular auction), seeded in {time.perf_counter() - start:.1f} s')
+        counter = QueryCounter()
+        counter.install()
+        clients, headers = logged_in(objects)
+        address = None if args.no_http else start_server()
+        # Failed requests are counted by status code, their tracebacks would bury the results.
+        # Set after get_wsgi_application(), which configures logging again
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        results = {
+            'meta': {
+                'date': timezone.now().isoformat(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'page_cache': settings.PAGE_CACHE_ENABLED,
+                'args': vars(args),
+            },
+            'routes': {},
+        }
+        for route in routes:
+            name = route_name(route)
+            modes = results['routes'][name] = {}
+            modes['client'] = run_client(clients, counter, route, objects, args.requests)
+            report(name, 'client', modes['client'])
+            if address:
+                modes['http'] = run_http(address, headers, counter, route, objects, args.http_requests,
+                                         args.concurrency)
+                report(name, 'http', modes['http'])
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+        print(f'Saved to {args.output}')
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), results, args.metric, args.threshold, args.min_difference)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions against {args.compare}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Compares the old icontains scan of SearchAuction with the full-text index.
+
+Usage: python -m benchmarks.search [--items 1000000] [--repeat 20]
+"""
+import argparse
+import random
+
+from benchmarks.utils import setup, benchmark_database, measure, report
+
+setup()
+
+from django.db.models import Q  # noqa: E402
+
+from auctions.models import Item, Category  # noqa: E402
+from auctions import search  # noqa: E402
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'ten', 'vo', 'su', 'pe', 'dor', 'an', 'bu', 'zi']
+
+
+def vocabulary(size):
+    random.seed(1)
+    words = set()
+    while len(words) < size:
+        words.add(''.join(random.choice(SYLLABLES) for _ in range(random.randint(2, 4))))
+    return sorted(words)
+
+
+def seed_items(count, words, batch_size=10000):
+    category = Category.objects.create(name='benchmark', description='benchmark')
+    items = []
+    for number in range(count):
+        items.append(Item(
+            name=' '.join(random.choices(words, k=3)),
+            description=' '.join(random.choices(words, k=12)),
+            category=category))
+        if len(items) == batch_size:
+            Item.objects.bulk_create(items)
+            items = []
+    Item.objects.bulk_create(items)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    words = vocabulary(5000)
+
+    with benchmark_database():
+        seed_items(args.items, words)
+        search.rebuild_index()   # bulk_create does not send signals
+        queries = random.sample(words, args.repeat)
+        print(f'{args.items} items')
+
+        def icontains(number):   # The old view rendered every match
+            query = queries[number]
+            list(Item.objects.filter(Q(name__icontains=query) | Q(name__startswith=query)))
+
+        def icontains_first_page(number):
+            query = queries[number]
+            list(Item.objects.filter(Q(name__icontains=query) | Q(name__startswith=query))[:10])
+
+        def full_text(number):
+            search.search(queries[number], 'item', page=1, per_page=10)
+
+        report('icontains scan (all results)', measure(icontains, args.repeat))
+        report('icontains scan (first 10 results)', measure(icontains_first_page, args.repeat))
+        report('full-text index (10 best results)', measure(full_text, args.repeat))
+
+
+if __name__ == '__main__':
+    main()
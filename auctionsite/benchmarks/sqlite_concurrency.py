@@ -0,0 +1,98 @@
+"""Multi-process stress test of SQLite: writer processes place bids while reader processes load auction pages.
+Reports bids and reads per second and "database is locked" errors of the configured profile.
+Compare DATABASE_ENGINE=sqlite (rollback journal, readers and writers block each other)
+with DATABASE_ENGINE=sqlite-tuned (WAL, busy timeout and BEGIN IMMEDIATE for writes).
+With --check the exit code is 1 if there were any lock errors.
+
+Usage: python -m benchmarks.sqlite_concurrency [--writers 4] [--readers 4] [--duration 10] [--check]
+"""
+import argparse
+import multiprocessing
+import random
+import sys
+import time
+from decimal import Decimal
+
+from benchmarks.utils import setup, benchmark_database, seed_users, seed_auctions
+
+setup()
+
+from django.db import connection, connections, OperationalError  # noqa: E402
+
+from auctions.bidding import place_bid, BidRejected  # noqa: E402
+from auctions.models import Auction  # noqa: E402
+
+
+def writer(auction_ids, users, deadline, results):
+    counters = {'writes': 0, 'rejected': 0, 'lock errors': 0}
+    while time.monotonic() < deadline:
+        auction_id = random.choice(auction_ids)
+        try:
+            price = Auction.objects.values_list('min_price', flat=True).get(pk=auction_id)
+            place_bid(auction_id, random.choice(users), price + Decimal(random.randint(1, 5)))
+            counters['writes'] += 1
+        except BidRejected:
+            counters['rejected'] += 1
+        except OperationalError:    # "database is locked"
+            counters['lock errors'] += 1
+    connection.close()
+    results.put(counters)
+
+
+def reader(deadline, results):
+    counters = {'reads': 0, 'lock errors': 0}
+    while time.monotonic() < deadline:
+        try:
+            list(Auction.objects.filter(status='available').select_related('item').order_by('-bid_count', '-id')[:20])
+            counters['reads'] += 1
+        except OperationalError:
+            counters['lock errors'] += 1
+    connection.close()
+    results.put(counters)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--auctions', type=int, default=1000)
+    parser.add_argument('--timeout', type=float, default=5, help='sqlite3 module lock timeout (its default is 5 seconds)')
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args()
+    connection.settings_dict['OPTIONS']['timeout'] = args.timeout
+
+    with benchmark_database(file_based=True):
+        users = seed_users(args.writers * 4 + 1)
+        seed_auctions(args.auctions, users[:1], expired_ratio=0)
+        auction_ids = list(Auction.objects.values_list('pk', flat=True))
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            journal_mode = cursor.fetchone()[0]
+        print(f"{connection.settings_dict['ENGINE']}, journal mode {journal_mode}, "
+              f"{args.writers} writers, {args.readers} readers, {args.duration} s")
+        connections.close_all()     # Every process opens its own connection
+
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        deadline = time.monotonic() + args.duration
+        processes = [context.Process(target=writer, args=(auction_ids, users[1:], deadline, results))
+                     for _ in range(args.writers)]
+        processes += [context.Process(target=reader, args=(deadline, results)) for _ in range(args.readers)]
+        for process in processes:
+            process.start()
+        totals = {'writes': 0, 'rejected': 0, 'reads': 0, 'lock errors': 0}
+        for _ in processes:
+            for name, value in results.get().items():
+                totals[name] += value
+        for process in processes:
+            process.join()
+
+    print(f"writes {totals['writes'] / args.duration:8.1f}/s   reads {totals['reads'] / args.duration:8.1f}/s   "
+          f"rejected bids {totals['rejected']:5d}   lock errors {totals['lock errors']:5d}")
+    if args.check and totals['lock errors']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
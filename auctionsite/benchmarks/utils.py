@@ -0,0 +1,97 @@
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import django
+
+
+def setup():
+    """Configures Django, has to be called before importing models"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'auctionsite.settings')
+    django.setup()
+
+
+@contextmanager
+def benchmark_database(file_based=False):
+    """Creates a throwaway test database (the same way as the test runner does) and destroys it afterwards.
+    Use file_based=True for benchmarks running many threads or processes (SQLite in-memory database is per process)"""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    if file_based and connection.vendor == 'sqlite':
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+        connection.settings_dict['OPTIONS'].setdefault('timeout', 30)
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentiles(timings):
+    """Mean, p50, p95 and p99 of latencies"""
+    timings = sorted(timings)
+    return {
+        'mean': statistics.mean(timings),
+        'p50': timings[len(timings) // 2],
+        'p95': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'p99': timings[min(len(timings) - 1, int(len(timings) * 0.99))],
+    }
+
+
+def measure(function, repeat=20):
+    """Calls function 'repeat' times and returns latency statistics in milliseconds"""
+    timings = []
+    for number in range(repeat):
+        start = time.perf_counter()
+        function(number)
+        timings.append((time.perf_counter() - start) * 1000)
+    return percentiles(timings)
+
+
+def report(name, stats):
+    print(f"{name:<40} mean {stats['mean']:8.2f} ms   p50 {stats['p50']:8.2f} ms   p95 {stats['p95']:8.2f} ms")
+
+
+def seed_users(count, prefix='user'):
+    from django.contrib.auth import get_user_model
+
+    User = get_user_model()
+    User.objects.bulk_create(
+        [User(username=f'{prefix}{number}', email=f'{prefix}{number}@example.com') for number in range(count)],
+        batch_size=1000)
+    return list(User.objects.filter(username__startswith=prefix).order_by('id'))
+
+
+def seed_auctions(count, sellers, expired_ratio=0.5, batch_size=1000):
+    """Creates 'count' available auctions, 'expired_ratio' of them with end date in the past"""
+    from django.utils import timezone
+    from auctions.models import Auction, Category, Item
+
+    category = Category.objects.create(name='benchmark', description='benchmark')
+    item = Item.objects.create(name='benchmark', description='benchmark', category=category, creator=sellers[0])
+    now = timezone.now()
+    expired = int(count * expired_ratio)
+    auctions = []
+    for number in range(count):
+        if number < expired:
+            end_date = now - timedelta(minutes=number + 1)
+        else:
+            end_date = now + timedelta(minutes=number + 1)
+        auctions.append(Auction(
+            name=f'auction {number}',
+            item=item,
+            min_price=10,
+            buy_now_price=100,
+            end_date=end_date,
+            seller=sellers[number % len(sellers)]))
+        if len(auctions) == batch_size:
+            Auction.objects.bulk_create(auctions)
+            auctions = []
+    Auction.objects.bulk_create(auctions)
+    return item
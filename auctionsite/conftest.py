@@ -1,11 +1,15 @@
 import pytest
 
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from django.core.cache import cache
 from django.test import Client
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 from auctions.models import Auction, Item, Category, Opinion, Account
+from auctions.counters import counter_cache
+from auctions.page_cache import stats
 
 
 @pytest.fixture
@@ -113,7 +117,7 @@ def one_auction():
             item=item,
             min_price=20,
             buy_now_price=100,
-            end_date=datetime.now(),
+            end_date=timezone.now() + timedelta(minutes=10),   # Still running, bids extend it
             seller=seller)
     return auction
 
@@ -139,3 +143,26 @@ def opinion():
         comment='Average auction'
     )
     return opinion
+
+
+@pytest.fixture(autouse=True)
+def clear_counter_cache():
+    """Counters cached in memory by one test must not leak into the next one (database is rolled back)"""
+    counter_cache.clear()
+    yield
+    counter_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def serial_async_queries(settings):
+    """Queries of async views have to use the connection of the test, other connections don't see its transaction"""
+    settings.ASYNC_PARALLEL_QUERIES = False
+
+
+@pytest.fixture(autouse=True)
+def clear_page_cache():
+    """Version tokens are kept in the cache, pages of rolled back objects must not be served to the next test"""
+    cache.clear()
+    stats.clear()
+    yield
+    cache.clear()
@@ -0,0 +1,17 @@
+#!/bin/sh
+# Runs the test suite on PostgreSQL. Without POSTGRES_HOST it starts a throwaway cluster (initdb and pg_ctl
+# have to be in PATH), otherwise it uses the given server, e.g. a container:
+#   docker run -d -p 5432:5432 -e POSTGRES_USER=auctionsite -e POSTGRES_PASSWORD=secret postgres:15
+#   POSTGRES_HOST=localhost POSTGRES_PASSWORD=secret ./run_tests_postgres.sh
+# Arguments are passed to pytest.
+set -e
+cd "$(dirname "$0")"
+if [ -z "$POSTGRES_HOST" ]; then
+    CLUSTER=$(mktemp -d)
+    initdb -D "$CLUSTER/data" -U auctionsite --auth=trust >/dev/null
+    pg_ctl -D "$CLUSTER/data" -l "$CLUSTER/log" -o "-k $CLUSTER -c listen_addresses=''" -w start >/dev/null
+    trap 'pg_ctl -D "$CLUSTER/data" -m immediate stop >/dev/null; rm -rf "$CLUSTER"' EXIT
+    export POSTGRES_HOST="$CLUSTER"
+fi
+export DATABASE_ENGINE=postgresql
+python -m pytest "$@"